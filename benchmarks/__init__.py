@@ -0,0 +1 @@
+"""Offline, CPU-only benchmark suite for Audio Pond."""
@@ -0,0 +1,155 @@
+"""Audio Pond benchmarks - run the suite and compare against stored baselines."""
+
+import os
+
+# Benchmarks are CPU only; hide GPUs before torch is imported
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+
+import logging
+import tempfile
+import click
+from pathlib import Path
+
+from benchmarks import generators
+from benchmarks.suite import (
+    backend_accuracy,
+    compare,
+    load_results,
+    run_benchmarks,
+    save_results,
+)
+
+DEFAULT_BASELINE = Path(__file__).parent / "baselines" / "default.json"
+
+
+@click.group()
+def main():
+    """Offline, CPU-only benchmarks for Audio Pond."""
+    logging.basicConfig(level=logging.WARNING)
+
+
+@main.command()
+@click.option("--quick", is_flag=True, help="Use smaller inputs")
+@click.option(
+    "--only",
+    multiple=True,
+    help="Run only benchmarks matching this pattern (e.g. 'midi.*'); repeatable",
+)
+@click.option("--repeats", type=int, default=5, help="Timed runs per benchmark")
+@click.option(
+    "--output",
+    type=click.Path(),
+    default="benchmark_results.json",
+    help="File to write the results to",
+)
+@click.option(
+    "--save-baseline",
+    is_flag=True,
+    help=f"Also store the results as the baseline ({DEFAULT_BASELINE.name})",
+)
+def run(
+    quick: bool, only: tuple[str, ...], repeats: int, output: str, save_baseline: bool
+):
+    """Run the benchmark suite."""
+    results = run_benchmarks(list(only) or None, quick=quick, repeats=repeats)
+    save_results(results, Path(output))
+    if save_baseline:
+        save_results(results, DEFAULT_BASELINE)
+        click.echo(f"Baseline saved to {DEFAULT_BASELINE}")
+
+
+@main.command(name="compare")
+@click.argument("results", type=click.Path(exists=True))
+@click.option(
+    "--baseline",
+    type=click.Path(exists=True),
+    default=str(DEFAULT_BASELINE),
+    help="Baseline results to compare against",
+)
+@click.option(
+    "--threshold",
+    type=float,
+    default=0.25,
+    help="Relative slowdown that counts as a regression",
+)
+def compare_command(results: str, baseline: str, threshold: float):
+    """Compare RESULTS against the baseline; exits with status 1 on regressions."""
+    regressions = compare(
+        load_results(Path(results)), load_results(Path(baseline)), threshold
+    )
+    if regressions:
+        click.echo("\nRegressions:", err=True)
+        for regression in regressions:
+            click.echo(f"  {regression}", err=True)
+        raise SystemExit(1)
+    click.echo("\nNo regressions")
+
+
+@main.command()
+@click.option(
+    "--audio",
+    type=click.Path(exists=True),
+    default=None,
+    help="Reference clip (default: 30 seconds of synthetic audio)",
+)
+@click.option(
+    "--checkpoint",
+    type=click.Path(exists=True),
+    default=None,
+    help="Model checkpoint (default: random weights, which only checks that backends run)",
+)
+@click.option(
+    "--backend",
+    "backends",
+    multiple=True,
+    type=click.Choice(["int8", "torchscript", "onnx"]),
+    help="Backend to check against fp32 eager inference; repeatable (default: all)",
+)
+@click.option("--batch-size", type=int, default=4, help="Segments per forward pass")
+@click.option(
+    "--min-f1",
+    type=float,
+    default=0.95,
+    help="Lowest acceptable note-level F1 against the fp32 notes",
+)
+def accuracy(
+    audio: str,
+    checkpoint: str,
+    backends: tuple[str, ...],
+    batch_size: int,
+    min_f1: float,
+):
+    """Check the note-level F1 and speed of inference backends against fp32 eager.
+
+    Exits with status 1 if a backend's F1 is below --min-f1.
+    """
+    backends = list(backends) or ["int8", "torchscript", "onnx"]
+    with tempfile.TemporaryDirectory(prefix="audio_pond_accuracy-") as work_dir:
+        audio_path = Path(audio) if audio else None
+        if audio_path is None:
+            audio_path = generators.make_audio(Path(work_dir) / "clip.wav", 30)
+        if checkpoint is None:
+            click.echo(
+                "Warning: random weights; F1 only shows that backends agree on noise"
+            )
+        results = backend_accuracy(audio_path, checkpoint, backends, batch_size)
+
+    failed = []
+    click.echo(
+        f"{'backend':12s} {'F1':>7s} {'notes':>7s} {'seconds':>9s} {'speedup':>8s}"
+    )
+    for backend, result in results.items():
+        speedup = result.get("speedup")
+        click.echo(
+            f"{backend:12s} {result['f1']:7.4f} {result['notes']:7d} {result['seconds']:9.3f} "
+            f"{speedup if speedup is not None else 1.0:7.2f}x"
+        )
+        if result["f1"] < min_f1:
+            failed.append(backend)
+    if failed:
+        click.echo(f"F1 below {min_f1}: {', '.join(failed)}", err=True)
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Synthetic inputs for Audio Pond benchmarks."""
+
+import random
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+from mido import Message, MetaMessage, MidiFile, MidiTrack
+
+
+def make_audio(
+    path: Path, seconds: float, sample_rate: int = 44100, seed: int = 0
+) -> Path:
+    """Write a piano-like test recording: decaying harmonic tones at random pitches.
+
+    Args:
+        path: Output audio file (format from the suffix, e.g. .wav or .flac)
+        seconds: Length of the recording
+        sample_rate: Sample rate of the file
+        seed: Random seed
+
+    Returns:
+        The output path
+    """
+    rng = np.random.default_rng(seed)
+    n = int(seconds * sample_rate)
+    audio = np.zeros(n, dtype=np.float32)
+    note_samples = int(0.5 * sample_rate)
+    t = np.arange(note_samples) / sample_rate
+    envelope = np.exp(-4.0 * t).astype(np.float32)
+
+    for start in range(0, max(0, n - note_samples), int(0.25 * sample_rate)):
+        pitch = int(rng.integers(36, 96))
+        frequency = 440.0 * 2 ** ((pitch - 69) / 12)
+        tone = sum(np.sin(2 * np.pi * frequency * k * t) / k for k in (1, 2, 3))
+        audio[start : start + note_samples] += 0.2 * envelope * tone.astype(np.float32)
+
+    audio += 0.001 * rng.standard_normal(n).astype(np.float32)
+    sf.write(str(path), audio, sample_rate)
+    return path
+
+
+def make_midi(
+    path: Path, seconds: float, notes_per_second: float = 8.0, seed: int = 0
+) -> Path:
+    """Write a MIDI file shaped like the transcriber's output (120 BPM, 384 ticks per beat).
+
+    Args:
+        path: Output MIDI file
+        seconds: Length of the piece
+        notes_per_second: Note density
+        seed: Random seed
+
+    Returns:
+        The output path
+    """
+    rng = random.Random(seed)
+    ticks_per_second = 384 * 2  # 120 BPM
+    mid = MidiFile(ticks_per_beat=384)
+
+    meta = MidiTrack()
+    meta.append(MetaMessage("set_tempo", tempo=500000, time=0))
+    meta.append(MetaMessage("time_signature", numerator=4, denominator=4, time=0))
+    meta.append(MetaMessage("end_of_track", time=1))
+    mid.tracks.append(meta)
+
+    events = []
+    silence = rng.uniform(0.5, 2.0)
+    for _ in range(int(seconds * notes_per_second)):
+        onset = silence + rng.uniform(0, seconds)
+        duration = rng.uniform(0.05, 1.5)
+        pitch = rng.randint(21, 108)
+        velocity = rng.randint(30, 110)
+        events.append((int(onset * ticks_per_second), 1, pitch, velocity))
+        events.append((int((onset + duration) * ticks_per_second), 0, pitch, 0))
+    events.sort()
+
+    track = MidiTrack()
+    previous = 0
+    for tick, _, pitch, velocity in events:
+        track.append(
+            Message("note_on", note=pitch, velocity=velocity, time=tick - previous)
+        )
+        previous = tick
+    track.append(MetaMessage("end_of_track", time=1))
+    mid.tracks.append(track)
+
+    mid.save(str(path))
+    return path
+
+
+def make_lilypond(path: Path, bars: int, seed: int = 0) -> Path:
+    """Write a two-track LilyPond file in MidiToLily's layout.
+
+    Args:
+        path: Output .ly file
+        bars: Number of bars in each track
+        seed: Random seed
+
+    Returns:
+        The output path
+    """
+    rng = random.Random(seed)
+    upper = ["c'", "d'", "e'", "fs'", "g'", "a'", "b'", "c''", "<e' g'>", "<a' c''>"]
+    lower = ["c", "d", "e", "g", "a", "b,", "g,", "<c g>", "<d a>"]
+    durations = [("4", 4), ("8", 2), ("16", 1), ("2", 8), ("4.", 6), ("8.", 3)]
+
+    def bar(notes: list[str]) -> str:
+        tokens = []
+        remaining = 16
+        while remaining:
+            name, length = rng.choice([d for d in durations if d[1] <= remaining])
+            note = "r" if rng.random() < 0.1 else rng.choice(notes)
+            tokens.append(f"{note}{name}")
+            remaining -= length
+        return " ".join(tokens) + " |"
+
+    def track(number: int, clef: str, notes: list[str]) -> str:
+        lines = [
+            f'"track{number}" = \\absolute {{',
+            "  \\key c \\major",
+            "  \\time 4/4",
+            "  \\tempo 4 = 120",
+            f'  \\clef "{clef}"',
+        ]
+        for i in range(bars):
+            if i and i % 32 == 0:
+                lines.append(f"  \\key {rng.choice(['c', 'g', 'f'])} \\major")
+            lines.append(f"  {bar(notes)}")
+        lines.extend(["  \\fine", "}"])
+        return "\n".join(lines)
+
+    content = "\n".join(
+        [
+            "% created by MidiToLily version 1.0.0.6",
+            '\\version "2.24.3"',
+            '\\language "english"',
+            track(1, "G", upper),
+            track(2, "F", lower),
+            "\\score {",
+            "  <<",
+            '    \\new Staff \\"track1"',
+            '    \\new Staff \\"track2"',
+            "  >>",
+            "  \\layout {}",
+            "  \\midi {}",
+            "}",
+        ]
+    )
+    Path(path).write_text(content)
+    return path
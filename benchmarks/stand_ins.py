@@ -0,0 +1,151 @@
+"""Stand-ins for the external tools, so end-to-end benchmarks run offline.
+
+The stand-ins measure Audio Pond's own overhead: MidiToLily is replaced by the
+native converter run as a subprocess, and lilypond/gs write small placeholder
+outputs instead of engraving. serve_media replaces the video site for streaming.
+"""
+
+import os
+import stat
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Iterator, Optional
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+_MIDI2LILY = """\
+#!{python}
+import sys
+sys.path.insert(0, {repo_root!r})
+from mido import MidiFile
+from src.processors.midi_events import EventTable
+from src.processors.native_lilypond import convert_events
+
+args = sys.argv[1:]
+if not args:
+    sys.exit(0)
+options = dict(zip(args[1::2], args[2::2]))
+table = EventTable.from_midi_file(MidiFile(args[0]))
+convert_events(table, options["-time"], options["-key"], options["-quant"], options["-output"])
+print("Stand-in MidiToLily done")
+"""
+
+_LILYPOND = """\
+#!{python}
+import os
+import sys
+
+args = sys.argv[1:]
+if args == ["--version"]:
+    print("GNU LilyPond 0.0.0 (benchmark stand-in)")
+    sys.exit(0)
+output = args[args.index("-o") + 1]
+for path in args:
+    if not path.endswith(".ly"):
+        continue
+    stem = os.path.splitext(os.path.basename(path))[0]
+    base = os.path.join(output, stem) if os.path.isdir(output) else output
+    with open(path, "rb") as f:
+        size = len(f.read())
+    image = next((a[2:] for a in args if a in ("--png", "--svg")), None)
+    if "-dcrop" in args and image:
+        with open(base + ".cropped." + image, "wb") as f:
+            f.write(b"stand-in preview of " + str(size).encode() + b" bytes")
+        continue
+    with open(base + ".pdf", "wb") as f:
+        f.write(b"%PDF-1.4\\n% stand-in for " + str(size).encode() + b" bytes\\n%%EOF\\n")
+    with open(base + ".midi", "wb") as f:
+        f.write(b"MThd")
+"""
+
+_GS = """\
+#!{python}
+import sys
+
+output = next(a.split("=", 1)[1] for a in sys.argv if a.startswith("-sOutputFile="))
+with open(output, "wb") as out:
+    for path in sys.argv[1:]:
+        if not path.startswith("-"):
+            with open(path, "rb") as f:
+                out.write(f.read())
+"""
+
+
+def install(bin_dir: Path) -> dict:
+    """Write the stand-in executables and return the environment that selects them.
+
+    Args:
+        bin_dir: Directory for the stand-in executables
+
+    Returns:
+        Environment variables to set (PATH and MIDI2LILY_PATH)
+    """
+    os.makedirs(bin_dir, exist_ok=True)
+    scripts = {"MidiToLily": _MIDI2LILY, "lilypond": _LILYPOND, "gs": _GS}
+    for name, template in scripts.items():
+        path = bin_dir / name
+        path.write_text(
+            template.format(python=sys.executable, repo_root=str(REPO_ROOT))
+        )
+        path.chmod(path.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+    return {
+        "PATH": f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}",
+        "MIDI2LILY_PATH": str(bin_dir / "MidiToLily"),
+    }
+
+
+class _ThrottledHandler(SimpleHTTPRequestHandler):
+    """Serves files at a limited rate, like a remote media server."""
+
+    bytes_per_second: Optional[float] = None
+
+    def copyfile(self, source, outputfile):
+        if not self.bytes_per_second:
+            return super().copyfile(source, outputfile)
+        chunk_size = 16 * 1024
+        start = time.perf_counter()
+        sent = 0
+        while chunk := source.read(chunk_size):
+            outputfile.write(chunk)
+            sent += len(chunk)
+            delay = sent / self.bytes_per_second - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def serve_media(
+    directory: Path, bytes_per_second: Optional[float] = None
+) -> Iterator[str]:
+    """Serve the files of a directory over local HTTP, for --stream --direct-url runs.
+
+    Args:
+        directory: Directory to serve
+        bytes_per_second: Download rate to simulate (unlimited by default)
+
+    Returns:
+        Context manager yielding the base URL of the server
+    """
+    handler = type(
+        "Handler", (_ThrottledHandler,), {"bytes_per_second": bytes_per_second}
+    )
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0), partial(handler, directory=str(directory))
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
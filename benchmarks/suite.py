@@ -0,0 +1,610 @@
+"""Benchmark definitions and runner for Audio Pond."""
+
+import fnmatch
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Optional
+
+from benchmarks import generators, stand_ins
+
+# Benchmarks by name: (setup function, modules it needs)
+BENCHMARKS = {}
+
+# Modules an entry mode should only import if it actually transcribes or downloads
+HEAVY_MODULES = ("torch", "librosa", "yt_dlp", "pydub", "piano_transcription_inference")
+
+
+def benchmark(name: str, requires: tuple[str, ...] = ()):
+    """Register a benchmark.
+
+    The decorated function receives a scratch directory and the quick flag, prepares
+    its inputs and returns the callable to time. That callable may return a dict of
+    extra values (e.g. throughput) to report with the timing.
+
+    Args:
+        name: Benchmark name (dotted, e.g. "midi.split")
+        requires: Importable modules the benchmark needs, or "bin:<name>" for
+            executables on PATH; it is skipped without them
+    """
+
+    def register(setup: Callable) -> Callable:
+        BENCHMARKS[name] = (setup, requires)
+        return setup
+
+    return register
+
+
+@contextmanager
+def _environment(values: dict):
+    """Temporarily set environment variables."""
+    previous = {name: os.environ.get(name) for name in values}
+    os.environ.update(values)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def random_checkpoint(cache_dir: Path) -> Path:
+    """Transcription checkpoint with random weights, created once and reused.
+
+    It has the real model's architecture and size, so inference cost matches the
+    real checkpoint without downloading it.
+
+    Args:
+        cache_dir: Directory to keep the checkpoint in
+
+    Returns:
+        Path to the checkpoint
+    """
+    path = cache_dir / "random_note_pedal_v2.pth"
+    if not path.exists():
+        import torch
+        from piano_transcription_inference import config
+        from piano_transcription_inference.models import Note_pedal
+
+        os.makedirs(cache_dir, exist_ok=True)
+        torch.manual_seed(0)
+        model = Note_pedal(
+            frames_per_second=config.frames_per_second, classes_num=config.classes_num
+        )
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        # The published checkpoint's layout, which Note_pedal.load_state_dict expects
+        state = {
+            "note_model": model.note_model.state_dict(),
+            "pedal_model": model.pedal_model.state_dict(),
+        }
+        torch.save({"model": state}, tmp_path)
+        os.replace(tmp_path, path)
+    return path
+
+
+def _cache_dir() -> Path:
+    return Path(
+        os.getenv(
+            "AUDIO_POND_BENCH_CACHE", Path(tempfile.gettempdir()) / "audio_pond_bench"
+        )
+    )
+
+
+@benchmark("midi.read")
+def _midi_read(work_dir: Path, quick: bool):
+    from mido import MidiFile
+    from src.processors.midi_events import EventTable
+
+    midi_path = generators.make_midi(work_dir / "in.midi", 60 if quick else 600)
+
+    def run():
+        table = EventTable.from_midi_file(MidiFile(str(midi_path)))
+        return {"events": len(table)}
+
+    return run
+
+
+@benchmark("midi.read_events")
+def _midi_read_events(work_dir: Path, quick: bool):
+    events_path = _midi_table(work_dir, quick).save(work_dir / "in.events")
+
+    def run():
+        from src.processors.midi_events import EventTable
+
+        table = EventTable.load(events_path)
+        # Touch the rows, so the timing includes paging them in
+        table.first_note_tick()
+        return {"events": len(table)}
+
+    return run
+
+
+def _midi_table(work_dir: Path, quick: bool):
+    from mido import MidiFile
+    from src.processors.midi_events import EventTable
+
+    midi_path = generators.make_midi(work_dir / "in.midi", 60 if quick else 600)
+    return EventTable.from_midi_file(MidiFile(str(midi_path)))
+
+
+@benchmark("midi.trim")
+def _midi_trim(work_dir: Path, quick: bool):
+    table = _midi_table(work_dir, quick)
+    return lambda: {"events": len(table.trimmed())}
+
+
+@benchmark("midi.tempo_adjust")
+def _midi_tempo_adjust(work_dir: Path, quick: bool):
+    table = _midi_table(work_dir, quick)
+    return lambda: {"events": len(table.scaled(94 / 120))}
+
+
+@benchmark("midi.split")
+def _midi_split(work_dir: Path, quick: bool):
+    table = _midi_table(work_dir, quick)
+    return lambda: {"events": len(table.split(60))}
+
+
+@benchmark("midi.process")
+def _midi_process(work_dir: Path, quick: bool):
+    from src.processors.midi_processor import MidiProcessor
+
+    midi_path = generators.make_midi(work_dir / "in.midi", 60 if quick else 600)
+    processor = MidiProcessor(work_dir)
+
+    def run():
+        processor.process_midi(midi_path, target_bpm=94)
+
+    return run
+
+
+@benchmark("midi.process_events")
+def _midi_process_events(work_dir: Path, quick: bool):
+    from src.processors.midi_processor import MidiProcessor
+
+    events_path = _midi_table(work_dir, quick).save(work_dir / "in.events")
+    processor = MidiProcessor(work_dir)
+
+    def run():
+        processor.process_midi(events_path, target_bpm=94)
+
+    return run
+
+
+@benchmark("lilypond.parallel_music")
+def _parallel_music(work_dir: Path, quick: bool):
+    from src.processors.lilypond_converter import LilypondConverter
+
+    bars = 200 if quick else 2000
+    ly_path = generators.make_lilypond(work_dir / "3_lilypond.ly", bars)
+    converter = LilypondConverter(work_dir)
+
+    def run():
+        converter.transform_to_parallel_music(ly_path)
+        return {"bars": bars}
+
+    return run
+
+
+@benchmark("lilypond.preview")
+def _preview(work_dir: Path, quick: bool):
+    from src.processors.lilypond_converter import LilypondConverter
+
+    bars = 200 if quick else 2000
+    ly_path = generators.make_lilypond(work_dir / "3_lilypond.ly", bars)
+    env = stand_ins.install(work_dir / "bin")
+    with _environment(env):
+        converter = LilypondConverter(work_dir)
+
+    def run():
+        with _environment(env):
+            converter.render_preview(ly_path, range(bars // 2, bars // 2 + 8))
+        return {"bars": 8}
+
+    return run
+
+
+@benchmark("audio.activity")
+def _audio_activity(work_dir: Path, quick: bool):
+    import numpy as np
+
+    from src.utils.activity import find_active_spans
+
+    sample_rate = 16000
+    rng = np.random.default_rng(0)
+    # Half silence, half noise, so both kinds of frames are analysed
+    audio = rng.standard_normal(sample_rate * (60 if quick else 600)).astype(np.float32)
+    audio[: len(audio) // 2] = 0
+
+    def run():
+        find_active_spans(audio, sample_rate)
+
+    return run
+
+
+@benchmark("lilypond.native_convert")
+def _native_convert(work_dir: Path, quick: bool):
+    from mido import MidiFile
+    from src.processors.midi_events import EventTable
+    from src.processors.native_lilypond import convert_events
+
+    midi_path = generators.make_midi(work_dir / "in.midi", 60 if quick else 600)
+    table = EventTable.from_midi_file(MidiFile(str(midi_path))).trimmed().split(60)
+
+    def run():
+        convert_events(table, "1=4/4", "1=c", "16")
+
+    return run
+
+
+_TRANSCRIPTION_MODULES = ("torch", "piano_transcription_inference", "librosa")
+
+
+def _transcription(backend: str):
+    """Benchmark transcribing synthetic audio with an inference backend."""
+
+    def setup(work_dir: Path, quick: bool):
+        from src.processors.midi_transcriber import MidiTranscriber
+
+        audio_path = generators.make_audio(work_dir / "in.wav", 20 if quick else 120)
+        transcriber = MidiTranscriber(
+            work_dir,
+            checkpoint_path=str(random_checkpoint(_cache_dir())),
+            batch_size=4,
+            backend=backend,
+        )
+
+        def run():
+            transcriber.transcribe_audio(audio_path)
+            return {
+                "audio_seconds_per_second": round(
+                    transcriber.last_throughput["audio_seconds_per_second"], 3
+                )
+            }
+
+        return run
+
+    return setup
+
+
+benchmark("transcription.cpu", requires=_TRANSCRIPTION_MODULES)(_transcription("eager"))
+benchmark("transcription.cpu.int8", requires=_TRANSCRIPTION_MODULES)(
+    _transcription("int8")
+)
+benchmark("transcription.cpu.torchscript", requires=_TRANSCRIPTION_MODULES)(
+    _transcription("torchscript")
+)
+benchmark("transcription.cpu.onnx", requires=_TRANSCRIPTION_MODULES + ("onnxruntime",))(
+    _transcription("onnx")
+)
+
+
+@benchmark("transcription.load_model", requires=_TRANSCRIPTION_MODULES)
+def _load_model(work_dir: Path, quick: bool):
+    from src.utils.checkpoint_store import CheckpointStore
+    from src.utils.model_registry import MappedPianoTranscription
+
+    store = CheckpointStore(work_dir / "checkpoints", offline=True)
+    store.seed(str(random_checkpoint(_cache_dir())))
+
+    def run():
+        MappedPianoTranscription(str(store.resolve()), device="cpu")
+
+    return run
+
+
+def backend_accuracy(
+    audio_path: Path,
+    checkpoint_path: Optional[str],
+    backends: list[str],
+    batch_size: int = 4,
+) -> dict:
+    """Compare the notes and speed of inference backends against fp32 eager inference.
+
+    Args:
+        audio_path: Reference clip
+        checkpoint_path: Model checkpoint, or None for random weights of the real size
+        backends: Backends to compare
+        batch_size: Number of segments per forward pass
+
+    Returns:
+        Per backend: note-level F1 against the eager notes, precision, recall, seconds
+        and speedup over eager
+    """
+    from src.processors.midi_transcriber import MidiTranscriber
+    from src.utils.audio_io import load_audio
+    from src.utils.note_metrics import note_f1
+
+    audio = load_audio(audio_path, MidiTranscriber.sample_rate)
+    checkpoint_path = checkpoint_path or str(random_checkpoint(_cache_dir()))
+
+    def transcribe(backend: str) -> tuple[list, float]:
+        transcriber = MidiTranscriber(
+            None,
+            checkpoint_path=checkpoint_path,
+            batch_size=batch_size,
+            backend=backend,
+        )
+        start = time.perf_counter()
+        note_events, _ = transcriber._infer(audio)
+        return note_events, time.perf_counter() - start
+
+    reference, eager_seconds = transcribe("eager")
+    results = {
+        "eager": {
+            "f1": 1.0,
+            "notes": len(reference),
+            "seconds": round(eager_seconds, 3),
+        }
+    }
+    for backend in backends:
+        if backend == "eager":
+            continue
+        notes, seconds = transcribe(backend)
+        scores = note_f1(reference, notes)
+        results[backend] = {
+            "f1": round(scores["f1"], 4),
+            "precision": round(scores["precision"], 4),
+            "recall": round(scores["recall"], 4),
+            "notes": len(notes),
+            "seconds": round(seconds, 3),
+            "speedup": round(eager_seconds / seconds, 2) if seconds else None,
+        }
+    return results
+
+
+def _pipeline(
+    work_dir: Path, config_options: dict, checkpoint_path: Optional[str] = None
+):
+    """Callable running AudioProcessor.run with the external tools replaced by stand-ins."""
+    from src.processors.audio_processor import AudioProcessor, ProcessorConfig
+
+    env = stand_ins.install(work_dir / "bin")
+    output_dir = work_dir / "output"
+
+    def run(**overrides):
+        options = {**config_options, **overrides}
+        with _environment(env):
+            processor = AudioProcessor(output_dir, checkpoint_path=checkpoint_path)
+            try:
+                processor.run(ProcessorConfig(output_dir=output_dir, **options))
+            finally:
+                processor.close()
+
+    return run
+
+
+@benchmark("pipeline.midi_file")
+def _pipeline_midi(work_dir: Path, quick: bool):
+    midi_path = generators.make_midi(work_dir / "in.midi", 60 if quick else 300)
+    return _pipeline(work_dir, {"source": str(midi_path), "midi_file": True})
+
+
+@benchmark(
+    "pipeline.audio_file",
+    requires=("torch", "piano_transcription_inference", "librosa"),
+)
+def _pipeline_audio(work_dir: Path, quick: bool):
+    audio_path = generators.make_audio(work_dir / "in.wav", 20 if quick else 120)
+    return _pipeline(
+        work_dir,
+        {"source": str(audio_path), "audio_file": True},
+        checkpoint_path=str(random_checkpoint(_cache_dir())),
+    )
+
+
+@benchmark(
+    "pipeline.stream_url",
+    requires=("torch", "piano_transcription_inference", "bin:ffmpeg"),
+)
+def _pipeline_stream(work_dir: Path, quick: bool):
+    seconds = 20 if quick else 120
+    media_dir = work_dir / "media"
+    media_dir.mkdir()
+    generators.make_audio(media_dir / "in.wav", seconds)
+    # Download at 4x real time, so transcription can overlap it
+    rate = 4 * 44100 * 2
+    run_pipeline = _pipeline(
+        work_dir, {}, checkpoint_path=str(random_checkpoint(_cache_dir()))
+    )
+
+    def run():
+        with stand_ins.serve_media(media_dir, bytes_per_second=rate) as base_url:
+            run_pipeline(
+                source=f"{base_url}/in.wav",
+                stream=True,
+                direct_url=True,
+                chunk_seconds=30.0,
+            )
+
+    return run
+
+
+# Code run in a fresh interpreter to measure the startup cost of each entry mode
+_STARTUP_CODE = """\
+import sys, tempfile
+from pathlib import Path
+import src.audio_pond
+from src.processors.audio_processor import AudioProcessor
+processor = AudioProcessor(Path(tempfile.mkdtemp()))
+{touch}
+print("heavy_modules=" + ",".join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+_STARTUP_MODES = {
+    "ly_file": "processor.lilypond_converter",
+    "midi_file": "processor.midi_processor; processor.lilypond_converter",
+    "audio_file": (
+        "processor.source_processor; processor.midi_processor; "
+        "processor.lilypond_converter; import src.processors.midi_transcriber"
+    ),
+}
+
+
+def _startup(mode: str):
+    def setup(work_dir: Path, quick: bool):
+        code = _STARTUP_CODE.format(touch=_STARTUP_MODES[mode], heavy=HEAVY_MODULES)
+        env = {**os.environ, **stand_ins.install(work_dir / "bin")}
+
+        def run():
+            result = subprocess.run(
+                [sys.executable, "-c", code],
+                cwd=stand_ins.REPO_ROOT,
+                env=env,
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            heavy = next(
+                line.split("=", 1)[1]
+                for line in result.stdout.splitlines()
+                if line.startswith("heavy_modules=")
+            )
+            return {"heavy_modules": heavy.split(",") if heavy else []}
+
+        return run
+
+    return setup
+
+
+benchmark("startup.ly_file")(_startup("ly_file"))
+benchmark("startup.midi_file")(_startup("midi_file"))
+benchmark(
+    "startup.audio_file", requires=("torch", "piano_transcription_inference", "librosa")
+)(_startup("audio_file"))
+
+
+def _missing_module(modules: tuple[str, ...]) -> Optional[str]:
+    """First of the modules (or "bin:" executables) that are missing, if any."""
+    import importlib.util
+    import shutil
+
+    for module in modules:
+        if module.startswith("bin:"):
+            if shutil.which(module[4:]) is None:
+                return module[4:]
+        elif importlib.util.find_spec(module) is None:
+            return module
+    return None
+
+
+def run_benchmarks(
+    patterns: Optional[list[str]] = None, quick: bool = False, repeats: int = 5
+) -> dict:
+    """Run the benchmarks matching any of the patterns (all by default).
+
+    Args:
+        patterns: fnmatch patterns of benchmark names, or None for all
+        quick: Use smaller inputs
+        repeats: Timed runs per benchmark (after one warm-up run)
+
+    Returns:
+        Results with environment details and, per benchmark, the median and minimum
+        seconds plus any extra values, or the reason it was skipped
+    """
+    results = {}
+    for name, (setup, requires) in BENCHMARKS.items():
+        if patterns and not any(fnmatch.fnmatch(name, p) for p in patterns):
+            continue
+
+        missing = _missing_module(requires)
+        if missing:
+            results[name] = {"skipped": f"{missing} is not installed"}
+            print(f"{name:28s} skipped ({missing} is not installed)")
+            continue
+
+        with tempfile.TemporaryDirectory(prefix="audio_pond_bench-") as work_dir:
+            run = setup(Path(work_dir), quick)
+            extra = run() or {}  # warm-up
+
+            times = []
+            for _ in range(max(1, repeats)):
+                start = time.perf_counter()
+                extra = run() or {}
+                times.append(time.perf_counter() - start)
+
+        results[name] = {
+            "seconds": round(statistics.median(times), 6),
+            "min_seconds": round(min(times), 6),
+            "repeats": len(times),
+            **extra,
+        }
+        print(f"{name:28s} {statistics.median(times) * 1000:10.2f} ms")
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "quick": quick,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float = 0.25) -> list[str]:
+    """Compare benchmark results against a baseline.
+
+    Args:
+        current: Results from run_benchmarks
+        baseline: Stored baseline results
+        threshold: Relative slowdown of the median above which a benchmark regressed
+
+    Returns:
+        Descriptions of the regressions (empty if there are none)
+    """
+    if current["meta"].get("quick") != baseline["meta"].get("quick"):
+        print("Warning: comparing quick and full benchmark runs")
+
+    regressions = []
+    print(f"{'benchmark':28s} {'baseline':>12s} {'current':>12s} {'change':>8s}")
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if not base or "seconds" not in base or "seconds" not in result:
+            continue
+
+        change = result["seconds"] / base["seconds"] - 1 if base["seconds"] else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(
+                f"{name}: {base['seconds'] * 1000:.2f} ms -> "
+                f"{result['seconds'] * 1000:.2f} ms ({change:+.0%})"
+            )
+
+        # Entry modes must not start importing heavy dependencies
+        new_heavy = set(result.get("heavy_modules", [])) - set(
+            base.get("heavy_modules", [])
+        )
+        if new_heavy:
+            flag += f"  NEW IMPORTS: {', '.join(sorted(new_heavy))}"
+            regressions.append(f"{name}: now imports {', '.join(sorted(new_heavy))}")
+
+        print(
+            f"{name:28s} {base['seconds'] * 1000:10.2f}ms {result['seconds'] * 1000:10.2f}ms "
+            f"{change:+8.0%}{flag}"
+        )
+    return regressions
+
+
+def load_results(path: Path) -> dict:
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_results(results: dict, path: Path) -> None:
+    os.makedirs(Path(path).parent, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+        f.write("\n")
@@ -20,6 +20,7 @@
             ffmpeg
             wine64
             lilypond-unstable
+            ghostscript
             python312
             wget
             fontconfig
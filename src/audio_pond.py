@@ -6,6 +6,8 @@ from pathlib import Path
 from dotenv import load_dotenv
 
 from src.processors.audio_processor import AudioProcessor, ProcessorConfig
+from src.processors.memory_budget import fit_config, parse_size, process_bytes
+from src.utils.metrics import PipelineMetrics
 
 # Load environment variables from .env file
 load_dotenv()
@@ -16,6 +18,26 @@ logging.basicConfig(
 )
 
 
+def _memory_size(ctx, param, value):
+    """Parse a memory size option such as 8G into bytes."""
+    try:
+        return parse_size(value) if value else None
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+def _bar_range(ctx, param, value):
+    """Check a bar range option such as 1-8."""
+    if value:
+        from src.processors.lilypond_converter import parse_bar_range
+
+        try:
+            parse_bar_range(value)
+        except ValueError as e:
+            raise click.BadParameter(str(e))
+    return value
+
+
 @click.command()
 @click.argument("source")
 @click.option(
@@ -52,6 +74,67 @@ logging.basicConfig(
     is_flag=True,
     help="Skip adjusting note durations to match the target tempo",
 )
+@click.option(
+    "--keep-intermediates",
+    is_flag=True,
+    help="Also write the trimmed and tempo-adjusted MIDI files (for debugging)",
+)
+@click.option(
+    "--direct-decode",
+    is_flag=True,
+    help="Decode the source straight to model-rate mono audio (1_raw_audio.npy) instead of a WAV file",
+)
+@click.option(
+    "--stream",
+    is_flag=True,
+    help="Transcribe a YouTube source while it downloads instead of downloading it first",
+)
+@click.option(
+    "--direct-url",
+    is_flag=True,
+    help="With --stream, treat the source as a media file URL and skip yt-dlp",
+)
+@click.option(
+    "--chunk-seconds",
+    type=float,
+    default=None,
+    help="Transcribe long recordings in overlapping chunks of this many seconds to bound memory use",
+)
+@click.option(
+    "--transcribe-workers",
+    type=int,
+    default=1,
+    help="Transcribe chunks in this many parallel CPU processes",
+)
+@click.option(
+    "--batch-size",
+    type=int,
+    default=1,
+    help="Number of 10 second segments per model forward pass",
+)
+@click.option(
+    "--cpu-threads",
+    type=int,
+    default=None,
+    help="Intra-op threads per transcription process (default: torch default, or cores / workers)",
+)
+@click.option(
+    "--interop-threads",
+    type=int,
+    default=None,
+    help="Inter-op threads per transcription process",
+)
+@click.option(
+    "--backend",
+    type=click.Choice(["eager", "int8", "torchscript", "onnx"]),
+    default="eager",
+    help="Transcription inference backend: fp32 eager PyTorch, dynamic int8 quantization, or a traced TorchScript/ONNX Runtime network (CPU only)",
+)
+@click.option(
+    "--skip-inactive",
+    is_flag=True,
+    help="Transcribe only the regions a fast energy/onset pre-pass finds active, skipping silence, noise and applause",
+)
 @click.option(
     "--time",
     type=str,
@@ -68,7 +151,7 @@ logging.basicConfig(
     "--quant",
     type=str,
     default="16",
-    help="Quantize note start and end times to the specified duration (1=whole, 2=half, 4=quarter, etc.)",
+    help="Quantize note start and end times to the specified duration (1=whole, 2=half, 4=quarter, etc.). The native converter supports only 1, 2, 4, 8, 16, 32, 64 and 128; dotted and tuplet values need MidiToLily",
 )
 @click.option(
     "--bpm",
@@ -76,6 +159,84 @@ logging.basicConfig(
     default=120,
     help="BPM of the piece",
 )
+@click.option(
+    "--converter",
+    type=click.Choice(["midi2lily", "native"]),
+    default="midi2lily",
+    help="MIDI to LilyPond converter: the MidiToLily executable, or the built-in converter (no wine needed)",
+)
+@click.option(
+    "--shard-bars",
+    type=int,
+    default=None,
+    help="Render long scores in sections of this many bars in parallel and join the PDFs",
+)
+@click.option(
+    "--render-workers",
+    type=int,
+    default=4,
+    help="Maximum number of parallel lilypond processes for --shard-bars",
+)
+@click.option(
+    "--section-midi",
+    is_flag=True,
+    help="With --shard-bars, also write a MIDI file for every section",
+)
+@click.option(
+    "--preview",
+    "preview_bars",
+    default=None,
+    callback=_bar_range,
+    help="Render only these bars (e.g. 1-8, or 8 for the first 8) to a single cropped image instead of the PDF, for checking --key, --time and --quant quickly",
+)
+@click.option(
+    "--preview-format",
+    type=click.Choice(["png", "svg"]),
+    default="png",
+    help="Image format of --preview",
+)
+@click.option(
+    "--workspace",
+    is_flag=True,
+    help="Run in a private workspace and publish only the deliverables, to a new directory of the output directory (linked as latest), so runs can share it",
+)
+@click.option(
+    "--keep-workspace",
+    type=click.Choice(["never", "on_failure", "always"]),
+    default="on_failure",
+    help="When to keep the workspace with the intermediate files after a --workspace run",
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(),
+    default=None,
+    envvar="AUDIO_POND_CACHE_DIR",
+    help="Directory for caching stage outputs so re-runs skip unchanged stages (e.g. transcription)",
+)
+@click.option(
+    "--cache-size",
+    type=int,
+    default=2048,
+    help="Maximum cache size in MB; least recently used entries are evicted",
+)
+@click.option(
+    "--metrics-json",
+    type=click.Path(),
+    default=None,
+    help="Write per-stage timing, memory, I/O, event counts and subprocess durations to this JSON file",
+)
+@click.option(
+    "--profile-dir",
+    type=click.Path(),
+    default=None,
+    help="Write a cProfile file (<stage>.prof) for every pipeline stage to this directory",
+)
+@click.option(
+    "--memory-budget",
+    default=None,
+    callback=_memory_size,
+    help="Memory the run may use (e.g. 4G). Runs estimated above it switch to chunked transcription; --metrics-json reports stage peaks against it",
+)
 def main(
     source: str,
     audio_file: bool,
@@ -85,14 +246,59 @@ def main(
     no_trim: bool,
     no_split: bool,
     no_tempo_adjust: bool,
+    keep_intermediates: bool,
+    direct_decode: bool,
+    stream: bool,
+    direct_url: bool,
+    chunk_seconds: float,
+    transcribe_workers: int,
+    batch_size: int,
+    cpu_threads: int,
+    interop_threads: int,
+    backend: str,
+    skip_inactive: bool,
     time: str,
     key: str,
     quant: str,
     bpm: float,
+    converter: str,
+    shard_bars: int,
+    render_workers: int,
+    section_midi: bool,
+    preview_bars: str,
+    preview_format: str,
+    workspace: bool,
+    keep_workspace: str,
+    cache_dir: str,
+    cache_size: int,
+    metrics_json: str,
+    profile_dir: str,
+    memory_budget: int,
 ):
     """Convert piano performances into sheet music."""
+    if converter == "native":
+        from src.processors.native_lilypond import parse_quant
+
+        # Fail before transcribing rather than after
+        try:
+            parse_quant(quant)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint="'--quant'")
+
     output_path = Path(output_dir)
-    processor = AudioProcessor(output_path)
+    processor = AudioProcessor(
+        output_path,
+        cache_dir=Path(cache_dir) if cache_dir else None,
+        cache_max_bytes=cache_size * 1024 * 1024,
+        transcriber_options={
+            "workers": transcribe_workers,
+            "batch_size": batch_size,
+            "cpu_threads": cpu_threads,
+            "interop_threads": interop_threads,
+            "backend": backend,
+            "skip_inactive": skip_inactive,
+        },
+    )
 
     config = ProcessorConfig(
         source=source,
@@ -103,20 +309,55 @@ def main(
         no_trim=no_trim,
         no_split=no_split,
         no_tempo_adjust=no_tempo_adjust,
+        keep_intermediates=keep_intermediates,
+        chunk_seconds=chunk_seconds,
+        direct_decode=direct_decode,
+        stream=stream,
+        direct_url=direct_url,
         time=time,
         key=key,
         quant=quant,
         bpm=bpm,
+        converter=converter,
+        shard_bars=shard_bars,
+        render_workers=render_workers,
+        section_midi=section_midi,
+        preview_bars=preview_bars,
+        preview_format=preview_format,
+        workspace=workspace,
+        keep_workspace=keep_workspace,
+    )
+
+    pipeline_metrics = PipelineMetrics(
+        profile_dir=Path(profile_dir) if profile_dir else None,
+        memory_budget_bytes=memory_budget,
     )
+    if memory_budget:
+        available = memory_budget - process_bytes(not (midi_file or ly_file))
+        config, estimate = fit_config(
+            config,
+            available,
+            available,
+            segments_per_pass=batch_size,
+            transcribe_workers=transcribe_workers,
+        )
+        pipeline_metrics.memory_estimate = estimate.to_dict()
 
     try:
-        processor.run(config)
-        click.echo(f"Sheet music has been generated in {output_dir}")
+        with pipeline_metrics.activate():
+            result_path = processor.run(config)
+        pipeline_metrics.warn_over_budget(source)
+        click.echo(f"Sheet music has been generated in {result_path.parent}")
 
     except Exception as e:
         click.echo(f"Error: {str(e)}", err=True)
         raise click.Abort()
 
+    finally:
+        processor.close()
+        if metrics_json:
+            pipeline_metrics.write_json(Path(metrics_json))
+
 
 if __name__ == "__main__":
     main()
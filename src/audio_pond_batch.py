@@ -0,0 +1,237 @@
+"""Audio Pond batch mode - convert many piano performances in one run."""
+
+import logging
+import os
+import click
+from pathlib import Path
+from dotenv import load_dotenv
+
+from src.processors.batch_processor import (
+    BatchProcessor,
+    collect_configs,
+    write_report,
+)
+from src.processors.memory_budget import parse_size
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def _memory_size(ctx, param, value):
+    """Parse a memory size option such as 8G into bytes."""
+    try:
+        return parse_size(value) if value else None
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+@click.command()
+@click.argument("sources", nargs=-1, required=True)
+@click.option(
+    "--output-dir",
+    type=click.Path(),
+    default="./output",
+    help="Root directory; each item is written to its own subdirectory",
+)
+@click.option(
+    "--workers",
+    type=int,
+    default=1,
+    help="Number of worker processes, each holding one warm transcription model",
+)
+@click.option(
+    "--checkpoint",
+    type=click.Path(),
+    default=None,
+    help="Path to the transcription model checkpoint (default: the checkpoint store's, see AUDIO_POND_CHECKPOINT_DIR)",
+)
+@click.option(
+    "--batch-size",
+    type=int,
+    default=1,
+    help="Number of 10 second segments per model forward pass",
+)
+@click.option(
+    "--cpu-threads",
+    type=int,
+    default=None,
+    help="Intra-op threads per worker (default: cores / workers)",
+)
+@click.option(
+    "--backend",
+    type=click.Choice(["eager", "int8", "torchscript", "onnx"]),
+    default="eager",
+    help="Transcription inference backend (int8/torchscript/onnx are CPU only)",
+)
+@click.option(
+    "--skip-inactive",
+    is_flag=True,
+    help="Transcribe only the active regions of every item",
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(),
+    default=None,
+    envvar="AUDIO_POND_CACHE_DIR",
+    help="Stage cache directory shared by all workers",
+)
+@click.option("--cache-size", type=int, default=2048, help="Maximum cache size in MB")
+@click.option("--no-trim", is_flag=True, help="Skip trimming silence for all items")
+@click.option("--no-split", is_flag=True, help="Skip splitting tracks for all items")
+@click.option(
+    "--no-tempo-adjust", is_flag=True, help="Skip tempo adjustment for all items"
+)
+@click.option(
+    "--direct-decode",
+    is_flag=True,
+    help="Decode sources straight to model-rate mono .npy audio",
+)
+@click.option(
+    "--stream",
+    is_flag=True,
+    help="Transcribe YouTube sources while they download",
+)
+@click.option(
+    "--chunk-seconds",
+    type=float,
+    default=None,
+    help="Transcribe in overlapping chunks of this many seconds to bound memory use",
+)
+@click.option("--time", type=str, default="1=4/4", help="Default time signatures")
+@click.option("--key", type=str, default="1=c", help="Default key signatures")
+@click.option(
+    "--quant",
+    type=str,
+    default="16",
+    help="Default quantization. The native converter supports only 1, 2, 4, 8, 16, 32, 64 and 128; dotted and tuplet values need MidiToLily",
+)
+@click.option("--bpm", type=float, default=120, help="Default BPM")
+@click.option(
+    "--converter",
+    type=click.Choice(["midi2lily", "native"]),
+    default="midi2lily",
+    help="Default MIDI to LilyPond converter",
+)
+@click.option(
+    "--workspace",
+    is_flag=True,
+    help="Run every item in a private workspace and publish only its deliverables, to a new directory of the item's output directory",
+)
+@click.option(
+    "--keep-workspace",
+    type=click.Choice(["never", "on_failure", "always"]),
+    default="on_failure",
+    help="When to keep an item's workspace with its intermediate files",
+)
+@click.option(
+    "--render-workers",
+    type=int,
+    default=None,
+    help="Render all PDFs at the end with this many lilypond processes, each taking many files",
+)
+@click.option(
+    "--memory-budget",
+    default=None,
+    callback=_memory_size,
+    help="Memory all workers together may use (e.g. 8G). Items wait until their estimated footprint fits, or switch to chunked transcription",
+)
+def main(
+    sources: tuple[str, ...],
+    output_dir: str,
+    workers: int,
+    checkpoint: str,
+    batch_size: int,
+    cpu_threads: int,
+    backend: str,
+    skip_inactive: bool,
+    cache_dir: str,
+    cache_size: int,
+    no_trim: bool,
+    no_split: bool,
+    no_tempo_adjust: bool,
+    direct_decode: bool,
+    stream: bool,
+    chunk_seconds: float,
+    time: str,
+    key: str,
+    quant: str,
+    bpm: float,
+    converter: str,
+    workspace: bool,
+    keep_workspace: str,
+    render_workers: int,
+    memory_budget: int,
+):
+    """Convert every source in SOURCES into sheet music.
+
+    Each SOURCE may be a directory, a glob pattern, a JSON Lines manifest (.jsonl)
+    or a single file/URL. Manifest lines look like
+    {"source": "a.wav", "bpm": 94, "key": "1=g"} and override the defaults per item.
+    """
+    output_root = Path(output_dir)
+    output_root.mkdir(parents=True, exist_ok=True)
+
+    defaults = {
+        "no_trim": no_trim,
+        "no_split": no_split,
+        "no_tempo_adjust": no_tempo_adjust,
+        "chunk_seconds": chunk_seconds,
+        "direct_decode": direct_decode,
+        "stream": stream,
+        "time": time,
+        "key": key,
+        "quant": quant,
+        "bpm": bpm,
+        "converter": converter,
+        "workspace": workspace,
+        "keep_workspace": keep_workspace,
+    }
+
+    try:
+        configs = collect_configs(list(sources), output_root, defaults)
+    except (ValueError, OSError) as e:
+        click.echo(f"Error: {str(e)}", err=True)
+        raise click.Abort()
+
+    if not configs:
+        click.echo("Error: no sources found", err=True)
+        raise click.Abort()
+
+    batch_processor = BatchProcessor(
+        workers=workers,
+        checkpoint_path=checkpoint,
+        cache_dir=Path(cache_dir) if cache_dir else None,
+        cache_max_bytes=cache_size * 1024 * 1024,
+        transcriber_options={
+            "batch_size": batch_size,
+            "cpu_threads": cpu_threads or max(1, (os.cpu_count() or 1) // workers),
+            "backend": backend,
+            "skip_inactive": skip_inactive,
+        },
+        render_workers=render_workers,
+        memory_budget_bytes=memory_budget,
+    )
+    results = []
+    for result in batch_processor.run(configs):
+        results.append(result)
+        status = "ok" if result.success else f"FAILED ({result.error})"
+        click.echo(f"[{len(results)}/{len(configs)}] {result.source}: {status}")
+
+    report_path = output_root / "batch_report.json"
+    write_report(results, report_path)
+
+    failed = sum(not r.success for r in results)
+    click.echo(
+        f"{len(results) - failed} succeeded, {failed} failed. Report: {report_path}"
+    )
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
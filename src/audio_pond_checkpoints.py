@@ -0,0 +1,78 @@
+"""Audio Pond checkpoints - seed and verify the transcription model checkpoint store."""
+
+import logging
+import click
+from pathlib import Path
+from dotenv import load_dotenv
+
+from src.utils.checkpoint_store import (
+    CHECKPOINT_URL,
+    DEFAULT_CHECKPOINT,
+    CheckpointStore,
+    default_store,
+)
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+@click.group()
+@click.option(
+    "--checkpoint-dir",
+    type=click.Path(),
+    default=None,
+    envvar="AUDIO_POND_CHECKPOINT_DIR",
+    help="Checkpoint store directory (default: ~/piano_transcription_inference_data)",
+)
+@click.pass_context
+def main(ctx, checkpoint_dir: str):
+    """Manage the store the transcription model checkpoint is loaded from."""
+    store = default_store()
+    if checkpoint_dir:
+        store = CheckpointStore(Path(checkpoint_dir), offline=store.offline)
+    ctx.obj = store
+
+
+@main.command()
+@click.argument("source", default=CHECKPOINT_URL)
+@click.option(
+    "--name", default=DEFAULT_CHECKPOINT, help="Name to store the checkpoint under"
+)
+@click.option("--sha256", default=None, help="Expected sha256 digest of the source")
+@click.pass_obj
+def seed(store: CheckpointStore, source: str, name: str, sha256: str):
+    """Copy or download a checkpoint into the store and record its digest.
+
+    SOURCE is a checkpoint file or URL (default: the published checkpoint).
+    """
+    try:
+        path = store.seed(source, name, sha256)
+    except (OSError, RuntimeError) as e:
+        raise click.ClickException(str(e))
+    click.echo(f"{path}: {store.manifest()[name]['sha256']}")
+
+
+@main.command()
+@click.argument("names", nargs=-1)
+@click.pass_obj
+def verify(store: CheckpointStore, names: tuple[str, ...]):
+    """Check checkpoints against their recorded digests (default: all recorded ones)."""
+    failed = 0
+    for name in names or sorted(store.manifest()):
+        try:
+            store.verify(name)
+            click.echo(f"{name}: ok")
+        except RuntimeError as e:
+            click.echo(f"{name}: {e}")
+            failed += 1
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+"""Audio Pond server - a local HTTP job service around the processing pipeline."""
+
+import json
+import logging
+import mimetypes
+import os
+import click
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+from dotenv import load_dotenv
+
+from src.processors.job_service import (
+    DEFAULT_STAGE_LIMITS,
+    JobService,
+    QueueFullError,
+)
+from src.processors.memory_budget import parse_size
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def _memory_size(ctx, param, value):
+    """Parse a memory size option such as 8G into bytes."""
+    try:
+        return parse_size(value) if value else None
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+# Largest accepted job submission body
+MAX_REQUEST_BYTES = 1024 * 1024
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """HTTP endpoints of the job service.
+
+    POST /jobs              submit a job: {"source": ..., <config overrides>}
+    GET  /jobs/<id>         job status
+    GET  /jobs/<id>/result  the job's sheet music (or LilyPond file with "render": false)
+    GET  /health            job counts per status and memory budget use
+    """
+
+    service: JobService = None
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/jobs":
+            return self._send_error(HTTPStatus.NOT_FOUND, "Not found")
+
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_REQUEST_BYTES:
+            return self._send_error(
+                HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request too large"
+            )
+        try:
+            entry = json.loads(self.rfile.read(length) or b"null")
+            job = self.service.submit(entry)
+        except (ValueError, TypeError) as e:
+            return self._send_error(HTTPStatus.BAD_REQUEST, str(e))
+        except QueueFullError as e:
+            return self._send_error(
+                HTTPStatus.TOO_MANY_REQUESTS, str(e), {"Retry-After": "5"}
+            )
+        self._send_json(
+            HTTPStatus.ACCEPTED, job.to_dict(), {"Location": f"/jobs/{job.id}"}
+        )
+
+    def do_GET(self):
+        parts = [part for part in self.path.split("?")[0].split("/") if part]
+        if parts == ["health"]:
+            return self._send_json(
+                HTTPStatus.OK, {"status": "ok", **self.service.stats()}
+            )
+        if (
+            len(parts) not in (2, 3)
+            or parts[0] != "jobs"
+            or parts[2:] not in ([], ["result"])
+        ):
+            return self._send_error(HTTPStatus.NOT_FOUND, "Not found")
+
+        job = self.service.get(parts[1])
+        if job is None:
+            return self._send_error(HTTPStatus.NOT_FOUND, f"Unknown job: {parts[1]}")
+        if len(parts) == 2:
+            return self._send_json(HTTPStatus.OK, job.to_dict())
+
+        if job.status != "done":
+            return self._send_error(
+                HTTPStatus.CONFLICT, f"Job is {job.status}", job=job.to_dict()
+            )
+        self._send_file(job.result_path)
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} - {format % args}")
+
+    def _send_json(
+        self, status: HTTPStatus, body: dict, headers: Optional[dict] = None
+    ):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(
+        self, status: HTTPStatus, message: str, headers: Optional[dict] = None, **fields
+    ):
+        self._send_json(status, {"error": message, **fields}, headers)
+
+    def _send_file(self, path: Path):
+        content_type = mimetypes.guess_type(str(path))[0] or "application/octet-stream"
+        size = os.path.getsize(path)
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(size))
+        self.send_header("Content-Disposition", f'attachment; filename="{path.name}"')
+        self.end_headers()
+        with open(path, "rb") as f:
+            while chunk := f.read(1024 * 1024):
+                self.wfile.write(chunk)
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", help="Address to listen on")
+@click.option("--port", type=int, default=8765, help="Port to listen on")
+@click.option(
+    "--output-dir",
+    type=click.Path(),
+    default="./output",
+    help="Root directory; each job is written to its own subdirectory",
+)
+@click.option(
+    "--input-dir",
+    type=click.Path(exists=True, file_okay=False),
+    default=None,
+    help="Directory whose files jobs may name as sources (relative to it); without it only http(s) URLs are accepted",
+)
+@click.option("--workers", type=int, default=4, help="Number of jobs running at once")
+@click.option(
+    "--queue-size",
+    type=int,
+    default=32,
+    help="Number of jobs that may wait before submissions are refused (HTTP 429)",
+)
+@click.option(
+    "--transcription-limit",
+    type=int,
+    default=DEFAULT_STAGE_LIMITS["transcription"],
+    help="Jobs transcribing at once (their model passes are batched together)",
+)
+@click.option(
+    "--midi2lily-limit",
+    type=int,
+    default=DEFAULT_STAGE_LIMITS["midi_to_lilypond"],
+    help="Jobs converting MIDI to LilyPond at once",
+)
+@click.option(
+    "--render-limit",
+    type=int,
+    default=DEFAULT_STAGE_LIMITS["render"],
+    help="Jobs running LilyPond at once",
+)
+@click.option(
+    "--checkpoint",
+    type=click.Path(),
+    default=None,
+    help="Path to the transcription model checkpoint (default: the checkpoint store's, see AUDIO_POND_CHECKPOINT_DIR)",
+)
+@click.option(
+    "--batch-size",
+    type=int,
+    default=8,
+    help="Number of 10 second segments, from any jobs, per model forward pass",
+)
+@click.option(
+    "--batch-wait",
+    type=float,
+    default=0.05,
+    help="Seconds a model pass that is not full waits for segments of other jobs",
+)
+@click.option(
+    "--cpu-threads", type=int, default=None, help="Intra-op threads of the shared model"
+)
+@click.option(
+    "--backend",
+    type=click.Choice(["eager", "int8", "torchscript", "onnx"]),
+    default="eager",
+    help="Inference backend of the shared model (int8/torchscript/onnx are CPU only)",
+)
+@click.option(
+    "--skip-inactive",
+    is_flag=True,
+    help="Transcribe only the active regions of every job",
+)
+@click.option(
+    "--lazy-model",
+    is_flag=True,
+    help="Load the transcription model on the first job that needs it instead of at startup",
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(),
+    default=None,
+    envvar="AUDIO_POND_CACHE_DIR",
+    help="Stage cache directory shared by all jobs",
+)
+@click.option("--cache-size", type=int, default=2048, help="Maximum cache size in MB")
+@click.option(
+    "--keep-workspace",
+    type=click.Choice(["never", "on_failure", "always"]),
+    default="on_failure",
+    help="When to keep a job's workspace with its intermediate files",
+)
+@click.option(
+    "--result-ttl",
+    type=float,
+    default=None,
+    help="Delete a job's results this many hours after it finished (default: keep)",
+)
+@click.option(
+    "--converter",
+    type=click.Choice(["midi2lily", "native"]),
+    default="midi2lily",
+    help="Default MIDI to LilyPond converter",
+)
+@click.option(
+    "--memory-budget",
+    default=None,
+    callback=_memory_size,
+    help="Memory the server may use (e.g. 16G). Jobs wait until their estimated footprint fits, or switch to chunked transcription",
+)
+def main(
+    host: str,
+    port: int,
+    output_dir: str,
+    input_dir: str,
+    workers: int,
+    queue_size: int,
+    transcription_limit: int,
+    midi2lily_limit: int,
+    render_limit: int,
+    checkpoint: str,
+    batch_size: int,
+    batch_wait: float,
+    cpu_threads: int,
+    backend: str,
+    skip_inactive: bool,
+    lazy_model: bool,
+    cache_dir: str,
+    cache_size: int,
+    keep_workspace: str,
+    result_ttl: float,
+    converter: str,
+    memory_budget: int,
+):
+    """Serve Audio Pond jobs over HTTP from one warm process."""
+    service = JobService(
+        Path(output_dir),
+        input_root=Path(input_dir) if input_dir else None,
+        workers=workers,
+        queue_size=queue_size,
+        stage_limits={
+            "transcription": transcription_limit,
+            "midi_to_lilypond": midi2lily_limit,
+            "render": render_limit,
+        },
+        defaults={
+            "converter": converter,
+            "workspace": True,
+            "keep_workspace": keep_workspace,
+        },
+        checkpoint_path=checkpoint,
+        cache_dir=Path(cache_dir) if cache_dir else None,
+        cache_max_bytes=cache_size * 1024 * 1024,
+        transcriber_options={
+            "batch_size": batch_size,
+            "cpu_threads": cpu_threads,
+            "backend": backend,
+            "skip_inactive": skip_inactive,
+        },
+        batch_wait_seconds=batch_wait,
+        preload_model=not lazy_model,
+        result_ttl_seconds=result_ttl * 3600 if result_ttl is not None else None,
+        memory_budget_bytes=memory_budget,
+    )
+    service.start()
+
+    JobRequestHandler.service = service
+    server = ThreadingHTTPServer((host, port), JobRequestHandler)
+    logging.info(f"Serving Audio Pond jobs on http://{host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
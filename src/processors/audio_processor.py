@@ -1,13 +1,22 @@
 """Main audio processor for Audio Pond."""
 
 import os
+import logging
+import threading
+from contextlib import nullcontext
 from pathlib import Path
 from dataclasses import dataclass
+from typing import Callable, Optional, Union
 
-from src.processors.source_processor import SourceProcessor
-from src.processors.midi_transcriber import MidiTranscriber
-from src.processors.midi_processor import MidiProcessor
-from src.processors.lilypond_converter import LilypondConverter
+from src.utils import metrics
+from src.utils.stage_cache import StageCache, DEFAULT_MAX_BYTES
+from src.utils.workspace import Workspace, sweep_workspaces
+
+# Sample rate the transcription model expects (piano_transcription_inference.sample_rate)
+MODEL_SAMPLE_RATE = 16000
+
+# Stage processors are imported when first used, so entry modes that skip a stage
+# (e.g. --ly-file skipping torch, librosa and yt_dlp) do not pay for its imports.
 
 
 @dataclass
@@ -26,70 +35,368 @@ class ProcessorConfig:
     key: str = "1=c"
     quant: str = "16"
     bpm: float = 120
+    keep_intermediates: bool = False
+    chunk_seconds: Optional[float] = None
+    direct_decode: bool = False
+    stream: bool = False
+    direct_url: bool = False
+    converter: str = "midi2lily"
+    render: bool = True
+    shard_bars: Optional[int] = None
+    render_workers: int = 4
+    section_midi: bool = False
+    preview_bars: Optional[str] = None
+    preview_format: str = "png"
+    workspace: bool = False
+    keep_workspace: str = "on_failure"
 
 
 class AudioProcessor:
     """Main processor that coordinates the audio processing pipeline."""
 
-    def __init__(self, output_dir: Path):
+    def __init__(
+        self,
+        output_dir: Path,
+        checkpoint_path: Optional[str] = None,
+        cache_dir: Optional[Path] = None,
+        cache_max_bytes: int = DEFAULT_MAX_BYTES,
+        transcriber_options: Optional[dict] = None,
+        stage_gates: Optional[dict[str, threading.Semaphore]] = None,
+        safe_lilypond: bool = False,
+    ):
         """Initialize the audio processor.
 
         Args:
             output_dir: Directory for output files
+            checkpoint_path: Path to the transcription model checkpoint, or None for the default
+            cache_dir: Directory for the stage artifact cache, or None to disable caching
+            cache_max_bytes: Size cap of the stage artifact cache
+            transcriber_options: Extra MidiTranscriber arguments (batch_size, workers,
+                cpu_threads, interop_threads, batcher, backend, skip_inactive)
+            stage_gates: Semaphores keyed by stage name ('transcription',
+                'midi_to_lilypond', 'render') limiting how many processors sharing them
+                run that stage at once; cache hits are not limited
+            safe_lilypond: Render with LilyPond's safe mode, for LilyPond files
+                supplied by untrusted clients
         """
         os.makedirs(output_dir, exist_ok=True)
 
-        self.source_processor = SourceProcessor(output_dir)
-        self.midi_transcriber = MidiTranscriber(output_dir)
-        self.midi_processor = MidiProcessor(output_dir)
-        self.lilypond_converter = LilypondConverter(output_dir)
+        self.output_dir = output_dir
+        self.checkpoint_path = checkpoint_path
+        self.cache = StageCache(cache_dir, cache_max_bytes) if cache_dir else None
+        self.transcriber_options = transcriber_options or {}
+        self.stage_gates = stage_gates or {}
+        self.safe_lilypond = safe_lilypond
+
+        self._source_processor = None
+        self._midi_transcriber = None
+        self._midi_processor = None
+        self._lilypond_converter = None
+
+    @property
+    def source_processor(self):
+        """Source processor, created on first use."""
+        if self._source_processor is None:
+            from src.processors.source_processor import SourceProcessor
+
+            self._source_processor = SourceProcessor(self.output_dir)
+        return self._source_processor
+
+    @property
+    def midi_transcriber(self):
+        """MIDI transcriber, created (with its GPU check and model load) on first use."""
+        if self._midi_transcriber is None:
+            from src.processors.midi_transcriber import MidiTranscriber
+
+            self._midi_transcriber = MidiTranscriber(
+                self.output_dir,
+                checkpoint_path=self.checkpoint_path,
+                **self.transcriber_options,
+            )
+        return self._midi_transcriber
+
+    @property
+    def midi_processor(self):
+        """MIDI processor, created on first use."""
+        if self._midi_processor is None:
+            from src.processors.midi_processor import MidiProcessor
+
+            self._midi_processor = MidiProcessor(self.output_dir)
+        return self._midi_processor
+
+    @property
+    def lilypond_converter(self):
+        """LilyPond converter, created on first use."""
+        if self._lilypond_converter is None:
+            from src.processors.lilypond_converter import LilypondConverter
+
+            self._lilypond_converter = LilypondConverter(
+                self.output_dir, cache=self.cache, safe=self.safe_lilypond
+            )
+        return self._lilypond_converter
+
+    def close(self, shared: bool = True) -> None:
+        """Release resources held across runs, such as transcription worker processes.
+
+        Args:
+            shared: Also release the warm MidiToLily runner, which is shared by every
+                processor in the process; pass False while other processors in the
+                process keep running
+        """
+        if self._midi_transcriber is not None:
+            self._midi_transcriber.close()
+        if shared and self._lilypond_converter is not None:
+            self._lilypond_converter.close()
+
+    def _set_output_dir(self, output_dir: Path) -> None:
+        """Point this processor and the stage processors created so far at a directory."""
+        self.output_dir = output_dir
+        for processor in (
+            self._source_processor,
+            self._midi_transcriber,
+            self._midi_processor,
+            self._lilypond_converter,
+        ):
+            if processor is not None:
+                processor.output_dir = output_dir
+
+    def _gate(self, stage: str):
+        """Context manager holding the concurrency limit of a stage, if it has one."""
+        gate = self.stage_gates.get(stage)
+        return gate if gate is not None else nullcontext()
+
+    def _run_stage(
+        self,
+        stage: str,
+        inputs: list[Union[Path, str]],
+        params: dict,
+        run: Callable[[], Path],
+    ) -> Path:
+        """Run a pipeline stage, reusing a cached artifact when its inputs are unchanged.
+
+        Args:
+            stage: Stage name
+            inputs: Input files or strings the stage output depends on
+            params: Configuration values the stage output depends on
+            run: Callable running the stage and returning its output path
+
+        Returns:
+            Path to the stage output
+        """
+        with metrics.stage(stage):
+            if self.cache is None:
+                with self._gate(stage):
+                    return run()
+
+            key = self.cache.key(stage, inputs, params)
+            cached = self.cache.fetch(key, self.output_dir)
+            if cached:
+                logging.info(f"Reusing cached {stage} output")
+                metrics.count("cache_hits")
+                return cached[0]
+
+            with self._gate(stage):
+                output_path = run()
+            self.cache.store(key, [output_path])
+            return output_path
 
     def run(self, config: ProcessorConfig) -> Path:
         """Run the complete audio processing pipeline based on the provided configuration.
 
+        With config.workspace set, the run writes to a private workspace and only
+        publishes its deliverables (final MIDI, LilyPond files and sheet music, or
+        every file with config.keep_intermediates) to a new directory of its own in
+        the output directory, so several runs can share one output directory.
+
         Args:
             config: Configuration parameters for the processing pipeline
 
         Returns:
-            Path to the generated sheet music
+            Path to the generated sheet music (a preview image of some bars with
+            config.preview_bars), or to the parallelMusic LilyPond file when
+            config.render is False
 
         Raises:
             Exception: If any step in the pipeline fails
         """
+        if not config.workspace:
+            return self._run(config)["result"]
+
+        output_dir = self.output_dir
+        sweep_workspaces(output_dir)
+        with Workspace(output_dir, config.keep_workspace) as workspace:
+            self._set_output_dir(workspace.path)
+            try:
+                artifacts = self._run(config)
+            finally:
+                self._set_output_dir(output_dir)
+
+            if config.keep_intermediates:
+                deliverables = sorted(workspace.path.iterdir())
+            else:
+                deliverables = [
+                    path
+                    for path in sorted(workspace.path.iterdir())
+                    if path.name.startswith("4_sheet_music")
+                    or path in artifacts.values()
+                ]
+            with metrics.stage("publish"):
+                workspace.publish(deliverables)
+
+        result = artifacts["result"]
+        if result.is_relative_to(workspace.path):
+            return workspace.run_dir / result.relative_to(workspace.path)
+        return result
+
+    def _run(self, config: ProcessorConfig) -> dict[str, Path]:
+        """Run the pipeline stages in the current output directory.
+
+        Returns:
+            Paths of the stage artifacts ('midi', 'ly', 'parallel_ly') and of the
+            run's 'result'
+        """
+        midi_path = None
         if config.ly_file:
             ly_path = Path(config.source)
         elif config.midi_file:
             midi_path = Path(config.source)
         else:
+            # Decode straight to model-rate .npy audio instead of a full-rate WAV
+            decode_rate = MODEL_SAMPLE_RATE if config.direct_decode else None
             if config.audio_file:
-                audio_path = self.source_processor.process_audio_file(
-                    Path(config.source)
+                audio_path = self._run_stage(
+                    "source",
+                    [Path(config.source)],
+                    {"sample_rate": decode_rate},
+                    lambda: (
+                        self.source_processor.decode_audio(
+                            Path(config.source), decode_rate
+                        )
+                        if decode_rate
+                        else self.source_processor.process_audio_file(
+                            Path(config.source)
+                        )
+                    ),
+                )
+            elif not config.stream:
+                audio_path = self._run_stage(
+                    "source",
+                    [config.source],
+                    {"sample_rate": decode_rate},
+                    lambda: self.source_processor.process_youtube(
+                        config.source, sample_rate=decode_rate
+                    ),
                 )
-            else:
-                audio_path = self.source_processor.process_youtube(config.source)
 
-            midi_path = self.midi_transcriber.transcribe_audio(audio_path)
+            transcription_params = {
+                "checkpoint": self.checkpoint_path,
+                "chunk_seconds": config.chunk_seconds,
+                "backend": self.transcriber_options.get("backend", "eager"),
+                "skip_inactive": self.transcriber_options.get("skip_inactive", False),
+            }
+            if config.stream and not config.audio_file:
+                # Download, decoding and transcription overlap, so the stage is
+                # keyed by the URL rather than by the downloaded audio
+                midi_path = self._run_stage(
+                    "transcription",
+                    [config.source],
+                    {**transcription_params, "stream": True},
+                    lambda: self.midi_transcriber.transcribe_stream(
+                        self.source_processor.stream_audio(
+                            config.source, MODEL_SAMPLE_RATE, direct=config.direct_url
+                        ),
+                        chunk_seconds=config.chunk_seconds,
+                    ),
+                )
+            else:
+                midi_path = self._run_stage(
+                    "transcription",
+                    [audio_path],
+                    transcription_params,
+                    lambda: self.midi_transcriber.transcribe_audio(
+                        audio_path, chunk_seconds=config.chunk_seconds
+                    ),
+                )
 
         if not config.ly_file:
-            if not config.no_trim:
-                midi_path = self.midi_processor.trim_midi_silence(midi_path)
+            from src.processors.midi_events import is_event_file
 
-            if not config.no_tempo_adjust:
-                midi_path = self.midi_processor.adjust_note_durations(
-                    midi_path, config.bpm
+            target_bpm = None if config.no_tempo_adjust else config.bpm
+            # Transcriptions are event files, which the converters need as MIDI
+            if is_event_file(midi_path) or not (
+                config.no_trim and config.no_split and target_bpm is None
+            ):
+                midi_path = self._run_stage(
+                    "midi_processing",
+                    [midi_path],
+                    {
+                        "trim": not config.no_trim,
+                        "bpm": target_bpm,
+                        "split": not config.no_split,
+                    },
+                    lambda: self.midi_processor.process_midi(
+                        midi_path,
+                        trim=not config.no_trim,
+                        target_bpm=target_bpm,
+                        split=not config.no_split,
+                        keep_intermediates=config.keep_intermediates,
+                    ),
                 )
 
-            if not config.no_split:
-                midi_path = self.midi_processor.split_midi_tracks(midi_path)
+            ly_path = self._run_stage(
+                "midi_to_lilypond",
+                [midi_path],
+                {
+                    "time": config.time,
+                    "key": config.key,
+                    "quant": config.quant,
+                    "converter": (
+                        config.converter
+                        if config.converter == "native"
+                        else self.lilypond_converter.midi2lily_exe
+                    ),
+                },
+                lambda: self.lilypond_converter.midi_to_lilypond(
+                    midi_path,
+                    time=config.time,
+                    key=config.key,
+                    quant=config.quant,
+                    converter=config.converter,
+                ),
+            )
 
-            ly_path = self.lilypond_converter.midi_to_lilypond(
-                midi_path, time=config.time, key=config.key, quant=config.quant
+        # A source .ly file may include files from its own directory
+        self.lilypond_converter.include_dirs = (
+            [ly_path.parent.absolute()] if config.ly_file else []
+        )
+        with metrics.stage("parallel_music"):
+            parallel_ly_path = self.lilypond_converter.transform_to_parallel_music(
+                ly_path
             )
+        artifacts = {"midi": midi_path, "ly": ly_path, "parallel_ly": parallel_ly_path}
+        if not config.render:
+            return {**artifacts, "result": parallel_ly_path}
 
-        ly_path = self.lilypond_converter.transform_to_parallel_music(ly_path)
         # absolute path needed in docker container
-        sheet_music_path = self.lilypond_converter.render_sheet_music(
-            ly_path.absolute()
-        )
+        with metrics.stage("render"), self._gate("render"):
+            if config.preview_bars:
+                from src.processors.lilypond_converter import parse_bar_range
+
+                sheet_music_path = self.lilypond_converter.render_preview(
+                    ly_path.absolute(),
+                    parse_bar_range(config.preview_bars),
+                    image_format=config.preview_format,
+                )
+            elif config.shard_bars:
+                sheet_music_path = self.lilypond_converter.render_sharded(
+                    ly_path.absolute(),
+                    config.shard_bars,
+                    workers=config.render_workers,
+                    section_midi=config.section_midi,
+                )
+            else:
+                sheet_music_path = self.lilypond_converter.render_sheet_music(
+                    parallel_ly_path.absolute()
+                )
 
-        return sheet_music_path
+        return {**artifacts, "result": sheet_music_path}
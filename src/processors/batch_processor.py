@@ -0,0 +1,447 @@
+"""Batch processor for Audio Pond."""
+
+import glob
+import json
+import logging
+import multiprocessing
+import multiprocessing.util
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, fields, replace
+from pathlib import Path
+from typing import Iterator, Optional
+
+from src.processors.audio_processor import AudioProcessor, ProcessorConfig
+from src.processors.memory_budget import MemoryBudget, fit_config, process_bytes
+from src.processors.midi2lily_runner import close_runners
+from src.utils.metrics import PipelineMetrics
+from src.utils.stage_cache import DEFAULT_MAX_BYTES
+
+AUDIO_EXTENSIONS = {".wav", ".mp3", ".flac", ".ogg", ".m4a", ".aac", ".opus", ".webm"}
+MIDI_EXTENSIONS = {".mid", ".midi", ".events"}
+LY_EXTENSIONS = {".ly"}
+
+# Fields a manifest entry may not override (they are derived per item)
+_RESERVED_FIELDS = {"source", "output_dir"}
+
+
+@dataclass
+class BatchResult:
+    """Outcome of a single batch item."""
+
+    source: str
+    output_dir: Path
+    success: bool
+    sheet_music_path: Optional[Path] = None
+    error: Optional[str] = None
+    seconds: float = 0.0
+    metrics: Optional[dict] = None
+
+
+def _source_type_flags(source: str) -> dict:
+    """Pick the input mode flags for a source based on its location and extension."""
+    if source.startswith(("http://", "https://")):
+        return {}
+    suffix = Path(source).suffix.lower()
+    if suffix in MIDI_EXTENSIONS:
+        return {"midi_file": True}
+    if suffix in LY_EXTENSIONS:
+        return {"ly_file": True}
+    return {"audio_file": True}
+
+
+def _read_manifest(manifest_path: Path) -> Iterator[dict]:
+    """Read a JSON Lines manifest where each line holds a source and optional config overrides."""
+    with open(manifest_path, "r") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            entry = json.loads(line)
+            if "source" not in entry:
+                raise ValueError(
+                    f"Manifest entry on line {line_number} has no 'source': {manifest_path}"
+                )
+            # Relative paths are resolved against the manifest location
+            source = entry["source"]
+            if (
+                not source.startswith(("http://", "https://"))
+                and not Path(source).is_absolute()
+            ):
+                entry["source"] = str(manifest_path.parent / source)
+            yield entry
+
+
+def config_from_entry(entry: dict, output_dir: Path, defaults: dict) -> ProcessorConfig:
+    """Build the configuration of one item from a source and its config overrides.
+
+    Args:
+        entry: Dict with a 'source' and optional ProcessorConfig field overrides
+        output_dir: Output directory of the item
+        defaults: ProcessorConfig field values used where the entry has no override
+
+    Returns:
+        The item configuration, with input mode flags picked from the source
+
+    Raises:
+        ValueError: If the entry has no source or overrides unknown fields
+    """
+    source = entry.get("source")
+    if not isinstance(source, str) or not source:
+        raise ValueError("Entry has no 'source'")
+    unknown = set(entry) - {f.name for f in fields(ProcessorConfig)}
+    if unknown:
+        raise ValueError(f"Unknown config fields for {source}: {sorted(unknown)}")
+    overrides = {k: v for k, v in entry.items() if k not in _RESERVED_FIELDS}
+
+    return ProcessorConfig(
+        source=source,
+        output_dir=output_dir,
+        **{**defaults, **_source_type_flags(source), **overrides},
+    )
+
+
+def collect_configs(
+    sources: list[str], output_root: Path, defaults: dict
+) -> list[ProcessorConfig]:
+    """Expand directories, glob patterns and manifests into per-item configurations.
+
+    Args:
+        sources: Directories, glob patterns, manifest files (.jsonl), files or URLs
+        output_root: Directory under which each item gets its own output directory
+        defaults: ProcessorConfig field values shared by all items
+
+    Returns:
+        One configuration per item, in a stable order
+    """
+    entries = []
+    for source in sources:
+        path = Path(source)
+        if path.is_dir():
+            for child in sorted(path.iterdir()):
+                if child.suffix.lower() in AUDIO_EXTENSIONS | MIDI_EXTENSIONS:
+                    entries.append({"source": str(child)})
+        elif path.suffix.lower() == ".jsonl" and path.is_file():
+            entries.extend(_read_manifest(path))
+        elif glob.has_magic(source):
+            entries.extend({"source": match} for match in sorted(glob.glob(source)))
+        else:
+            entries.append({"source": source})
+
+    configs = []
+    used_names = set()
+    for entry in entries:
+        source = entry["source"]
+        name = entry.pop("name", None) or Path(source.rstrip("/")).stem or "item"
+        unique_name = name
+        suffix = 1
+        while unique_name in used_names:
+            suffix += 1
+            unique_name = f"{name}_{suffix}"
+        used_names.add(unique_name)
+
+        configs.append(config_from_entry(entry, output_root / unique_name, defaults))
+    return configs
+
+
+# Per-worker AudioProcessor arguments, set up once by the pool initializer
+_worker_options = {}
+
+
+def _init_worker(options: dict, preload_model: bool) -> None:
+    """Store the processor options and load one warm transcription model into this worker."""
+    _worker_options.update(options)
+    # Release the worker's warm MidiToLily runner when the pool shuts the worker down
+    multiprocessing.util.Finalize(None, close_runners, exitpriority=10)
+    if not preload_model:
+        return
+
+    from src.processors.midi_transcriber import MidiTranscriber
+
+    # Configures torch threads and preloads the model into the process-wide registry
+    MidiTranscriber(
+        None,
+        checkpoint_path=options["checkpoint_path"],
+        **(options["transcriber_options"] or {}),
+    )
+
+
+def _run_config(
+    config: ProcessorConfig,
+    memory_budget_bytes: Optional[int] = None,
+    memory_estimate: Optional[dict] = None,
+) -> BatchResult:
+    """Run the pipeline for one item, turning failures into a result instead of raising."""
+    start = time.perf_counter()
+    pipeline_metrics = PipelineMetrics(memory_budget_bytes=memory_budget_bytes)
+    pipeline_metrics.memory_estimate = memory_estimate
+    try:
+        processor = AudioProcessor(config.output_dir, **_worker_options)
+        try:
+            with pipeline_metrics.activate():
+                sheet_music_path = processor.run(config)
+        finally:
+            # The worker's warm MidiToLily runner is kept for its next items
+            processor.close(shared=False)
+        pipeline_metrics.warn_over_budget(config.source)
+        return BatchResult(
+            source=config.source,
+            output_dir=config.output_dir,
+            success=True,
+            sheet_music_path=sheet_music_path,
+            seconds=time.perf_counter() - start,
+            metrics=pipeline_metrics.to_dict(),
+        )
+    except Exception as e:
+        return BatchResult(
+            source=config.source,
+            output_dir=config.output_dir,
+            success=False,
+            error=f"{type(e).__name__}: {e}",
+            seconds=time.perf_counter() - start,
+            metrics=pipeline_metrics.to_dict(),
+        )
+
+
+class BatchProcessor:
+    """Runs many pipeline configurations over a pool of warm worker processes."""
+
+    def __init__(
+        self,
+        workers: int = 1,
+        checkpoint_path: Optional[str] = None,
+        cache_dir: Optional[Path] = None,
+        cache_max_bytes: int = DEFAULT_MAX_BYTES,
+        transcriber_options: Optional[dict] = None,
+        render_workers: Optional[int] = None,
+        memory_budget_bytes: Optional[int] = None,
+    ):
+        """Initialize the batch processor.
+
+        Args:
+            workers: Number of worker processes, each holding one transcription model
+            checkpoint_path: Path to the model checkpoint, or None for the checkpoint store's default
+            cache_dir: Stage cache directory shared by all workers, or None to disable caching
+            cache_max_bytes: Size cap of the stage cache
+            transcriber_options: Extra MidiTranscriber arguments used in every worker
+            render_workers: Render all PDFs at the end of the batch with this many
+                lilypond processes (each taking many files), or None to render every
+                item in its own worker. Items with shard_bars or preview_bars still
+                render in their own worker
+            memory_budget_bytes: Memory all worker processes together may use, or
+                None for no limit. Items wait until their estimated footprint fits,
+                or run in low-memory mode (chunked transcription) when that fits
+                sooner or they are too large for the budget
+        """
+        self.workers = max(1, workers)
+        self.memory_budget_bytes = memory_budget_bytes
+        self.transcriber_options = transcriber_options or {}
+        self.render_workers = render_workers
+        self.cache_dir = cache_dir
+        self.cache_max_bytes = cache_max_bytes
+        self.processor_options = {
+            "checkpoint_path": checkpoint_path,
+            "cache_dir": cache_dir,
+            "cache_max_bytes": cache_max_bytes,
+            "transcriber_options": transcriber_options,
+        }
+
+    def run(self, configs: list[ProcessorConfig]) -> Iterator[BatchResult]:
+        """Process all configurations, yielding results as items finish.
+
+        A failing item is reported and does not stop the rest of the batch. With
+        render_workers set, results are yielded once the batch render has finished.
+
+        Args:
+            configs: Per-item pipeline configurations
+
+        Returns:
+            Iterator over per-item results in completion order
+        """
+        if not self.render_workers:
+            yield from self._run_items(configs)
+            return
+
+        # Previews are a single small render, and sharded renders join their own
+        # sections, so items asking for either render in their own worker
+        for config in configs:
+            if config.shard_bars and not config.preview_bars:
+                logging.warning(
+                    f"{config.source} has shard_bars set, so it is rendered in its "
+                    "worker instead of the batch render"
+                )
+        results = list(
+            self._run_items(
+                [
+                    c if c.preview_bars or c.shard_bars else replace(c, render=False)
+                    for c in configs
+                ]
+            )
+        )
+        yield from self._render(results)
+
+    def _render(self, results: list[BatchResult]) -> list[BatchResult]:
+        """Render the LilyPond files of successful items together, updating their results."""
+        from src.processors.lilypond_converter import LilypondConverter
+        from src.utils.stage_cache import StageCache
+
+        rendered = [
+            r for r in results if r.success and r.sheet_music_path.suffix == ".ly"
+        ]
+        if not rendered:
+            return results
+
+        cache = (
+            StageCache(self.cache_dir, self.cache_max_bytes) if self.cache_dir else None
+        )
+        converter = LilypondConverter(rendered[0].output_dir, cache=cache)
+        start = time.perf_counter()
+        outputs = converter.render_many(
+            # Next to the LilyPond file, which is in the run directory of a workspace run
+            [
+                (r.sheet_music_path, r.sheet_music_path.parent / "4_sheet_music")
+                for r in rendered
+            ],
+            workers=self.render_workers,
+        )
+        logging.info(
+            f"Rendered {len(rendered)} items in {time.perf_counter() - start:.1f}s"
+        )
+
+        for result, output in zip(rendered, outputs):
+            if isinstance(output, Exception):
+                result.success = False
+                result.error = f"{type(output).__name__}: {output}"
+                result.sheet_music_path = None
+                logging.error(f"Failed {result.source}: {result.error}")
+            else:
+                result.sheet_music_path = output
+        return results
+
+    def _run_items(self, configs: list[ProcessorConfig]) -> Iterator[BatchResult]:
+        """Run configurations over the worker pool, yielding results in completion order."""
+        # Only pay for a model load in the workers if something needs transcription
+        needs_model = any(not (c.midi_file or c.ly_file) for c in configs)
+        workers = self.workers
+        budget = None
+        if self.memory_budget_bytes:
+            per_worker = process_bytes(needs_model)
+            if workers * per_worker > self.memory_budget_bytes:
+                workers = max(1, self.memory_budget_bytes // per_worker)
+                logging.warning(
+                    f"Memory budget fits only {workers} worker process(es); "
+                    f"using {workers} instead of {self.workers}"
+                )
+            budget = MemoryBudget(
+                self.memory_budget_bytes, fixed_bytes=workers * per_worker
+            )
+
+        # spawn keeps CUDA and torch thread pools out of forked children
+        context = multiprocessing.get_context("spawn")
+
+        pending = list(configs)
+        retried = set()
+        while pending:
+            # Items lost to a crashed worker (e.g. OOM-killed) get one more try in a fresh pool
+            broken = []
+            waiting = deque(pending)
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(self.processor_options, needs_model),
+            ) as executor:
+                futures = {}
+                self._submit_ready(executor, waiting, futures, budget)
+                while futures:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        config, reserved = futures.pop(future)
+                        if budget is not None:
+                            budget.release(reserved)
+                        try:
+                            result = future.result()
+                        except BrokenProcessPool as e:
+                            if id(config) not in retried:
+                                retried.add(id(config))
+                                broken.append(config)
+                                continue
+                            result = BatchResult(
+                                source=config.source,
+                                output_dir=config.output_dir,
+                                success=False,
+                                error=f"Worker process died: {e}",
+                            )
+                        if result.success:
+                            logging.info(
+                                f"Finished {result.source} in {result.seconds:.1f}s"
+                            )
+                        else:
+                            logging.error(f"Failed {result.source}: {result.error}")
+                        yield result
+                    self._submit_ready(executor, waiting, futures, budget)
+            # Items not yet submitted when the pool broke
+            pending = broken + list(waiting)
+
+    def _submit_ready(
+        self,
+        executor: ProcessPoolExecutor,
+        waiting: deque,
+        futures: dict,
+        budget: Optional[MemoryBudget],
+    ) -> None:
+        """Submit waiting items in order while the memory budget admits them."""
+        segments_per_pass = self.transcriber_options.get("batch_size") or 1
+        transcribe_workers = self.transcriber_options.get("workers") or 1
+        while waiting:
+            config = waiting[0]
+            run_config, estimate, reserved = config, None, 0
+            if budget is not None:
+                run_config, estimate = fit_config(
+                    config,
+                    budget.available_bytes,
+                    budget.limit_bytes - budget.fixed_bytes,
+                    segments_per_pass=segments_per_pass,
+                    transcribe_workers=transcribe_workers,
+                )
+                reserved = estimate.total_bytes
+                if not budget.try_reserve(reserved):
+                    return
+            try:
+                future = executor.submit(
+                    _run_config,
+                    run_config,
+                    self.memory_budget_bytes,
+                    estimate.to_dict() if estimate else None,
+                )
+            except BrokenProcessPool:
+                if budget is not None:
+                    budget.release(reserved)
+                return
+            waiting.popleft()
+            futures[future] = (config, reserved)
+
+
+def write_report(results: list[BatchResult], report_path: Path) -> None:
+    """Write per-item batch results to a JSON report.
+
+    Args:
+        results: Results returned by BatchProcessor.run
+        report_path: Path of the JSON report to write
+    """
+    report = [
+        {
+            "source": r.source,
+            "output_dir": str(r.output_dir),
+            "success": r.success,
+            "sheet_music_path": str(r.sheet_music_path) if r.sheet_music_path else None,
+            "error": r.error,
+            "seconds": round(r.seconds, 3),
+            "metrics": r.metrics,
+        }
+        for r in results
+    ]
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
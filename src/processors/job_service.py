@@ -0,0 +1,365 @@
+"""Long-running job service for Audio Pond."""
+
+import logging
+import queue
+import resource
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import nullcontext
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Optional
+
+from src.processors.audio_processor import AudioProcessor, ProcessorConfig
+from src.processors.batch_processor import config_from_entry
+from src.processors.midi2lily_runner import close_runners
+from src.processors.memory_budget import (
+    SEGMENT_ACTIVATION_BYTES,
+    MemoryBudget,
+    fit_config,
+    process_bytes,
+)
+from src.utils.stage_cache import DEFAULT_MAX_BYTES
+
+# Default number of jobs running at once and of stage runs allowed at once
+DEFAULT_JOB_WORKERS = 4
+DEFAULT_STAGE_LIMITS = {"transcription": 4, "midi_to_lilypond": 2, "render": 2}
+
+# Finished jobs whose status is kept for lookups before the oldest are forgotten
+DEFAULT_HISTORY = 1000
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the work queue is full."""
+
+
+@dataclass
+class Job:
+    """A submitted pipeline run and its progress."""
+
+    id: str
+    config: ProcessorConfig
+    status: str = "queued"  # queued | running | done | failed
+    result_path: Optional[Path] = None
+    error: Optional[str] = None
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    # Estimated footprint the job was admitted with, and whether it was switched
+    # to low-memory mode to fit the memory budget
+    memory_estimate_bytes: Optional[int] = None
+    low_memory: bool = False
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "source": self.config.source,
+            "status": self.status,
+            "result_path": str(self.result_path) if self.result_path else None,
+            "error": self.error,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "memory_estimate_bytes": self.memory_estimate_bytes,
+            "low_memory": self.low_memory,
+        }
+
+
+class JobService:
+    """Runs submitted pipeline jobs in one warm process.
+
+    Jobs wait in a bounded queue and are run by a fixed number of worker threads,
+    each job in its own output directory under output_root. A job's source is an
+    http(s) URL or a file under input_root; LilyPond files are rendered in
+    LilyPond's safe mode, since clients supply them. The transcription,
+    MidiToLily and LilyPond stages have their own concurrency limits shared by all
+    jobs, so e.g. many jobs can transcribe while only a few run LilyPond. All
+    transcriptions share one model through a TranscriptionBatcher, which packs the
+    segments of concurrent jobs into common forward passes. With a memory budget,
+    a job starts only once its estimated footprint fits next to the running jobs
+    (switching to chunked transcription if that fits sooner), in submission order.
+    """
+
+    def __init__(
+        self,
+        output_root: Path,
+        input_root: Optional[Path] = None,
+        workers: int = DEFAULT_JOB_WORKERS,
+        queue_size: int = 32,
+        stage_limits: Optional[dict[str, int]] = None,
+        defaults: Optional[dict] = None,
+        checkpoint_path: Optional[str] = None,
+        cache_dir: Optional[Path] = None,
+        cache_max_bytes: int = DEFAULT_MAX_BYTES,
+        transcriber_options: Optional[dict] = None,
+        batch_wait_seconds: float = 0.05,
+        preload_model: bool = True,
+        history: int = DEFAULT_HISTORY,
+        result_ttl_seconds: Optional[float] = None,
+        memory_budget_bytes: Optional[int] = None,
+    ):
+        """Initialize the job service.
+
+        Args:
+            output_root: Directory under which each job gets its own output directory
+            input_root: Directory holding the local files jobs may use as sources
+                (relative sources are resolved against it), or None to accept only URLs
+            workers: Number of jobs running at once
+            queue_size: Number of jobs that may wait for a worker before submissions
+                are refused
+            stage_limits: Concurrent runs allowed per stage ('transcription',
+                'midi_to_lilypond', 'render'), merged over DEFAULT_STAGE_LIMITS
+            defaults: ProcessorConfig field values used where a job has no override
+            checkpoint_path: Path to the model checkpoint, or None for the checkpoint store's default
+            cache_dir: Stage cache directory shared by all jobs, or None to disable caching
+            cache_max_bytes: Size cap of the stage cache
+            transcriber_options: MidiTranscriber arguments of the shared model
+                (batch_size, cpu_threads, interop_threads, backend, skip_inactive)
+            batch_wait_seconds: How long a model pass that is not full waits for
+                segments of other jobs
+            preload_model: Load the transcription model at start() instead of on the
+                first job that needs it
+            history: Number of finished jobs remembered for status lookups
+            result_ttl_seconds: Delete the output directory of a job and forget it this
+                long after it finished, or None to keep results
+            memory_budget_bytes: Memory the whole service may use, including the
+                shared model, or None for no limit
+        """
+        self.output_root = Path(output_root)
+        self.input_root = Path(input_root).resolve() if input_root else None
+        self.workers = max(1, workers)
+        self.defaults = defaults or {}
+        self.checkpoint_path = checkpoint_path
+        self.cache_dir = cache_dir
+        self.cache_max_bytes = cache_max_bytes
+        self.transcriber_options = transcriber_options or {}
+        self.batch_wait_seconds = batch_wait_seconds
+        self.preload_model = preload_model
+        self.history = history
+        self.result_ttl_seconds = result_ttl_seconds
+
+        limits = {**DEFAULT_STAGE_LIMITS, **(stage_limits or {})}
+        self.stage_gates = {
+            stage: threading.BoundedSemaphore(max(1, limit))
+            for stage, limit in limits.items()
+        }
+
+        self.memory_budget = None
+        if memory_budget_bytes:
+            # The process, the shared model and the batcher's forward passes
+            batch_size = self.transcriber_options.get("batch_size") or 1
+            self.memory_budget = MemoryBudget(
+                memory_budget_bytes,
+                fixed_bytes=process_bytes() + batch_size * SEGMENT_ACTIVATION_BYTES,
+            )
+
+        self._queue = queue.Queue(maxsize=max(1, queue_size))
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._batcher = None
+        self._batcher_lock = threading.Lock()
+
+    def start(self) -> None:
+        """Load the model (unless loaded lazily) and start the worker threads."""
+        self.output_root.mkdir(parents=True, exist_ok=True)
+        if self.preload_model:
+            self.batcher  # loads and warms up the shared model
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._work, name=f"job-worker-{i + 1}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def close(self) -> None:
+        """Stop taking jobs, let running jobs finish and stop the worker threads."""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        if self._batcher is not None:
+            self._batcher.close()
+            self._batcher.engine.close()
+        close_runners()
+
+    @property
+    def batcher(self):
+        """Batcher running the shared transcription model, created on first use."""
+        with self._batcher_lock:
+            if self._batcher is None:
+                from src.processors.midi_transcriber import MidiTranscriber
+                from src.processors.transcription_batcher import TranscriptionBatcher
+
+                engine = MidiTranscriber(
+                    None,
+                    checkpoint_path=self.checkpoint_path,
+                    **self.transcriber_options,
+                )
+                self._batcher = TranscriptionBatcher(
+                    engine, max_wait_seconds=self.batch_wait_seconds
+                )
+            return self._batcher
+
+    def submit(self, entry: dict) -> Job:
+        """Queue a job.
+
+        Args:
+            entry: Dict with a 'source' and optional ProcessorConfig field overrides
+
+        Returns:
+            The queued job
+
+        Raises:
+            ValueError: If the entry is not a valid configuration, or its source is
+                neither an http(s) URL nor a file under the input root
+            QueueFullError: If the work queue is full
+        """
+        if not isinstance(entry, dict):
+            raise ValueError("Job must be a JSON object")
+        job_id = uuid.uuid4().hex
+        config = config_from_entry(entry, self.output_root / job_id, self.defaults)
+        config = self._check_source(config)
+        job = Job(id=job_id, config=config)
+
+        with self._lock:
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                raise QueueFullError(
+                    f"Work queue is full ({self._queue.maxsize} jobs waiting)"
+                )
+            self._jobs[job_id] = job
+        logging.info(f"Queued job {job_id}: {config.source}")
+        return job
+
+    def _check_source(self, config: ProcessorConfig) -> ProcessorConfig:
+        """Check that a job reads a URL or a file under the input root.
+
+        Returns:
+            The configuration, with a file source resolved to its absolute path
+
+        Raises:
+            ValueError: If the source is not allowed
+        """
+        if not (config.audio_file or config.midi_file or config.ly_file):
+            if not config.source.startswith(("http://", "https://")):
+                raise ValueError(f"Source is not an http(s) URL: {config.source}")
+            return config
+
+        if self.input_root is None:
+            raise ValueError("This server does not accept local files; submit a URL")
+        # Resolving follows symlinks and '..', so the check sees the real location
+        path = (self.input_root / config.source).resolve()
+        if not path.is_relative_to(self.input_root):
+            raise ValueError(f"Source is outside the input directory: {config.source}")
+        return replace(config, source=str(path))
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Look up a job by id, or None if it is unknown or has been forgotten."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self) -> dict:
+        """Numbers of jobs per status, and the memory budget use if there is a budget."""
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        stats = {
+            status: statuses.count(status)
+            for status in ("queued", "running", "done", "failed")
+        }
+        if self.memory_budget is not None:
+            stats["memory"] = {
+                **self.memory_budget.stats(),
+                # ru_maxrss is in kilobytes on Linux
+                "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                * 1024,
+            }
+        return stats
+
+    def _work(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            self._run_job(job)
+            self._forget_old_jobs()
+
+    def _run_job(self, job: Job) -> None:
+        """Run one job once the memory budget admits it, recording its result or error."""
+        reservation = nullcontext()
+        if self.memory_budget is not None:
+            budget = self.memory_budget
+            # The shared batcher runs the model, so jobs hold no activations
+            config, estimate = fit_config(
+                job.config,
+                budget.available_bytes,
+                budget.limit_bytes - budget.fixed_bytes,
+                segments_per_pass=0,
+            )
+            job.low_memory = config is not job.config
+            job.config = config
+            job.memory_estimate_bytes = estimate.total_bytes
+            reservation = budget.reserve(estimate.total_bytes)
+
+        with reservation:
+            job.status = "running"
+            job.started_at = time.time()
+            config = job.config
+            transcriber_options = {"preload": False}
+            if not (config.midi_file or config.ly_file):
+                transcriber_options["batcher"] = self.batcher
+                transcriber_options["backend"] = self.batcher.engine.backend
+                transcriber_options["skip_inactive"] = self.batcher.engine.skip_inactive
+
+            processor = None
+            status = "failed"
+            try:
+                processor = AudioProcessor(
+                    config.output_dir,
+                    checkpoint_path=self.checkpoint_path,
+                    cache_dir=self.cache_dir,
+                    cache_max_bytes=self.cache_max_bytes,
+                    transcriber_options=transcriber_options,
+                    stage_gates=self.stage_gates,
+                    safe_lilypond=config.ly_file,
+                )
+                job.result_path = processor.run(config)
+                status = "done"
+                logging.info(
+                    f"Finished job {job.id} in {time.time() - job.started_at:.1f}s"
+                )
+            except Exception as e:
+                job.error = f"{type(e).__name__}: {e}"
+                logging.error(f"Failed job {job.id}: {job.error}")
+            finally:
+                if processor is not None:
+                    processor.close(shared=False)
+                # A finished job always has its finish time, which expiry relies on
+                with self._lock:
+                    job.finished_at = time.time()
+                    job.status = status
+
+    def _forget_old_jobs(self) -> None:
+        """Drop expired jobs with their results, and the oldest beyond the history limit."""
+        expired = []
+        with self._lock:
+            finished = [
+                job
+                for job in self._jobs.values()
+                if job.status in ("done", "failed") and job.finished_at is not None
+            ]
+            if self.result_ttl_seconds is not None:
+                cutoff = time.time() - self.result_ttl_seconds
+                expired = [job for job in finished if job.finished_at < cutoff]
+                finished = [job for job in finished if job.finished_at >= cutoff]
+            for job in expired + finished[: max(0, len(finished) - self.history)]:
+                del self._jobs[job.id]
+
+        for job in expired:
+            logging.info(f"Removing results of expired job {job.id}")
+            shutil.rmtree(job.config.output_dir, ignore_errors=True)
@@ -1,22 +1,397 @@
 """LilyPond converter for Audio Pond."""
 
+import functools
 import os
+import re
 import subprocess
 import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Optional
 import textwrap
 
+from src.processors.midi2lily_runner import get_runner
+from src.utils import metrics
+from src.utils.stage_cache import StageCache
+from src.utils.workspace import atomic_path, move_atomic
+
+# MIDI to LilyPond backends: the MidiToLily executable, or the in-process converter
+CONVERTERS = ("midi2lily", "native")
+
+# Characters that matter when splitting a track into bars
+_BAR_TOKENS = re.compile(r'[{}"|]')
+# Track variables and the score block, as written by MidiToLily
+_SECTION_MARKERS = re.compile(r'"track1"|"track2"|\\score')
+
+# Image formats of preview renders, and their default resolution in DPI
+PREVIEW_FORMATS = ("png", "svg")
+PREVIEW_RESOLUTION = 72
+
+# Commands whose setting carries over into later bars, restated at the start of
+# each section of a sharded render
+_CONTEXT_COMMANDS = {
+    "key": re.compile(r"\\key\s+\S+\s+\\(?:major|minor)"),
+    "time": re.compile(r"\\time\s+\d+/\d+"),
+    "clef": re.compile(r'\\clef\s+(?:"[^"]*"|\S+)'),
+    "tempo": re.compile(r"\\tempo\s+\d+\.*\s*=\s*\d+"),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def lilypond_version() -> str:
+    """Version line of the installed LilyPond, which render cache keys depend on."""
+    try:
+        result = subprocess.run(
+            ["lilypond", "--version"], capture_output=True, text=True, check=True
+        )
+    except FileNotFoundError:
+        raise RuntimeError(
+            "LilyPond not found. Please make sure LilyPond is installed and available in PATH."
+        )
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Failed to get LilyPond version: {e.stderr}")
+    lines = result.stdout.strip().splitlines()
+    return lines[0] if lines else ""
+
+
+def _outputs_for(output_dir: Path, stem: str) -> list[Path]:
+    """Files LilyPond wrote for the input with this stem (e.g. x.pdf, x.midi, x-1.midi)."""
+    return sorted(
+        path
+        for path in output_dir.iterdir()
+        if path.suffix != ".ly"
+        and (path.name.startswith(f"{stem}.") or path.name.startswith(f"{stem}-"))
+    )
+
+
+def _job_errors(stderr: str, name: str) -> list[str]:
+    """Error lines LilyPond reported for the input file with this name."""
+    return [
+        line
+        for line in stderr.splitlines()
+        if re.search(rf"(?:^|/){re.escape(name)}:\d+:\d+: (?:fatal )?error", line)
+        or ("failed files:" in line and f'/{name}"' in line)
+    ]
+
+
+def _publish(files: list[Path], stem: str, output_base: Path) -> Optional[Path]:
+    """Move rendered files named after stem to output_base, returning the PDF path."""
+    pdf_path = None
+    for path in files:
+        dest_path = output_base.with_name(f"{output_base.name}{path.name[len(stem) :]}")
+        move_atomic(path, dest_path)
+        if dest_path.suffix == ".pdf":
+            pdf_path = dest_path
+    return pdf_path
+
+
+def _strip_span(content: str, start: int, end: int) -> tuple[int, int]:
+    """Span of content[start:end] with surrounding whitespace removed."""
+    while start < end and content[start].isspace():
+        start += 1
+    while end > start and content[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+def _track_spans(content: str) -> list[tuple[int, int]]:
+    """(start, end) offsets of the music inside "track1" and "track2"."""
+    markers = {}
+    for match in _SECTION_MARKERS.finditer(content):
+        markers.setdefault(match.group(), match.start())
+
+    track_starts = [markers.get(f'"track{i}"', -1) for i in range(1, 3)]
+    spans = []
+    for i, start in enumerate(track_starts):
+        # The music starts after the track's opening brace
+        content_start = content.find("{", start) + 1
+
+        # It ends at the next track, or at the score section for the last track
+        if i < len(track_starts) - 1:
+            content_end = track_starts[i + 1]
+        else:
+            content_end = markers.get("\\score", -1)
+        if content_end < 0:
+            content_end += len(content)
+
+        content_start, content_end = _strip_span(content, content_start, content_end)
+        # Drop the track's closing brace
+        if content_end > content_start and content[content_end - 1] == "}":
+            content_start, content_end = _strip_span(
+                content, content_start, content_end - 1
+            )
+        spans.append((content_start, content_end))
+    return spans
+
+
+def index_bars(content: str) -> list[list[tuple[int, int]]]:
+    """Index the bars of both tracks of a MidiToLily-style LilyPond file in one pass.
+
+    A bar ends at a '|' outside braces and quotes and includes it. The last bar of a
+    track holds whatever follows the final '|' (usually \\fine).
+
+    Args:
+        content: LilyPond source with "track1" and "track2" variables
+
+    Returns:
+        For each track, the (start, end) offsets of its bars in content, without
+        surrounding whitespace
+    """
+    track_bars = []
+    for track_start, track_end in _track_spans(content):
+        bars = []
+        bar_start = track_start
+        bracket_depth = 0
+        in_quotes = False
+
+        for match in _BAR_TOKENS.finditer(content, track_start, track_end):
+            char = match.group()
+            pos = match.start()
+            if char == "{":
+                bracket_depth += 1
+            elif char == "}":
+                bracket_depth -= 1
+            elif char == '"':
+                if pos == bar_start or content[pos - 1] != "\\":
+                    in_quotes = not in_quotes
+            elif bracket_depth == 0 and not in_quotes:
+                # Only consider bar lines outside of brackets and quotes
+                bars.append(_strip_span(content, bar_start, pos + 1))
+                bar_start = pos + 1
+
+        # Add the last bar if there's content
+        last = _strip_span(content, bar_start, track_end)
+        if last[1] > last[0]:
+            bars.append(last)
+
+        track_bars.append(bars)
+    return track_bars
+
+
+def _parallel_music_header(titles: bool = True) -> str:
+    """Start of a parallelMusic file, up to the first bar."""
+    if titles:
+        header_block = textwrap.dedent("""\
+            \\header {
+              title = "Title"
+              subtitle = "Subtitle"
+              composer = "Composer"
+              arranger = "Arranger"
+              tagline = ""
+            }
+            """)
+    else:
+        # Later sections of a sharded render continue the first one's page, and
+        # previews show only the music
+        header_block = textwrap.dedent("""\
+            \\header {
+              tagline = ""
+            }
+
+            \\paper {
+              print-page-number = ##f
+            }
+            """)
+
+    return (
+        textwrap.dedent("""\
+            \\include "articulate.ly"
+            \\version "2.25.20"
+            \\language "english"
+
+            """)
+        + header_block
+        + textwrap.dedent("""\
+
+            global = {
+              \\numericTimeSignature
+            }
+
+            cd = \\change Staff = "down"
+            cu = \\change Staff = "up"
+
+            \\parallelMusic voiceA,voiceB {
+              \\global
+            """)
+    )
+
+
+def _parallel_music_footer(midi: bool = True) -> str:
+    """End of a parallelMusic file, after the parallelMusic block."""
+    footer = textwrap.dedent("""\
+        music = {
+          \\new PianoStaff \\with { instrumentName = "Piano" }
+          <<
+            \\new Staff = "up" { \\voiceA }
+            \\new Staff = "down" { \\voiceB }
+          >>
+        }
+
+        \\score {
+          \\music
+          \\layout {}
+        }
+        """)
+    if midi:
+        footer += textwrap.dedent("""\
+
+            \\score {
+              \\articulate
+              \\music
+              \\midi {}
+            }
+            """)
+    return footer
+
+
+def _write_parallel_music(
+    f,
+    content: str,
+    track_bars: list[list[tuple[int, int]]],
+    bar_range: range,
+    titles: bool = True,
+    midi: bool = True,
+    prefixes: Optional[list[str]] = None,
+) -> None:
+    """Write bars of both tracks as a parallelMusic file.
+
+    Args:
+        f: Text file to write to
+        content: LilyPond source the bar offsets refer to
+        track_bars: Bar offsets of each track, from index_bars
+        bar_range: Indices of the bars to write
+        titles: Include the title header
+        midi: Include the MIDI score
+        prefixes: Commands put before the first written bar of each track
+    """
+    f.write(_parallel_music_header(titles))
+
+    for i in bar_range:
+        bars = [
+            content[slice(*spans[i])] if i < len(spans) else None
+            for spans in track_bars
+        ]
+        # The bar holding \fine gets no bar number or blank line
+        is_fine_bar = any(bar is not None and "\\fine" in bar for bar in bars)
+
+        if not is_fine_bar:
+            f.write(f"  % bar {i + 1}\n")
+
+        for track_idx, bar in enumerate(bars):
+            if bar is None:
+                # If a track has fewer bars, add a placeholder
+                bar = "r1 |"
+            if prefixes and i == bar_range.start and prefixes[track_idx]:
+                bar = f"{prefixes[track_idx]} {bar}"
+            # Add the | after \fine
+            f.write(f"  {bar}\n".replace("\\fine\n", "\\fine |\n"))
+
+        if not is_fine_bar:
+            f.write("\n")
+
+    # Close the parallelMusic section
+    f.write("}\n\n")
+    f.write(_parallel_music_footer(midi))
+
+
+def _carry_context(
+    context: list[dict],
+    content: str,
+    track_bars: list[list[tuple[int, int]]],
+    bar_range: range,
+) -> None:
+    """Update each track's context with the last key, time, clef and tempo set in the bars."""
+    for track_context, spans in zip(context, track_bars):
+        for start, end in spans[bar_range.start : bar_range.stop]:
+            for name, pattern in _CONTEXT_COMMANDS.items():
+                commands = pattern.findall(content, start, end)
+                if commands:
+                    track_context[name] = commands[-1]
+
+
+def _context_prefixes(
+    context: list[dict], start: int, tempo: bool = False
+) -> list[str]:
+    """Commands restating each track's context before bar index start, numbering bars on."""
+    prefixes = [
+        " ".join(
+            command
+            for name, command in track_context.items()
+            if name != "tempo" or tempo
+        )
+        for track_context in context
+    ]
+    prefixes[0] = f"\\set Score.currentBarNumber = #{start + 1} {prefixes[0]}"
+    return prefixes
+
+
+def parse_bar_range(spec: str) -> range:
+    """Parse a bar range such as '1-8' (bars 1 to 8) or '8' (the first 8 bars).
+
+    Args:
+        spec: One-based, inclusive bar range
+
+    Returns:
+        Zero-based indices of the bars
+
+    Raises:
+        ValueError: If the text is not a bar range
+    """
+    first, sep, last = spec.strip().partition("-")
+    try:
+        if sep:
+            bar_range = range(int(first) - 1, int(last))
+        else:
+            bar_range = range(0, int(first))
+    except ValueError:
+        raise ValueError(f"Invalid bar range: {spec!r}")
+    if bar_range.start < 0 or len(bar_range) < 1:
+        raise ValueError(f"Invalid bar range: {spec!r}")
+    return bar_range
+
+
+def _concatenate_pdfs(pdf_paths: list[Path], output_path: Path) -> None:
+    """Join PDF files into one with Ghostscript."""
+    command = [
+        "gs",
+        "-q",
+        "-dBATCH",
+        "-dNOPAUSE",
+        "-dSAFER",
+        "-sDEVICE=pdfwrite",
+        f"-sOutputFile={output_path}",
+        *[str(path) for path in pdf_paths],
+    ]
+    try:
+        with metrics.timed_subprocess(command):
+            subprocess.run(command, check=True, capture_output=True, text=True)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Failed to join sheet music sections: {e.stderr}")
+    except FileNotFoundError:
+        raise RuntimeError(
+            "Ghostscript not found. Please make sure gs is installed and available in PATH."
+        )
+
 
 class LilypondConverter:
     """Handles MIDI to LilyPond conversion and rendering."""
 
-    def __init__(self, output_dir: Path):
+    def __init__(
+        self, output_dir: Path, cache: Optional[StageCache] = None, safe: bool = False
+    ):
         """Initialize the LilyPond converter.
 
         Args:
             output_dir: Directory for output files
+            cache: Cache for rendered output, or None to always run LilyPond
+            safe: Run LilyPond with -dsafe, for LilyPond files from untrusted clients
         """
         self.output_dir = output_dir
+        self.cache = cache
+        self.safe = safe
+        # Extra directories on LilyPond's include path, e.g. that of a source .ly file
+        self.include_dirs = []
 
         # Configure MidiToLily executable path
         midi2lily_path = os.getenv("MIDI2LILY_PATH")
@@ -25,8 +400,33 @@ class LilypondConverter:
         )
         print(f"MIDI2LILY_LOCATION: {self.midi2lily_exe}")
 
+        # Warm MidiToLily runner shared by all conversions in this process
+        self.midi2lily_runner = get_runner(
+            self.midi2lily_exe,
+            max_concurrency=int(os.getenv("MIDI2LILY_CONCURRENCY", "2")),
+            timeout=float(os.getenv("MIDI2LILY_TIMEOUT", "300")),
+            wine_prefix=os.getenv("WINEPREFIX"),
+        )
+
+    def close(self) -> None:
+        """Release the warm MidiToLily runner.
+
+        The runner is shared by every converter in the process, so only close a
+        converter once no other converter in the process is converting.
+        """
+        self.midi2lily_runner.close()
+
+    def _safe_flags(self) -> list[str]:
+        """LilyPond options of safe mode, if enabled."""
+        return ["-dsafe"] if self.safe else []
+
     def midi_to_lilypond(
-        self, midi_path: Path, time: str, key: str, quant: str
+        self,
+        midi_path: Path,
+        time: str,
+        key: str,
+        quant: str,
+        converter: str = "midi2lily",
     ) -> Path:
         """Convert MIDI to LilyPond notation using https://github.com/victimofleisure/MidiToLily.
 
@@ -35,44 +435,132 @@ class LilypondConverter:
             time: Time signature specification
             key: Key signature specification
             quant: Quantization value
+            converter: "midi2lily" to run MidiToLily, or "native" to convert in-process
 
         Returns:
             Path to the generated LilyPond file
         """
+        if converter == "native":
+            from src.processors.midi_events import load_event_table
+
+            table = load_event_table(midi_path)
+            return self.events_to_lilypond(table, time=time, key=key, quant=quant)
+        if converter != "midi2lily":
+            raise ValueError(f"Unknown MIDI to LilyPond converter: {converter}")
+
+        ly_output_path = self.output_dir / "3_lilypond.ly"
         try:
-            ly_output_path = self.output_dir / "3_lilypond.ly"
             # Run MidiToLily to convert MIDI to LilyPond
-            subprocess.run(
-                [
-                    # Path to MidiToLily executable
-                    *self.midi2lily_exe,
-                    str(midi_path),
-                    "-quant",
-                    quant,
-                    "-time",
-                    time,
-                    "-key",
-                    key,
-                    "-staves",
-                    "1,2",
-                    "-output",
-                    str(ly_output_path),
-                ],
-                check=True,
-                text=True,
+            result = self.midi2lily_runner.run(
+                self._midi2lily_args(midi_path, ly_output_path, time, key, quant)
             )
-            return ly_output_path
         except subprocess.CalledProcessError as e:
             logging.error(f"MidiToLily output: {e.stdout}")
             raise RuntimeError(f"Failed to convert MIDI to LilyPond: {e.stderr}")
+        except subprocess.TimeoutExpired as e:
+            if e.stdout:
+                logging.error(f"MidiToLily output: {e.stdout}")
+            raise RuntimeError(
+                f"MidiToLily timed out after {e.timeout:.0f}s converting {midi_path}"
+            )
         except FileNotFoundError:
             raise RuntimeError(
                 "MidiToLily not found. Please make sure LilyPond is installed and available in PATH."
             )
 
+        if result.stdout:
+            logging.info(f"MidiToLily output: {result.stdout.strip()}")
+        return ly_output_path
+
+    def events_to_lilypond(self, table, time: str, key: str, quant: str) -> Path:
+        """Convert in-memory MIDI events to LilyPond notation without running MidiToLily.
+
+        The output has the same two-staff layout as MidiToLily's, with tracks 1 and 2
+        of the event table as the upper and lower staff.
+
+        Args:
+            table: EventTable of the (split) MIDI events
+            time: Time signature specification
+            key: Key signature specification
+            quant: Quantization value
+
+        Returns:
+            Path to the generated LilyPond file
+        """
+        from src.processors.native_lilypond import convert_events
+
+        ly_output_path = self.output_dir / "3_lilypond.ly"
+        try:
+            convert_events(table, time, key, quant, output_path=ly_output_path)
+        except ValueError as e:
+            raise RuntimeError(f"Failed to convert MIDI to LilyPond: {str(e)}")
+        return ly_output_path
+
+    def midi_to_lilypond_many(
+        self, jobs: list[tuple[Path, Path]], time: str, key: str, quant: str
+    ) -> list:
+        """Convert many MIDI files through the warm MidiToLily runner with bounded concurrency.
+
+        Args:
+            jobs: (MIDI input path, LilyPond output path) pairs
+            time: Time signature specification
+            key: Key signature specification
+            quant: Quantization value
+
+        Returns:
+            For each job, the LilyPond output path, or the RuntimeError describing its failure
+        """
+        results = self.midi2lily_runner.run_many(
+            [
+                self._midi2lily_args(midi_path, ly_output_path, time, key, quant)
+                for midi_path, ly_output_path in jobs
+            ]
+        )
+
+        outputs = []
+        for (midi_path, ly_output_path), result in zip(jobs, results):
+            if isinstance(result, subprocess.CalledProcessError):
+                logging.error(f"MidiToLily output for {midi_path}: {result.stdout}")
+                outputs.append(
+                    RuntimeError(
+                        f"Failed to convert {midi_path} to LilyPond: {result.stderr}"
+                    )
+                )
+            elif isinstance(result, Exception):
+                outputs.append(
+                    RuntimeError(
+                        f"Failed to convert {midi_path} to LilyPond: {str(result)}"
+                    )
+                )
+            else:
+                outputs.append(ly_output_path)
+        return outputs
+
+    @staticmethod
+    def _midi2lily_args(
+        midi_path: Path, ly_output_path: Path, time: str, key: str, quant: str
+    ) -> list[str]:
+        """MidiToLily command line arguments for one conversion."""
+        return [
+            str(midi_path),
+            "-quant",
+            quant,
+            "-time",
+            time,
+            "-key",
+            key,
+            "-staves",
+            "1,2",
+            "-output",
+            str(ly_output_path),
+        ]
+
     def render_sheet_music(self, ly_path: Path) -> Path:
         """Render LilyPond file to PDF.
 
+        The output is reused from the render cache when the same .ly content was
+        already rendered by the same LilyPond version.
+
         Args:
             ly_path: Path to the input LilyPond file
 
@@ -82,177 +570,357 @@ class LilypondConverter:
         if not ly_path.exists():
             raise FileNotFoundError("LilyPond file not found. Run transcription first.")
 
-        try:
-            output_base = self.output_dir / "4_sheet_music"
-            # Run lilypond to generate PDF
-            subprocess.run(
-                [
-                    "lilypond",
-                    "-o",
-                    str(output_base),
-                    str(ly_path),
-                ],
-                check=True,
-                text=True,
-            )
-            return output_base.with_suffix(".pdf")
-        except subprocess.CalledProcessError as e:
-            raise RuntimeError(f"Failed to render sheet music: {e.stderr}")
-        except FileNotFoundError:
-            raise RuntimeError(
-                "LilyPond not found. Please make sure LilyPond is installed and available in PATH."
-            )
+        result = self.render_many([(ly_path, self.output_dir / "4_sheet_music")])[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
 
-    def transform_to_parallel_music(self, input_path: Path) -> Path:
-        """Transform a LilyPond file with separate tracks into one using parallelMusic notation.
+    def render_many(self, jobs: list[tuple[Path, Path]], workers: int = 1) -> list:
+        """Render many LilyPond files, passing several files to each lilypond invocation.
 
-        This makes the file easier to manually edit by co-locating corresponding bars from both tracks.
+        Cached renders are restored without running LilyPond. The remaining files are
+        split over up to `workers` concurrent lilypond processes, so Guile/LilyPond
+        startup is paid once per process instead of once per file.
 
         Args:
-            input_path: Path to the input LilyPond file with separate tracks
+            jobs: (LilyPond input path, output base path without suffix) pairs; the PDF
+                is written to the output base with a .pdf suffix, MIDI output alongside
+            workers: Maximum number of concurrent lilypond processes
 
         Returns:
-            Path to the transformed LilyPond file
+            For each job, the PDF path, or the RuntimeError describing its failure
         """
-        if not input_path.exists():
-            raise FileNotFoundError(f"Input LilyPond file not found: {input_path}")
-
-        with open(input_path, "r") as f:
-            content = f.read()
-
-        header = textwrap.dedent("""\
-            \\include "articulate.ly"
-            \\version "2.25.20"
-            \\language "english"
+        results = [None] * len(jobs)
+        version = None
+        if self.cache is not None:
+            try:
+                version = lilypond_version()
+            except RuntimeError as e:
+                # LilyPond cannot run, so no job can be rendered
+                return [e] * len(jobs)
+
+        keys = {}
+        misses = []
+        for i, (ly_path, output_base) in enumerate(jobs):
+            if not ly_path.exists():
+                results[i] = RuntimeError(f"LilyPond file not found: {ly_path}")
+                continue
+            if self.cache is not None:
+                keys[i] = self.cache.key("render", [ly_path], {"lilypond": version})
+                with tempfile.TemporaryDirectory(dir=output_base.parent) as tmp_dir:
+                    cached = self.cache.fetch(keys[i], Path(tmp_dir))
+                    if cached:
+                        logging.info(f"Reusing cached render of {ly_path}")
+                        results[i] = _publish(cached, "score", output_base)
+                        continue
+            misses.append(i)
+
+        if not misses:
+            return results
+
+        # Spread the files over up to `workers` lilypond processes
+        groups = [[] for _ in range(min(max(1, workers), len(misses)))]
+        for n, i in enumerate(misses):
+            groups[n % len(groups)].append(i)
+
+        with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+            outcomes = executor.map(
+                metrics.in_current_context(
+                    lambda group: self._render_files(jobs, group, keys)
+                ),
+                groups,
+            )
+            for group, outcome in zip(groups, outcomes):
+                for i, result in zip(group, outcome):
+                    results[i] = result
+        return results
+
+    def _render_files(
+        self, jobs: list[tuple[Path, Path]], indices: list[int], keys: dict
+    ) -> list:
+        """Render the given jobs in one lilypond process and publish their outputs."""
+        with tempfile.TemporaryDirectory(dir=jobs[indices[0]][1].parent) as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+
+            # LilyPond names outputs after the input file, so give every input a
+            # unique name and keep its own directory on the include path
+            inputs = []
+            include_dirs = [str(d) for d in self.include_dirs]
+            for i in indices:
+                ly_path = jobs[i][0].absolute()
+                link_path = tmp_dir / f"job{i}.ly"
+                os.symlink(ly_path, link_path)
+                inputs.append(str(link_path))
+                if str(ly_path.parent) not in include_dirs:
+                    include_dirs.append(str(ly_path.parent))
+
+            command = [
+                "lilypond",
+                *self._safe_flags(),
+                *[f"--include={d}" for d in include_dirs],
+                "-o",
+                str(tmp_dir),
+                *inputs,
+            ]
+            try:
+                with metrics.timed_subprocess(command):
+                    process = subprocess.run(command, capture_output=True, text=True)
+            except FileNotFoundError:
+                error = RuntimeError(
+                    "LilyPond not found. Please make sure LilyPond is installed and available in PATH."
+                )
+                return [error] * len(indices)
+
+            # A failing file can still leave a PDF behind, so a job fails on its own
+            # errors, or on any failure of the process that cannot be attributed
+            errors = {i: _job_errors(process.stderr, f"job{i}.ly") for i in indices}
+            unattributed = process.returncode != 0 and not any(errors.values())
+
+            results = []
+            for i in indices:
+                ly_path, output_base = jobs[i]
+                files = _outputs_for(tmp_dir, f"job{i}")
+                if (
+                    errors[i]
+                    or unattributed
+                    or not any(f.suffix == ".pdf" for f in files)
+                ):
+                    logging.error(f"LilyPond output: {process.stderr}")
+                    message = "\n".join(errors[i]) or process.stderr
+                    results.append(
+                        RuntimeError(
+                            f"Failed to render sheet music for {ly_path}: {message}"
+                        )
+                    )
+                    continue
+
+                # Cache under names that do not depend on the job
+                files = [
+                    f.rename(tmp_dir / f"score{f.name[len(f'job{i}') :]}")
+                    for f in files
+                ]
+                if self.cache is not None and i in keys:
+                    self.cache.store(keys[i], files)
+                metrics.count("rendered")
+                results.append(_publish(files, "score", output_base))
+            return results
+
+    def render_sharded(
+        self,
+        ly_path: Path,
+        bars_per_section: int,
+        workers: int = 4,
+        section_midi: bool = False,
+    ) -> Path:
+        """Render a long score in sections of bars in parallel and join the PDFs.
 
-            \\header {
-              title = "Title"
-              subtitle = "Subtitle"
-              composer = "Composer"
-              arranger = "Arranger"
-              tagline = ""
-            }
+        The score is split at bar boundaries. Each section restates the key, time
+        signature and clef in effect where it starts (and the tempo, for MIDI) and
+        continues the bar numbering, and the sections are rendered by up to `workers`
+        lilypond processes before Ghostscript joins them into one PDF.
 
-            global = {
-              \\numericTimeSignature
-            }
+        Args:
+            ly_path: LilyPond file with separate tracks, as written by midi_to_lilypond
+            bars_per_section: Number of bars in each section
+            workers: Maximum number of concurrent lilypond processes
+            section_midi: Also write a MIDI file for every section
 
-            cd = \\change Staff = "down"
-            cu = \\change Staff = "up"
+        Returns:
+            Path to the joined PDF file
+        """
+        if not ly_path.exists():
+            raise FileNotFoundError("LilyPond file not found. Run transcription first.")
 
-            \\parallelMusic voiceA,voiceB {
-              \\global
-            """)
+        with open(ly_path, "r") as f:
+            content = f.read()
+        track_bars = index_bars(content)
+        max_bars = max(len(bars) for bars in track_bars)
+
+        step = max(1, bars_per_section)
+        sections = [
+            range(start, min(start + step, max_bars))
+            for start in range(0, max_bars, step)
+        ]
+        # Keep a lone trailing bar (usually just \fine) with the music before it
+        if len(sections) > 1 and len(sections[-1]) == 1:
+            sections[-2:] = [range(sections[-2].start, sections[-1].stop)]
+
+        section_dir = self.output_dir / "4_sheet_music_sections"
+        os.makedirs(section_dir, exist_ok=True)
+
+        jobs = []
+        context = [{} for _ in track_bars]
+        for n, bar_range in enumerate(sections, start=1):
+            prefixes = None
+            if bar_range.start > 0:
+                prefixes = _context_prefixes(
+                    context, bar_range.start, tempo=section_midi
+                )
+
+            section_path = section_dir / f"section_{n:03d}.ly"
+            with open(section_path, "w") as f:
+                _write_parallel_music(
+                    f,
+                    content,
+                    track_bars,
+                    bar_range,
+                    titles=n == 1,
+                    midi=section_midi,
+                    prefixes=prefixes,
+                )
+            jobs.append((section_path.absolute(), section_dir / f"section_{n:03d}"))
+
+            # Settings in effect at the end of this section carry into the next
+            _carry_context(context, content, track_bars, bar_range)
+
+        logging.info(f"Rendering {len(jobs)} sections of {step} bars")
+        metrics.count("sections", len(jobs))
+        pdf_paths = self.render_many(jobs, workers=workers)
+        for result in pdf_paths:
+            if isinstance(result, Exception):
+                raise result
+
+        output_path = self.output_dir / "4_sheet_music.pdf"
+        _concatenate_pdfs(pdf_paths, output_path)
+        return output_path
 
-        # Extract the two tracks
-        tracks = []
-        track_starts = [content.find(f'"track{i}"') for i in range(1, 3)]
+    def render_preview(
+        self,
+        ly_path: Path,
+        bar_range: range,
+        image_format: str = "png",
+        resolution: int = PREVIEW_RESOLUTION,
+    ) -> Path:
+        """Render a few bars of a score to a single cropped image for quick checks.
 
-        for i, start in enumerate(track_starts):
-            # Find the start of the actual track content
-            content_start = content.find("{", start) + 1
+        Only the bars in bar_range are written to a parallelMusic file, without the
+        title header or the articulated MIDI score, and LilyPond renders it with
+        -dcrop -dno-print-pages, producing one image trimmed to the music instead of
+        full pages. A range that does not start at the first bar restates the key,
+        time signature and clef in effect there and keeps the bar numbering.
 
-            # Find the end of the track
-            if i < len(track_starts) - 1:
-                content_end = track_starts[i + 1]
-            else:
-                # For the last track, find the score section
-                content_end = content.find("\\score")
-
-            # Extract the track content
-            track_content = content[content_start:content_end].strip()
-            if track_content.endswith("}"):
-                track_content = track_content[:-1].strip()
-
-            tracks.append(track_content)
-
-        # Split each track into bars
-        track_bars = []
-        for track in tracks:
-            # Split by the bar symbol '|' but keep the symbol
-            bars = []
-            current_bar = ""
-
-            # Handle nested brackets and quotes for proper parsing
-            bracket_depth = 0
-            in_quotes = False
-
-            for char in track:
-                current_bar += char
-
-                if char == "{":
-                    bracket_depth += 1
-                elif char == "}":
-                    bracket_depth -= 1
-                elif char == '"' and (len(current_bar) == 0 or current_bar[-2] != "\\"):
-                    in_quotes = not in_quotes
+        Args:
+            ly_path: LilyPond file with separate tracks, as written by midi_to_lilypond
+            bar_range: Indices of the bars to render, e.g. from parse_bar_range; bars
+                past the end of the score are left out
+            image_format: "png" or "svg"
+            resolution: Resolution of PNG output in DPI
 
-                # Only consider bar lines outside of brackets and quotes
-                if char == "|" and bracket_depth == 0 and not in_quotes:
-                    bars.append(current_bar.strip())
-                    current_bar = ""
+        Returns:
+            Path to the preview image
+        """
+        if image_format not in PREVIEW_FORMATS:
+            raise ValueError(f"Unknown preview format: {image_format}")
+        if not ly_path.exists():
+            raise FileNotFoundError("LilyPond file not found. Run transcription first.")
 
-            # Add the last bar if there's content
-            if current_bar.strip():
-                bars.append(current_bar.strip())
+        with open(ly_path, "r") as f:
+            content = f.read()
+        track_bars = index_bars(content)
+        max_bars = max(len(bars) for bars in track_bars)
+        if bar_range.start >= max_bars:
+            raise ValueError(
+                f"Preview starts at bar {bar_range.start + 1}, but the score has {max_bars} bars"
+            )
+        bar_range = range(bar_range.start, min(bar_range.stop, max_bars))
+        metrics.count("bars", len(bar_range))
+
+        prefixes = None
+        if bar_range.start > 0:
+            context = [{} for _ in track_bars]
+            _carry_context(context, content, track_bars, range(bar_range.start))
+            prefixes = _context_prefixes(context, bar_range.start)
+
+        preview_ly_path = self.output_dir / "4_preview.ly"
+        with atomic_path(preview_ly_path) as tmp_path, open(tmp_path, "w") as f:
+            _write_parallel_music(
+                f,
+                content,
+                track_bars,
+                bar_range,
+                titles=False,
+                midi=False,
+                prefixes=prefixes,
+            )
 
-            track_bars.append(bars)
+        output_path = self.output_dir / f"4_preview.{image_format}"
+        key = None
+        if self.cache is not None:
+            options = {"lilypond": lilypond_version(), "format": image_format}
+            if image_format == "png":
+                options["resolution"] = resolution
+            key = self.cache.key("preview", [preview_ly_path], options)
+            with tempfile.TemporaryDirectory(dir=self.output_dir) as tmp_dir:
+                cached = self.cache.fetch(key, Path(tmp_dir))
+                if cached:
+                    logging.info(f"Reusing cached preview of {ly_path}")
+                    move_atomic(cached[0], output_path)
+                    return output_path
+
+        command = [
+            "lilypond",
+            *self._safe_flags(),
+            f"--{image_format}",
+            "-dcrop",
+            "-dno-print-pages",
+        ]
+        if image_format == "png":
+            command.append(f"-dresolution={resolution}")
+        with tempfile.TemporaryDirectory(dir=self.output_dir) as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            command += [
+                *[f"--include={d}" for d in self.include_dirs],
+                f"--include={ly_path.parent.absolute()}",
+                "-o",
+                str(tmp_dir / "preview"),
+                str(preview_ly_path.absolute()),
+            ]
+            try:
+                with metrics.timed_subprocess(command):
+                    process = subprocess.run(command, capture_output=True, text=True)
+            except FileNotFoundError:
+                raise RuntimeError(
+                    "LilyPond not found. Please make sure LilyPond is installed and available in PATH."
+                )
+
+            image_path = tmp_dir / f"preview.cropped.{image_format}"
+            if process.returncode != 0 or not image_path.exists():
+                logging.error(f"LilyPond output: {process.stderr}")
+                raise RuntimeError(
+                    f"Failed to render preview of {ly_path}: {process.stderr}"
+                )
+
+            if key is not None:
+                self.cache.store(key, [image_path])
+            metrics.count("rendered")
+            move_atomic(image_path, output_path)
+        return output_path
 
-        output_content = f"{header}"
+    def transform_to_parallel_music(self, input_path: Path) -> Path:
+        """Transform a LilyPond file with separate tracks into one using parallelMusic notation.
 
-        # Combine corresponding bars from both tracks
-        max_bars = max(len(track_bars[0]), len(track_bars[1]))
+        This makes the file easier to manually edit by co-locating corresponding bars from both tracks.
+        The result is written to the output directory, also when the input is elsewhere.
 
-        for i in range(max_bars):
-            # Check if this is the last bar with \fine
-            is_fine_bar = any(
-                "\\fine" in bars[i] if i < len(bars) else False for bars in track_bars
-            )
+        Args:
+            input_path: Path to the input LilyPond file with separate tracks
 
-            # Add bar number comment (except for \fine)
-            if not is_fine_bar:
-                output_content += f"  % bar {i+1}\n"
-
-            # Add bars from each track
-            for track_idx, bars in enumerate(track_bars):
-                if i < len(bars):
-                    output_content += f"  {bars[i]}\n"
-                else:
-                    # If a track has fewer bars, add a placeholder
-                    output_content += "  r1 |\n"
-
-            # Add a blank line between bars for readability
-            if not is_fine_bar:
-                output_content += "\n"
-
-        # Close the parallelMusic section and add the | after \fine
-        output_content = output_content.replace("\\fine\n", "\\fine |\n")
-        output_content += "}\n\n"
-
-        output_content += textwrap.dedent("""\
-            music = {
-              \\new PianoStaff \\with { instrumentName = "Piano" }
-              <<
-                \\new Staff = "up" { \\voiceA }
-                \\new Staff = "down" { \\voiceB }
-              >>
-            }
+        Returns:
+            Path to the transformed LilyPond file
+        """
+        if not input_path.exists():
+            raise FileNotFoundError(f"Input LilyPond file not found: {input_path}")
 
-            \\score {
-              \\music
-              \\layout {}
-            }
+        with open(input_path, "r") as f:
+            content = f.read()
 
-            \\score {
-              \\articulate
-              \\music
-              \\midi {}
-            }
-            """)
+        track_bars = index_bars(content)
+        max_bars = max(len(bars) for bars in track_bars)
+        metrics.count("bars", max_bars)
 
-        # Write the output file
-        output_path = input_path.with_stem(f"{input_path.stem}_parallel")
-        with open(output_path, "w") as f:
-            f.write(output_content)
+        # Stream corresponding bars from both tracks straight to the output file
+        output_path = self.output_dir / f"{input_path.stem}_parallel.ly"
+        with atomic_path(output_path) as tmp_path, open(tmp_path, "w") as f:
+            _write_parallel_music(f, content, track_bars, range(max_bars))
 
         return output_path
@@ -0,0 +1,333 @@
+"""Memory footprint estimates and admission control for concurrent pipeline runs."""
+
+import logging
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Optional
+
+from src.processors.audio_processor import MODEL_SAMPLE_RATE, ProcessorConfig
+
+MiB = 1024 * 1024
+
+# Footprint model, calibrated against the peak RSS the pipeline metrics report.
+# Memory per second of audio transcribed in one piece: decoded and resampled
+# audio, overlapping model segments, output rolls and post-processing arrays
+TRANSCRIPTION_BYTES_PER_SECOND = 1 * MiB
+# Activations of one 10 second segment in a forward pass of the network
+SEGMENT_ACTIVATION_BYTES = 320 * MiB
+# Weights of one loaded transcription model
+MODEL_BYTES = 200 * MiB
+# Interpreter, numpy and mido of a process that does not transcribe; torch adds more
+PROCESS_BASE_BYTES = 120 * MiB
+TORCH_PROCESS_BYTES = 350 * MiB
+# MIDI processing: mido messages and event table copies per note
+MIDI_BYTES_PER_NOTE = 4 * 1024
+# A lilypond process, plus its growth per engraved note
+RENDER_BASE_BYTES = 250 * MiB
+RENDER_BYTES_PER_NOTE = 16 * 1024
+
+# Notes per second of audio assumed before a recording is transcribed
+NOTES_PER_SECOND = 15
+# Length assumed for recordings whose duration is unknown before download
+UNKNOWN_DURATION_SECONDS = 1200.0
+# Bitrate assumed for compressed files whose header has no duration
+COMPRESSED_BYTES_PER_SECOND = 16000
+# Context transcribed on both sides of a chunk
+WINDOW_OVERHEAD_SECONDS = 10.0
+# Chunk length of low-memory mode, and the default chunk length of streamed runs
+LOW_MEMORY_CHUNK_SECONDS = 60.0
+STREAM_CHUNK_SECONDS = 30.0
+
+# Bytes per note of the inputs whose note count is estimated from their size
+_BYTES_PER_NOTE = {".events": 36, ".ly": 6}
+_SMF_BYTES_PER_NOTE = 8
+
+
+@dataclass
+class MemoryEstimate:
+    """Estimated peak memory of one pipeline run.
+
+    The stages run one after another, so the run's footprint is the largest stage
+    estimate rather than their sum.
+    """
+
+    stages: dict[str, int]
+    audio_seconds: Optional[float] = None
+    notes: Optional[int] = None
+
+    @property
+    def total_bytes(self) -> int:
+        return max(self.stages.values(), default=0)
+
+    def to_dict(self) -> dict:
+        return {
+            "total_bytes": self.total_bytes,
+            "stages": self.stages,
+            "audio_seconds": self.audio_seconds,
+            "notes": self.notes,
+        }
+
+
+def parse_size(text: str) -> int:
+    """Parse a memory size such as '4G', '512M' or '1048576' into bytes.
+
+    Args:
+        text: Number with an optional K, M, G or T suffix (powers of 1024)
+
+    Returns:
+        Size in bytes
+
+    Raises:
+        ValueError: If the text is not a size
+    """
+    units = {"K": 1024, "M": MiB, "G": 1024 * MiB, "T": 1024 * 1024 * MiB}
+    value = text.strip().upper().removesuffix("B").removesuffix("I")
+    factor = units.get(value[-1:], 1)
+    if factor != 1:
+        value = value[:-1]
+    try:
+        size = int(float(value) * factor)
+    except ValueError:
+        raise ValueError(f"Invalid memory size: {text!r}")
+    if size <= 0:
+        raise ValueError(f"Memory size must be positive: {text!r}")
+    return size
+
+
+def _audio_seconds(config: ProcessorConfig) -> float:
+    """Duration of the source audio, from its header where possible."""
+    if not config.audio_file:
+        return UNKNOWN_DURATION_SECONDS
+
+    from src.utils.audio_io import audio_duration
+
+    path = Path(config.source)
+    try:
+        duration = audio_duration(path, MODEL_SAMPLE_RATE)
+    except (OSError, ValueError):
+        duration = None
+    if duration is None:
+        try:
+            duration = os.path.getsize(path) / COMPRESSED_BYTES_PER_SECOND
+        except OSError:
+            duration = UNKNOWN_DURATION_SECONDS
+    return duration
+
+
+def _input_notes(path: Path) -> int:
+    """Number of notes of a MIDI, event or LilyPond input, estimated from its size."""
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return 0
+    return size // _BYTES_PER_NOTE.get(path.suffix, _SMF_BYTES_PER_NOTE)
+
+
+def process_bytes(transcribes: bool = True) -> int:
+    """Fixed memory of a pipeline process (interpreter, plus torch and a model if it transcribes)."""
+    if transcribes:
+        return PROCESS_BASE_BYTES + TORCH_PROCESS_BYTES + MODEL_BYTES
+    return PROCESS_BASE_BYTES
+
+
+def estimate_footprint(
+    config: ProcessorConfig, segments_per_pass: int = 1, transcribe_workers: int = 1
+) -> MemoryEstimate:
+    """Estimate the peak memory of running a configuration.
+
+    Args:
+        config: Pipeline configuration
+        segments_per_pass: Segments whose activations the run holds at once (its
+            transcription batch size, or 0 when a shared batcher runs the model)
+        transcribe_workers: Transcription worker processes the run starts; each
+            holds its own model and transcribes one chunk at a time
+
+    Returns:
+        Per-stage estimates in bytes. The model weights and the process itself are
+        not included, since concurrent runs in one process share them.
+    """
+    stages = {}
+    audio_seconds = None
+    if config.ly_file:
+        notes = _input_notes(Path(config.source))
+    elif config.midi_file:
+        notes = _input_notes(Path(config.source))
+        stages["midi_processing"] = notes * MIDI_BYTES_PER_NOTE
+    else:
+        audio_seconds = _audio_seconds(config)
+        notes = int(audio_seconds * NOTES_PER_SECOND)
+
+        chunk_seconds = config.chunk_seconds
+        if config.stream and not config.audio_file:
+            chunk_seconds = chunk_seconds or STREAM_CHUNK_SECONDS
+        if transcribe_workers > 1:
+            chunk_seconds = chunk_seconds or LOW_MEMORY_CHUNK_SECONDS
+        resident_seconds = audio_seconds
+        if chunk_seconds:
+            resident_seconds = min(
+                audio_seconds, chunk_seconds + WINDOW_OVERHEAD_SECONDS
+            )
+        per_process = (
+            resident_seconds * TRANSCRIPTION_BYTES_PER_SECOND
+            + segments_per_pass * SEGMENT_ACTIVATION_BYTES
+        )
+        if transcribe_workers > 1:
+            per_process += TORCH_PROCESS_BYTES + MODEL_BYTES
+        stages["transcription"] = int(max(1, transcribe_workers) * per_process)
+        stages["midi_processing"] = notes * MIDI_BYTES_PER_NOTE
+
+    if config.render and config.preview_bars:
+        stages["render"] = RENDER_BASE_BYTES
+    elif config.render:
+        processes = max(1, config.render_workers) if config.shard_bars else 1
+        stages["render"] = processes * RENDER_BASE_BYTES + notes * RENDER_BYTES_PER_NOTE
+
+    return MemoryEstimate(stages=stages, audio_seconds=audio_seconds, notes=notes)
+
+
+def low_memory_config(config: ProcessorConfig) -> ProcessorConfig:
+    """The configuration in low-memory mode: chunked transcription and one renderer.
+
+    Returns:
+        The changed configuration, or config itself if it is already low-memory
+    """
+    changes = {}
+    transcribes = not (config.ly_file or config.midi_file)
+    streamed = config.stream and not config.audio_file
+    if transcribes and not config.chunk_seconds and not streamed:
+        changes["chunk_seconds"] = LOW_MEMORY_CHUNK_SECONDS
+    if config.shard_bars and config.render_workers > 1:
+        changes["render_workers"] = 1
+    return replace(config, **changes) if changes else config
+
+
+def fit_config(
+    config: ProcessorConfig,
+    available_bytes: int,
+    limit_bytes: int,
+    segments_per_pass: int = 1,
+    transcribe_workers: int = 1,
+) -> tuple[ProcessorConfig, MemoryEstimate]:
+    """Pick the mode a configuration should run in under a memory budget.
+
+    The configuration runs as given if it fits the available memory. Otherwise it
+    is switched to low-memory mode if that fits now, or if it is too large for the
+    whole budget anyway; else it keeps its mode and waits for memory to free up.
+
+    Args:
+        config: Pipeline configuration
+        available_bytes: Budget not reserved by running jobs
+        limit_bytes: The budget available to jobs when nothing else runs
+        segments_per_pass: See estimate_footprint
+        transcribe_workers: See estimate_footprint
+
+    Returns:
+        (configuration to run, its estimate)
+    """
+    estimate = estimate_footprint(config, segments_per_pass, transcribe_workers)
+    if estimate.total_bytes <= available_bytes:
+        return config, estimate
+
+    low_memory = low_memory_config(config)
+    if low_memory is not config:
+        low_estimate = estimate_footprint(
+            low_memory, segments_per_pass, transcribe_workers
+        )
+        if (
+            low_estimate.total_bytes <= available_bytes
+            or estimate.total_bytes > limit_bytes
+        ):
+            logging.info(
+                f"Running {config.source} in low-memory mode: estimated "
+                f"{estimate.total_bytes / MiB:.0f} MB, "
+                f"{available_bytes / MiB:.0f} MB available"
+            )
+            return low_memory, low_estimate
+    return config, estimate
+
+
+class MemoryBudget:
+    """Admits memory reservations first come, first served within a byte limit.
+
+    A reservation larger than the whole budget is admitted when nothing else holds
+    memory, so it runs alone instead of waiting forever.
+    """
+
+    def __init__(self, limit_bytes: int, fixed_bytes: int = 0):
+        """Initialize the budget.
+
+        Args:
+            limit_bytes: Memory available to the reservations
+            fixed_bytes: Memory held for the lifetime of the budget (e.g. a shared
+                model), counted against the limit
+        """
+        self.limit_bytes = limit_bytes
+        self.fixed_bytes = fixed_bytes
+        self.reserved_bytes = 0
+        self._holders = 0
+        self._waiters = deque()
+        self._condition = threading.Condition()
+
+    @property
+    def available_bytes(self) -> int:
+        """Budget neither fixed nor reserved."""
+        with self._condition:
+            return max(0, self.limit_bytes - self.fixed_bytes - self.reserved_bytes)
+
+    def _fits(self, nbytes: int) -> bool:
+        if self._holders == 0:
+            return True
+        return self.fixed_bytes + self.reserved_bytes + nbytes <= self.limit_bytes
+
+    def try_reserve(self, nbytes: int) -> bool:
+        """Reserve memory if it fits now and nobody is waiting ahead."""
+        with self._condition:
+            if self._waiters or not self._fits(nbytes):
+                return False
+            self.reserved_bytes += nbytes
+            self._holders += 1
+            return True
+
+    def release(self, nbytes: int) -> None:
+        """Return a reservation made with try_reserve or reserve."""
+        with self._condition:
+            self.reserved_bytes -= nbytes
+            self._holders -= 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def reserve(self, nbytes: int):
+        """Hold a reservation for the duration of the block, waiting in line for it.
+
+        Args:
+            nbytes: Bytes to reserve
+        """
+        ticket = object()
+        with self._condition:
+            self._waiters.append(ticket)
+            try:
+                while self._waiters[0] is not ticket or not self._fits(nbytes):
+                    self._condition.wait()
+            finally:
+                self._waiters.remove(ticket)
+                self._condition.notify_all()
+            self.reserved_bytes += nbytes
+            self._holders += 1
+        try:
+            yield
+        finally:
+            self.release(nbytes)
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                "limit_bytes": self.limit_bytes,
+                "fixed_bytes": self.fixed_bytes,
+                "reserved_bytes": self.reserved_bytes,
+                "running": self._holders,
+                "waiting": len(self._waiters),
+            }
@@ -0,0 +1,179 @@
+"""Persistent MidiToLily runner for Audio Pond."""
+
+import logging
+import os
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from src.utils import metrics
+
+# Seconds an idle persistent wineserver stays alive; it is shared by every worker
+# using the same prefix, so it is not killed when one runner is done with it
+WINESERVER_LINGER = 600
+
+
+class MidiToLilyRunner:
+    """Runs MidiToLily conversions, keeping a warm wine environment between calls.
+
+    When MidiToLily runs under wine, a persistent wineserver is started for the
+    prefix and the executable is run once up front, so the prefix, the wineserver
+    and the runtime files are warm for every later conversion instead of being
+    cold-started per file. Calls run with bounded concurrency and a timeout, and
+    their stdout/stderr are captured.
+    """
+
+    def __init__(
+        self,
+        command: list[str],
+        max_concurrency: int = 2,
+        timeout: float = 300.0,
+        wine_prefix: Optional[str] = None,
+    ):
+        """Initialize the runner.
+
+        Args:
+            command: Command that runs MidiToLily, e.g. ["wine64", "src/MidiToLily.exe"]
+            max_concurrency: Maximum number of conversions running at once
+            timeout: Seconds after which a conversion is killed
+            wine_prefix: WINEPREFIX to use, or None for the environment's default
+        """
+        self.command = command
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+        self.uses_wine = os.path.basename(command[0]).startswith("wine")
+
+        self.env = os.environ.copy()
+        if wine_prefix:
+            self.env["WINEPREFIX"] = wine_prefix
+
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._start_lock = threading.Lock()
+        self._started = False
+
+    def start(self) -> None:
+        """Start the persistent wineserver and warm up MidiToLily (no-op without wine)."""
+        with self._start_lock:
+            if self._started:
+                return
+            self._started = True
+            if not self.uses_wine:
+                return
+
+            try:
+                # Keep the wineserver running between conversions; it exits by itself
+                # once it has been idle for WINESERVER_LINGER seconds
+                subprocess.run(
+                    ["wineserver", f"-p{WINESERVER_LINGER}"],
+                    env=self.env,
+                    capture_output=True,
+                    timeout=self.timeout,
+                )
+                # A first run initializes the prefix and pulls the runtime into the page cache
+                subprocess.run(
+                    self.command,
+                    env=self.env,
+                    capture_output=True,
+                    timeout=self.timeout,
+                )
+            except (OSError, subprocess.TimeoutExpired) as e:
+                logging.warning(f"Failed to warm up wine for MidiToLily: {str(e)}")
+
+    def run(self, args: list[str]) -> subprocess.CompletedProcess:
+        """Run one MidiToLily conversion.
+
+        Args:
+            args: Arguments passed to MidiToLily
+
+        Returns:
+            The completed process, with captured stdout and stderr
+
+        Raises:
+            subprocess.CalledProcessError: If MidiToLily fails
+            subprocess.TimeoutExpired: If MidiToLily does not finish within the timeout
+            FileNotFoundError: If the MidiToLily command is not found
+        """
+        self.start()
+        command = [*self.command, *args]
+        with self._slots, metrics.timed_subprocess(command):
+            return subprocess.run(
+                command,
+                env=self.env,
+                capture_output=True,
+                text=True,
+                timeout=self.timeout,
+                check=True,
+            )
+
+    def run_many(self, args_list: list[list[str]]) -> list:
+        """Run many conversions concurrently, at most max_concurrency at a time.
+
+        Args:
+            args_list: Arguments for each conversion
+
+        Returns:
+            The completed process or the raised exception for each conversion, in order
+        """
+        self.start()
+
+        def run_one(args):
+            try:
+                return self.run(args)
+            except (subprocess.SubprocessError, OSError) as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            return list(executor.map(metrics.in_current_context(run_one), args_list))
+
+    def close(self) -> None:
+        """Release the runner; a later conversion warms it up again.
+
+        The persistent wineserver is left running: other processes using the same
+        prefix may still be converting through it, and it exits by itself once it
+        has been idle for WINESERVER_LINGER seconds.
+        """
+        with self._start_lock:
+            self._started = False
+
+
+# Runners shared by all converters in this process, keyed by command and settings
+_runners = {}
+_runners_lock = threading.Lock()
+
+
+def get_runner(
+    command: list[str],
+    max_concurrency: int = 2,
+    timeout: float = 300.0,
+    wine_prefix: Optional[str] = None,
+) -> MidiToLilyRunner:
+    """Return the process-wide runner for a MidiToLily command, creating it on first use.
+
+    The runner stays warm for the life of the process.
+
+    Args:
+        command: Command that runs MidiToLily
+        max_concurrency: Maximum number of conversions running at once
+        timeout: Seconds after which a conversion is killed
+        wine_prefix: WINEPREFIX to use, or None for the environment's default
+
+    Returns:
+        The shared runner
+    """
+    key = (tuple(command), max_concurrency, timeout, wine_prefix)
+    with _runners_lock:
+        runner = _runners.get(key)
+        if runner is None:
+            runner = MidiToLilyRunner(command, max_concurrency, timeout, wine_prefix)
+            _runners[key] = runner
+    return runner
+
+
+def close_runners() -> None:
+    """Release all shared runners, when the process stops converting."""
+    with _runners_lock:
+        runners = list(_runners.values())
+        _runners.clear()
+    for runner in runners:
+        runner.close()
@@ -0,0 +1,531 @@
+"""Array-backed MIDI event table for Audio Pond."""
+
+import json
+import struct
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+from mido import Message, MetaMessage, MidiFile, MidiTrack
+from mido.midifiles.meta import UnknownMetaMessage
+
+from src.utils.workspace import atomic_path
+
+# Event types
+NOTE_OFF = 0
+NOTE_ON = 1
+CONTROL_CHANGE = 2
+SET_TEMPO = 3
+TIME_SIGNATURE = 4
+END_OF_TRACK = 5
+# Any other message; `value` indexes into EventTable.extras
+OTHER = 6
+
+# One row per MIDI message. Rows are kept in track order, and within a track in
+# file order. Field use depends on the type:
+#   note_on/note_off: note, velocity, channel
+#   control_change:   note = control number, velocity = control value, channel
+#   set_tempo:        value = microseconds per beat
+#   time_signature:   note = numerator, velocity = denominator,
+#                     value = clocks_per_click << 8 | notated_32nd_notes_per_beat
+EVENT_DTYPE = np.dtype(
+    [
+        ("tick", np.int64),
+        ("track", np.uint16),
+        ("type", np.uint8),
+        ("channel", np.uint8),
+        ("note", np.uint8),
+        ("velocity", np.uint8),
+        ("value", np.int32),
+    ]
+)
+
+# Event files (.events) hold an EventTable as a fixed header, the raw EVENT_DTYPE
+# rows (little-endian) and the extras as JSON, so they load by memory-mapping the
+# rows instead of parsing MIDI messages
+EVENT_FILE_SUFFIX = ".events"
+_EVENT_FILE_MAGIC = b"APEVENTS"
+_EVENT_FILE_VERSION = 1
+# magic, version, row size, ticks_per_beat, n_tracks, midi_type, rows, extras bytes
+_EVENT_FILE_HEADER = struct.Struct("<8sHHIHBxQI")
+_FILE_DTYPE = EVENT_DTYPE.newbyteorder("<")
+
+# Timing of the transcriber's MIDI files (piano_transcription_inference's
+# write_events_to_midi): 384 ticks per beat at 120 BPM
+TRANSCRIPTION_TICKS_PER_BEAT = 384
+TRANSCRIPTION_BEATS_PER_SECOND = 2
+
+
+class EventTable:
+    """Compact, vectorized representation of all messages in a MIDI file."""
+
+    def __init__(
+        self,
+        events: np.ndarray,
+        ticks_per_beat: int,
+        n_tracks: int,
+        midi_type: int = 1,
+        extras: Optional[list] = None,
+    ):
+        """Initialize the event table.
+
+        Args:
+            events: Structured array of EVENT_DTYPE with absolute ticks
+            ticks_per_beat: MIDI resolution
+            n_tracks: Number of tracks (tracks may be empty)
+            midi_type: MIDI file type
+            extras: Messages referenced by OTHER rows
+        """
+        self.events = events
+        self.ticks_per_beat = ticks_per_beat
+        self.n_tracks = n_tracks
+        self.midi_type = midi_type
+        self.extras = extras if extras is not None else []
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    @classmethod
+    def from_midi_file(cls, mid: MidiFile) -> "EventTable":
+        """Build an event table from a parsed MIDI file.
+
+        Args:
+            mid: The MIDI file
+
+        Returns:
+            Event table holding every message with absolute ticks
+        """
+        n = sum(len(track) for track in mid.tracks)
+        events = np.zeros(n, dtype=EVENT_DTYPE)
+        ticks = events["tick"]
+        tracks = events["track"]
+        types = events["type"]
+        channels = events["channel"]
+        notes = events["note"]
+        velocities = events["velocity"]
+        values = events["value"]
+        extras = []
+
+        i = 0
+        for track_idx, track in enumerate(mid.tracks):
+            abs_time = 0
+            for msg in track:
+                abs_time += msg.time
+                ticks[i] = abs_time
+                tracks[i] = track_idx
+                msg_type = msg.type
+                if msg_type == "note_on" or msg_type == "note_off":
+                    types[i] = NOTE_ON if msg_type == "note_on" else NOTE_OFF
+                    channels[i] = msg.channel
+                    notes[i] = msg.note
+                    velocities[i] = msg.velocity
+                elif msg_type == "control_change":
+                    types[i] = CONTROL_CHANGE
+                    channels[i] = msg.channel
+                    notes[i] = msg.control
+                    velocities[i] = msg.value
+                elif msg_type == "set_tempo":
+                    types[i] = SET_TEMPO
+                    values[i] = msg.tempo
+                elif msg_type == "time_signature":
+                    types[i] = TIME_SIGNATURE
+                    notes[i] = msg.numerator
+                    velocities[i] = msg.denominator
+                    values[i] = (
+                        msg.clocks_per_click << 8 | msg.notated_32nd_notes_per_beat
+                    )
+                elif msg_type == "end_of_track":
+                    types[i] = END_OF_TRACK
+                else:
+                    types[i] = OTHER
+                    values[i] = len(extras)
+                    extras.append(msg)
+                i += 1
+
+        return cls(
+            events,
+            ticks_per_beat=mid.ticks_per_beat,
+            n_tracks=len(mid.tracks),
+            midi_type=mid.type,
+            extras=extras,
+        )
+
+    @classmethod
+    def from_transcription(cls, note_events: list, pedal_events: list) -> "EventTable":
+        """Build the event table of a transcription without writing a MIDI file.
+
+        The result holds the same messages as the MIDI file piano_transcription_inference's
+        write_events_to_midi writes: a tempo track and a track of note_on (velocity 0
+        for note ends) and sustain pedal messages in time order.
+
+        Args:
+            note_events: Dicts with 'onset_time', 'offset_time', 'midi_note' and 'velocity'
+            pedal_events: Dicts with 'onset_time' and 'offset_time'
+
+        Returns:
+            The event table
+        """
+        n_notes = len(note_events)
+        n_pedals = len(pedal_events)
+        # Messages in write_events_to_midi's order before its stable sort by time:
+        # note onsets and offsets interleaved, then pedal presses and releases
+        times = np.empty(2 * (n_notes + n_pedals), dtype=np.float64)
+        notes = np.zeros(len(times), dtype=np.uint8)
+        values = np.zeros(len(times), dtype=np.uint8)
+        is_pedal = np.zeros(len(times), dtype=bool)
+        if n_notes:
+            times[0 : 2 * n_notes : 2] = [e["onset_time"] for e in note_events]
+            times[1 : 2 * n_notes : 2] = [e["offset_time"] for e in note_events]
+            pitches = [e["midi_note"] for e in note_events]
+            notes[0 : 2 * n_notes : 2] = pitches
+            notes[1 : 2 * n_notes : 2] = pitches
+            values[0 : 2 * n_notes : 2] = [e["velocity"] for e in note_events]
+        if n_pedals:
+            times[2 * n_notes :: 2] = [e["onset_time"] for e in pedal_events]
+            times[2 * n_notes + 1 :: 2] = [e["offset_time"] for e in pedal_events]
+            notes[2 * n_notes :] = 64
+            values[2 * n_notes :: 2] = 127
+            is_pedal[2 * n_notes :] = True
+
+        order = np.argsort(times, kind="stable")
+        ticks = (
+            times[order]
+            * (TRANSCRIPTION_TICKS_PER_BEAT * TRANSCRIPTION_BEATS_PER_SECOND)
+        ).astype(np.int64)
+        keep = ticks >= 0
+        order = order[keep]
+        ticks = ticks[keep]
+
+        n = len(ticks)
+        events = np.zeros(3 + n + 1, dtype=EVENT_DTYPE)
+        # Track 0: tempo, 4/4 time signature and end of track one tick later
+        events["type"][:3] = (SET_TEMPO, TIME_SIGNATURE, END_OF_TRACK)
+        events["value"][0] = 1_000_000 // TRANSCRIPTION_BEATS_PER_SECOND
+        events["note"][1] = 4
+        events["velocity"][1] = 4
+        events["value"][1] = 24 << 8 | 8
+        events["tick"][2] = 1
+        # Track 1: notes and pedals, then end of track one tick after the last one
+        rows = events[3 : 3 + n]
+        rows["tick"] = ticks
+        rows["type"] = np.where(is_pedal[order], CONTROL_CHANGE, NOTE_ON)
+        rows["note"] = notes[order]
+        rows["velocity"] = values[order]
+        events["track"][3:] = 1
+        events["type"][-1] = END_OF_TRACK
+        events["tick"][-1] = (ticks[-1] if n else 0) + 1
+
+        return cls(
+            events,
+            ticks_per_beat=TRANSCRIPTION_TICKS_PER_BEAT,
+            n_tracks=2,
+            midi_type=1,
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> "EventTable":
+        """Load an event file, memory-mapping its rows.
+
+        The rows are read-only; the table methods return modified copies.
+
+        Args:
+            path: Path to the .events file
+
+        Returns:
+            The event table
+
+        Raises:
+            ValueError: If the file is not an event file of this version
+        """
+        with open(path, "rb") as f:
+            header = f.read(_EVENT_FILE_HEADER.size)
+            if len(header) < _EVENT_FILE_HEADER.size:
+                raise ValueError(f"Not an event file: {path}")
+            (
+                magic,
+                version,
+                row_size,
+                ticks_per_beat,
+                n_tracks,
+                midi_type,
+                n_events,
+                extras_size,
+            ) = _EVENT_FILE_HEADER.unpack(header)
+            if magic != _EVENT_FILE_MAGIC:
+                raise ValueError(f"Not an event file: {path}")
+            if version != _EVENT_FILE_VERSION or row_size != _FILE_DTYPE.itemsize:
+                raise ValueError(f"Unsupported event file version {version}: {path}")
+
+            f.seek(_EVENT_FILE_HEADER.size + n_events * row_size)
+            extras = [_message_from_dict(d) for d in json.loads(f.read(extras_size))]
+
+        if n_events:
+            events = np.memmap(
+                path,
+                dtype=_FILE_DTYPE,
+                mode="r",
+                offset=_EVENT_FILE_HEADER.size,
+                shape=(n_events,),
+            )
+        else:
+            events = np.zeros(0, dtype=EVENT_DTYPE)
+        return cls(
+            events,
+            ticks_per_beat=ticks_per_beat,
+            n_tracks=n_tracks,
+            midi_type=midi_type,
+            extras=extras,
+        )
+
+    def save(self, path: Path) -> Path:
+        """Write the table to an event file, atomically.
+
+        Args:
+            path: Path of the .events file
+
+        Returns:
+            The path
+        """
+        extras = json.dumps([_message_to_dict(msg) for msg in self.extras]).encode()
+        header = _EVENT_FILE_HEADER.pack(
+            _EVENT_FILE_MAGIC,
+            _EVENT_FILE_VERSION,
+            _FILE_DTYPE.itemsize,
+            self.ticks_per_beat,
+            self.n_tracks,
+            self.midi_type,
+            len(self.events),
+            len(extras),
+        )
+        with atomic_path(path) as tmp_path, open(tmp_path, "wb") as f:
+            f.write(header)
+            f.write(np.ascontiguousarray(self.events, dtype=_FILE_DTYPE).tobytes())
+            f.write(extras)
+        return path
+
+    def to_midi_file(self) -> MidiFile:
+        """Convert the event table back into a MIDI file with delta times.
+
+        Returns:
+            The MIDI file
+        """
+        mid = MidiFile(type=self.midi_type, ticks_per_beat=self.ticks_per_beat)
+        mid.tracks = [MidiTrack() for _ in range(self.n_tracks)]
+
+        events = self.events
+        deltas = self._deltas(events["tick"], events["track"])
+        columns = zip(
+            deltas.tolist(),
+            events["track"].tolist(),
+            events["type"].tolist(),
+            events["channel"].tolist(),
+            events["note"].tolist(),
+            events["velocity"].tolist(),
+            events["value"].tolist(),
+        )
+        for delta, track, event_type, channel, note, velocity, value in columns:
+            if event_type == NOTE_ON:
+                msg = Message(
+                    "note_on", channel=channel, note=note, velocity=velocity, time=delta
+                )
+            elif event_type == NOTE_OFF:
+                msg = Message(
+                    "note_off",
+                    channel=channel,
+                    note=note,
+                    velocity=velocity,
+                    time=delta,
+                )
+            elif event_type == CONTROL_CHANGE:
+                msg = Message(
+                    "control_change",
+                    channel=channel,
+                    control=note,
+                    value=velocity,
+                    time=delta,
+                )
+            elif event_type == SET_TEMPO:
+                msg = MetaMessage("set_tempo", tempo=value, time=delta)
+            elif event_type == TIME_SIGNATURE:
+                msg = MetaMessage(
+                    "time_signature",
+                    numerator=note,
+                    denominator=velocity,
+                    clocks_per_click=value >> 8,
+                    notated_32nd_notes_per_beat=value & 0xFF,
+                    time=delta,
+                )
+            elif event_type == END_OF_TRACK:
+                msg = MetaMessage("end_of_track", time=delta)
+            else:
+                msg = self.extras[value].copy(time=delta)
+            mid.tracks[track].append(msg)
+
+        return mid
+
+    @staticmethod
+    def _deltas(ticks: np.ndarray, tracks: np.ndarray) -> np.ndarray:
+        """Delta times within each track for rows sorted by track."""
+        deltas = np.diff(ticks, prepend=0)
+        if len(ticks):
+            # The first event of each track is relative to tick 0
+            starts = np.flatnonzero(np.diff(tracks, prepend=-1) != 0)
+            deltas[starts] = ticks[starts]
+        return deltas
+
+    @staticmethod
+    def _cumsum_by_track(deltas: np.ndarray, tracks: np.ndarray) -> np.ndarray:
+        """Absolute ticks from per-track delta times for rows sorted by track."""
+        ticks = np.cumsum(deltas)
+        if len(ticks):
+            starts = np.flatnonzero(np.diff(tracks, prepend=-1) != 0)
+            lengths = np.diff(np.append(starts, len(ticks)))
+            ticks -= np.repeat(ticks[starts] - deltas[starts], lengths)
+        return ticks
+
+    def _with_events(self, events: np.ndarray, **kwargs) -> "EventTable":
+        """Copy of this table with different events."""
+        return EventTable(
+            events,
+            ticks_per_beat=kwargs.get("ticks_per_beat", self.ticks_per_beat),
+            n_tracks=kwargs.get("n_tracks", self.n_tracks),
+            midi_type=kwargs.get("midi_type", self.midi_type),
+            extras=kwargs.get("extras", self.extras),
+        )
+
+    def first_note_tick(self) -> Optional[int]:
+        """Tick of the earliest note_on with a non-zero velocity, or None if there are no notes."""
+        events = self.events
+        mask = (events["type"] == NOTE_ON) & (events["velocity"] > 0)
+        if not mask.any():
+            return None
+        return int(events["tick"][mask].min())
+
+    def trimmed(self, offset: Optional[int] = None) -> "EventTable":
+        """Shift all events earlier by offset ticks, clamping at tick 0.
+
+        Args:
+            offset: Ticks to remove, or None to trim up to the first note
+
+        Returns:
+            The trimmed event table
+        """
+        if offset is None:
+            offset = self.first_note_tick() or 0
+        events = self.events.copy()
+        events["tick"] = np.maximum(events["tick"] - offset, 0)
+        return self._with_events(events)
+
+    def scaled(self, scale_factor: float) -> "EventTable":
+        """Scale event times by scale_factor and tempos by its inverse.
+
+        Delta times are scaled and truncated per message, and set_tempo messages keep
+        their delta time, matching message-by-message scaling of the MIDI file.
+
+        Args:
+            scale_factor: Time scale factor
+
+        Returns:
+            The scaled event table
+        """
+        events = self.events.copy()
+        is_tempo = events["type"] == SET_TEMPO
+        deltas = self._deltas(events["tick"], events["track"])
+        scaled_deltas = np.where(
+            is_tempo, deltas, (deltas * scale_factor).astype(np.int64)
+        )
+        events["tick"] = self._cumsum_by_track(scaled_deltas, events["track"])
+        # Tempo is in microseconds per beat
+        events["value"] = np.where(
+            is_tempo,
+            (events["value"] / scale_factor).astype(np.int64),
+            events["value"],
+        )
+        return self._with_events(events)
+
+    def split(
+        self, threshold: int, track_names: tuple[str, str] = ("Upper", "Lower")
+    ) -> "EventTable":
+        """Merge all tracks and split the notes into an upper and a lower track.
+
+        The result has an empty first track followed by the upper track (notes at or
+        above threshold, channel 0) and the lower track (notes below, channel 1). Both
+        get all tempo and time signature events; other messages are dropped.
+
+        Args:
+            threshold: Lowest MIDI note of the upper track
+            track_names: Names of the upper and lower tracks
+
+        Returns:
+            The split event table
+        """
+        events = self.events
+        types = events["type"]
+        is_note = (types == NOTE_ON) | (types == NOTE_OFF)
+        is_shared = (types == SET_TEMPO) | (types == TIME_SIGNATURE)
+        is_upper = is_note & (events["note"] >= threshold)
+        is_lower = is_note & (events["note"] < threshold)
+
+        extras = [MetaMessage("track_name", name=name, time=0) for name in track_names]
+        parts = []
+        for track_idx, (mask, channel) in enumerate(
+            ((is_shared | is_upper, 0), (is_shared | is_lower, 1)), start=1
+        ):
+            selected = events[mask]
+            # Stable sort keeps the original order of simultaneous events
+            selected = selected[np.argsort(selected["tick"], kind="stable")]
+            selected["track"] = track_idx
+            selected["channel"][selected["type"] <= NOTE_ON] = channel
+
+            name = np.zeros(1, dtype=EVENT_DTYPE)
+            name["track"] = track_idx
+            name["type"] = OTHER
+            name["value"] = track_idx - 1
+
+            end = np.zeros(1, dtype=EVENT_DTYPE)
+            end["track"] = track_idx
+            end["type"] = END_OF_TRACK
+            end["tick"] = selected["tick"][-1] if len(selected) else 0
+
+            parts.extend([name, selected, end])
+
+        return self._with_events(
+            np.concatenate(parts), n_tracks=3, midi_type=1, extras=extras
+        )
+
+
+def _message_to_dict(msg) -> dict:
+    """JSON-serializable form of an extra message."""
+    data = msg.dict()
+    data["meta"] = msg.is_meta
+    if "data" in data:
+        data["data"] = list(data["data"])
+    return data
+
+
+def _message_from_dict(data: dict):
+    """Extra message from its _message_to_dict form."""
+    data = dict(data)
+    meta = data.pop("meta")
+    if data["type"] == "unknown_meta":
+        return UnknownMetaMessage(data["type_byte"], data["data"], time=data["time"])
+    return MetaMessage.from_dict(data) if meta else Message.from_dict(data)
+
+
+def is_event_file(path: Union[Path, str]) -> bool:
+    """Whether a path names an event file rather than a Standard MIDI File."""
+    return Path(path).suffix == EVENT_FILE_SUFFIX
+
+
+def load_event_table(path: Path) -> EventTable:
+    """Load an event file or a Standard MIDI File into an event table.
+
+    Args:
+        path: Path to a .events file or a MIDI file
+
+    Returns:
+        The event table
+    """
+    if is_event_file(path):
+        return EventTable.load(path)
+    return EventTable.from_midi_file(MidiFile(str(path)))
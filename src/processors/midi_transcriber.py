@@ -1,45 +1,511 @@
 """MIDI transcriber for Audio Pond."""
 
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-import librosa
-from piano_transcription_inference import PianoTranscription, sample_rate
-from src.utils.gpu_utils import check_gpu
+from typing import TYPE_CHECKING, Iterator, Optional
+import numpy as np
+import torch
+from piano_transcription_inference import sample_rate
+from piano_transcription_inference.config import begin_note
+from piano_transcription_inference.utilities import RegressionPostProcessor
+from src.processors.midi_events import EVENT_FILE_SUFFIX, EventTable
+from src.utils.gpu_utils import check_gpu, configure_cpu_threads
+from src.utils import metrics, model_registry
+from src.utils.checkpoint_store import default_store
+from src.utils.activity import find_active_spans
+from src.utils.inference_backends import BACKENDS
+from src.utils.audio_io import (
+    AudioWindow,
+    audio_duration,
+    iter_audio_blocks,
+    iter_windows,
+    load_audio,
+)
+from src.utils.note_stitching import PEDAL, NoteStitcher
+
+if TYPE_CHECKING:
+    from src.processors.transcription_batcher import TranscriptionBatcher
+
+# Context transcribed on each side of a chunk so notes at its edges are detected reliably
+CHUNK_OVERLAP_SECONDS = 5.0
+
+# Chunk length used when parallel workers are requested without an explicit chunk length
+DEFAULT_PARALLEL_CHUNK_SECONDS = 60.0
+
+# Chunk length of streamed transcription; shorter chunks start transcribing sooner
+DEFAULT_STREAM_CHUNK_SECONDS = 30.0
+
+# Post-processing thresholds, as used by PianoTranscription.transcribe
+ONSET_THRESHOLD = 0.3
+OFFSET_THRESHOLD = 0.3
+FRAME_THRESHOLD = 0.1
+PEDAL_OFFSET_THRESHOLD = 0.2
+# Pedal frame threshold of RegressionPostProcessor.output_dict_to_detected_pedals
+PEDAL_FRAME_THRESHOLD = 0.5
 
 
 class MidiTranscriber:
     """Handles audio to MIDI transcription."""
 
-    def __init__(self, output_dir: Path):
+    # Sample rate the transcription model expects
+    sample_rate = sample_rate
+
+    def __init__(
+        self,
+        output_dir: Path,
+        checkpoint_path: Optional[str] = None,
+        preload: bool = True,
+        batch_size: int = 1,
+        workers: int = 1,
+        cpu_threads: Optional[int] = None,
+        interop_threads: Optional[int] = None,
+        batcher: Optional["TranscriptionBatcher"] = None,
+        backend: str = "eager",
+        skip_inactive: bool = False,
+    ):
         """Initialize the MIDI transcriber.
 
         Args:
             output_dir: Directory for output files
+            checkpoint_path: Path to the model checkpoint, or None for the checkpoint store's default
+            preload: Load and warm up the transcription model now instead of on first use
+            batch_size: Number of 10 second model segments per forward pass
+            workers: Number of processes transcribing chunks in parallel (CPU only)
+            cpu_threads: Intra-op threads per process, or None for the torch default
+                (divided between workers in parallel mode)
+            interop_threads: Inter-op threads per process, or None for the torch default
+            batcher: Shared batcher that runs the model passes of many transcribers
+                together, or None to run them in this transcriber
+            backend: Inference backend of the network ('eager', 'int8', 'torchscript'
+                or 'onnx', see src.utils.inference_backends)
+            skip_inactive: Run the network only on the regions an energy/onset pre-pass
+                finds active, skipping silence, noise and applause
         """
+        if backend not in BACKENDS:
+            raise ValueError(
+                f"Unknown inference backend {backend!r}; expected one of {BACKENDS}"
+            )
         self.output_dir = output_dir
+        self.checkpoint_path = checkpoint_path
+        self.batch_size = max(1, batch_size)
+        self.workers = max(1, workers)
+        self.cpu_threads = cpu_threads
+        self.interop_threads = interop_threads
+        self.batcher = batcher
+        self.backend = backend
+        self.skip_inactive = skip_inactive
+        self.last_throughput = None
+        self._pool = None
 
         # Check GPU for transcription
         gpu_available = check_gpu()
         self.device = "cuda" if gpu_available else "cpu"
 
-    def transcribe_audio(self, audio_path: Path) -> Path:
+        if self.workers > 1 and batcher is not None:
+            logging.warning(
+                "Parallel transcription workers do not use the batcher; using 1 worker"
+            )
+            self.workers = 1
+
+        if self.workers > 1 and self.device != "cpu":
+            logging.warning(
+                "Parallel transcription workers are CPU only; using 1 worker"
+            )
+            self.workers = 1
+
+        if self.device == "cpu" and self.workers == 1:
+            configure_cpu_threads(cpu_threads, interop_threads)
+
+        # In parallel mode the workers hold the models, not this process
+        if preload and self.workers == 1:
+            model_registry.preload(
+                self.device, self.checkpoint_path, self.backend, self.batch_size
+            )
+
+    @property
+    def transcriptor(self):
+        """The process-wide transcription model for this device and checkpoint."""
+        return model_registry.get_model(self.device, self.checkpoint_path)
+
+    def transcribe_audio(
+        self, audio_path: Path, chunk_seconds: Optional[float] = None
+    ) -> Path:
         """Transcribe audio to MIDI using Piano Transcription Inference.
 
         Args:
-            audio_path: Path to the input audio file
+            audio_path: Path to the input audio file, or a .npy file of mono audio at the
+                model sample rate (memory-mapped instead of decoded)
+            chunk_seconds: Transcribe in overlapping windows of this length to bound memory use,
+                or None to transcribe the whole file at once
 
         Returns:
-            Path to the transcribed MIDI file
+            Path to the transcription event file (see EventTable.load)
         """
+        if self.workers > 1:
+            return self.transcribe_audio_chunked(
+                audio_path, chunk_seconds or DEFAULT_PARALLEL_CHUNK_SECONDS
+            )
+        if chunk_seconds:
+            return self.transcribe_audio_chunked(audio_path, chunk_seconds)
+
+        start = time.perf_counter()
+
         # Load audio
-        audio, _ = librosa.load(path=audio_path, sr=sample_rate, mono=True)
+        audio = load_audio(audio_path, sample_rate)
+
+        # Transcribe and write out the note events
+        note_events, pedal_events = self._infer(audio)
+        self._report_throughput(len(audio) / sample_rate, time.perf_counter() - start)
+        return self._write_events(note_events, pedal_events)
+
+    def transcribe_audio_chunked(self, audio_path: Path, chunk_seconds: float) -> Path:
+        """Transcribe audio to MIDI in overlapping windows with bounded memory use.
+
+        The audio is read and resampled incrementally, so only about one window is held
+        in memory no matter how long the recording is. Notes are stitched across window
+        boundaries without duplicating or splitting them. With several workers the
+        windows are transcribed in parallel processes and stitched in order, giving the
+        same notes as transcribing them one after another.
+
+        Args:
+            audio_path: Path to the input audio file
+            chunk_seconds: Length of the audio each window owns
+
+        Returns:
+            Path to the transcription event file (see EventTable.load)
+        """
+        return self.transcribe_stream(
+            iter_audio_blocks(audio_path, sample_rate),
+            chunk_seconds=chunk_seconds,
+            total_seconds=audio_duration(audio_path, sample_rate),
+        )
+
+    def transcribe_stream(
+        self,
+        blocks: Iterator[np.ndarray],
+        chunk_seconds: Optional[float] = None,
+        total_seconds: Optional[float] = None,
+    ) -> Path:
+        """Transcribe audio to MIDI while it is still arriving.
+
+        Windows are transcribed as soon as the blocks covering them have arrived,
+        so transcription of early audio overlaps downloading and decoding later audio.
+
+        Args:
+            blocks: Iterator over mono audio blocks at the model sample rate
+            chunk_seconds: Length of the audio each window owns
+            total_seconds: Length of the recording for progress reporting, if known
+
+        Returns:
+            Path to the transcription event file (see EventTable.load)
+        """
+        start = time.perf_counter()
+        windows = iter_windows(
+            iter(blocks),
+            sample_rate,
+            chunk_seconds or DEFAULT_STREAM_CHUNK_SECONDS,
+            CHUNK_OVERLAP_SECONDS,
+        )
+        try:
+            note_events, pedal_events, audio_seconds = self._transcribe_windows(
+                windows, total_seconds=total_seconds
+            )
+        finally:
+            # Stop the producer (e.g. a download) if transcription failed part way
+            close = getattr(blocks, "close", None)
+            if close is not None:
+                close()
+        self._report_throughput(audio_seconds, time.perf_counter() - start)
+        return self._write_events(note_events, pedal_events)
+
+    def close(self) -> None:
+        """Shut down the parallel worker processes, if any were started."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _write_events(self, note_events: list, pedal_events: list) -> Path:
+        """Write transcribed events to the transcription event file.
+
+        The event file holds the messages write_events_to_midi would write, and
+        later stages memory-map it instead of parsing MIDI.
+        """
+        metrics.count("notes", len(note_events))
+        metrics.count("pedals", len(pedal_events))
+        events_output_path = self.output_dir / f"2_transcription{EVENT_FILE_SUFFIX}"
+        return EventTable.from_transcription(note_events, pedal_events).save(
+            events_output_path
+        )
+
+    def _report_throughput(self, audio_seconds: float, wall_seconds: float) -> None:
+        """Log and remember how fast the last transcription ran."""
+        speed = audio_seconds / wall_seconds if wall_seconds > 0 else 0.0
+        metrics.count("audio_seconds", audio_seconds)
+        self.last_throughput = {
+            "audio_seconds": audio_seconds,
+            "wall_seconds": wall_seconds,
+            "audio_seconds_per_second": speed,
+            "workers": self.workers,
+            "batch_size": self.batch_size,
+            "backend": self.backend,
+            "cpu_threads": (
+                torch.get_num_threads() if self.workers == 1 else self.cpu_threads
+            ),
+        }
+        logging.info(
+            f"Transcribed {audio_seconds:.1f}s of audio in {wall_seconds:.1f}s "
+            f"({speed:.2f} audio-seconds per second)"
+        )
+
+    def _transcribe_windows(
+        self, windows: Iterator[AudioWindow], total_seconds: Optional[float] = None
+    ) -> tuple[list, list, float]:
+        """Transcribe audio windows and stitch their events together in window order.
+
+        Args:
+            windows: Iterator over audio windows
+            total_seconds: Length of the recording for progress reporting, if known
+
+        Returns:
+            (note_events, pedal_events, audio_seconds) with events on the timeline of
+            the whole recording
+        """
+        stitcher = NoteStitcher()
+        audio_seconds = 0.0
+        for i, (window, (note_events, pedal_events, sounding)) in enumerate(
+            self._iter_window_results(windows), start=1
+        ):
+            stitcher.add(window, note_events, pedal_events, sounding)
+            audio_seconds = window.core_end
+
+            progress = f"{window.core_end:.0f}s"
+            if total_seconds:
+                progress += f" / {total_seconds:.0f}s"
+            logging.info(f"Transcribed chunk {i} ({progress})")
+
+        return (*stitcher.finish(), audio_seconds)
+
+    def _iter_window_results(self, windows: Iterator[AudioWindow]):
+        """Yield (window, events) pairs in window order, in this process or in the worker pool."""
+        if self.workers == 1:
+            for window in windows:
+                yield window, self._infer_window(window.audio)
+            return
+
+        if self._pool is None:
+            threads = self.cpu_threads or max(1, (os.cpu_count() or 1) // self.workers)
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                # Resolve and verify the checkpoint once here; the workers map the file
+                initargs=(
+                    self.checkpoint_path or str(default_store().resolve()),
+                    self.batch_size,
+                    threads,
+                    self.interop_threads,
+                    self.backend,
+                    self.skip_inactive,
+                ),
+            )
+
+        # Keep a bounded number of windows in flight so memory stays bounded
+        in_flight = deque()
+        for window in windows:
+            in_flight.append((window, self._pool.submit(_infer_worker, window.audio)))
+            if len(in_flight) >= 2 * self.workers:
+                window, future = in_flight.popleft()
+                yield window, future.result()
+        while in_flight:
+            window, future = in_flight.popleft()
+            yield window, future.result()
+
+    def _infer(self, audio: np.ndarray) -> tuple[list, list]:
+        """Transcribe a mono audio array into note and pedal events.
+
+        With skip_inactive set, only the active regions of the audio are run through
+        the network, and their events are shifted back onto the audio's timeline.
+
+        Args:
+            audio: Mono audio at the model sample rate
+
+        Returns:
+            (note_events, pedal_events) with times relative to the start of the audio
+        """
+        note_events, pedal_events, _ = self._infer_window(audio)
+        return note_events, pedal_events
+
+    def _infer_window(self, audio: np.ndarray) -> tuple[list, list, dict]:
+        """Transcribe one window of audio, also reporting what sounds from its start.
+
+        Args:
+            audio: Mono audio at the model sample rate
+
+        Returns:
+            (note_events, pedal_events, sounding) with times relative to the start of
+            the audio; sounding maps each pitch (and PEDAL) that sounds at the start
+            to the seconds it keeps sounding without a break
+        """
+        if not self.skip_inactive:
+            return self._infer_span(audio)
+
+        spans = find_active_spans(audio, sample_rate)
+        active = sum(end - start for start, end in spans)
+        skipped_seconds = (len(audio) - active) / sample_rate
+        metrics.count("skipped_seconds", skipped_seconds)
+        if spans == [(0, len(audio))]:
+            return self._infer_span(audio)
+        logging.info(
+            f"Skipping {skipped_seconds:.1f}s of {len(audio) / sample_rate:.1f}s "
+            f"inactive audio ({len(spans)} active regions)"
+        )
+
+        note_events, pedal_events, sounding = [], [], {}
+        for start, end in spans:
+            span_notes, span_pedals, span_sounding = self._infer_span(audio[start:end])
+            if start == 0:
+                sounding = span_sounding
+            offset = start / sample_rate
+            for event in span_notes + span_pedals:
+                event["onset_time"] += offset
+                event["offset_time"] += offset
+            note_events.extend(span_notes)
+            pedal_events.extend(span_pedals)
+        return note_events, pedal_events, sounding
+
+    def _infer_span(self, audio: np.ndarray) -> tuple[list, list, dict]:
+        """Run the network over a mono audio array and decode note and pedal events.
+
+        This follows PianoTranscription.transcribe, with a configurable batch size.
+
+        Args:
+            audio: Mono audio at the model sample rate
+
+        Returns:
+            (note_events, pedal_events, sounding), see _infer_window
+        """
+        segments = self._segments(audio)
+        if self.batcher is not None:
+            output_dict = self.batcher.forward(segments)
+        else:
+            output_dict = self._forward(segments)
+        return self._events(output_dict, len(audio))
+
+    def _segments(self, audio: np.ndarray) -> np.ndarray:
+        """Pad mono audio and cut it into overlapping model segments.
+
+        Args:
+            audio: Mono audio at the model sample rate
+
+        Returns:
+            Array of shape (segments, segment_samples)
+        """
+        transcriptor = self.transcriptor
+        segment_samples = transcriptor.segment_samples
+
+        audio = audio[None, :]
+        audio_len = audio.shape[1]
+        pad_len = (
+            int(np.ceil(audio_len / segment_samples)) * segment_samples - audio_len
+        )
+        audio = np.concatenate((audio, np.zeros((1, pad_len))), axis=1)
+
+        # Overlapping 10 second segments
+        return transcriptor.enframe(audio, segment_samples)
+
+    def _events(self, output_dict: dict, audio_len: int) -> tuple[list, list, dict]:
+        """Turn model outputs for the segments of some audio into note and pedal events.
+
+        Args:
+            output_dict: Model outputs for the audio's segments, from _forward
+            audio_len: Length of the audio in samples
+
+        Returns:
+            (note_events, pedal_events, sounding), see _infer_window
+        """
+        transcriptor = self.transcriptor
+        for key in output_dict.keys():
+            output_dict[key] = transcriptor.deframe(output_dict[key])[0:audio_len]
+
+        # What sounds from the start of the audio, for stitching held notes
+        sounding = {}
+        frames_per_second = transcriptor.frames_per_second
+        note_runs = _leading_runs(output_dict["frame_output"] > FRAME_THRESHOLD)
+        for pitch in np.flatnonzero(note_runs):
+            sounding[begin_note + int(pitch)] = note_runs[pitch] / frames_per_second
+        pedal_runs = _leading_runs(
+            output_dict["pedal_frame_output"] > PEDAL_FRAME_THRESHOLD
+        )
+        if pedal_runs[0]:
+            sounding[PEDAL] = pedal_runs[0] / frames_per_second
+
+        post_processor = RegressionPostProcessor(
+            transcriptor.frames_per_second,
+            classes_num=transcriptor.classes_num,
+            onset_threshold=ONSET_THRESHOLD,
+            offset_threshold=OFFSET_THRESHOLD,
+            frame_threshold=FRAME_THRESHOLD,
+            pedal_offset_threshold=PEDAL_OFFSET_THRESHOLD,
+        )
+        return (*post_processor.output_dict_to_midi_events(output_dict), sounding)
+
+    def _forward(self, segments: np.ndarray) -> dict:
+        """Run the model over audio segments in batches.
+
+        Args:
+            segments: Array of shape (segments, segment_samples)
+
+        Returns:
+            Model outputs concatenated over all segments
+        """
+        runner = model_registry.get_runner(
+            self.device, self.checkpoint_path, self.backend, self.batch_size
+        )
+
+        outputs = {}
+        for start in range(0, len(segments), self.batch_size):
+            for key, value in runner(segments[start : start + self.batch_size]).items():
+                outputs.setdefault(key, []).append(value)
+
+        return {key: np.concatenate(values, axis=0) for key, values in outputs.items()}
+
+
+def _leading_runs(active: np.ndarray) -> np.ndarray:
+    """Number of active frames at the start of each column of a (frames, columns) roll."""
+    active = active.reshape(len(active), -1)
+    return np.where(active.all(axis=0), len(active), np.argmin(active, axis=0))
+
+
+# Transcriber used by parallel worker processes, set up once by the pool initializer
+_worker_transcriber = None
+
 
-        # Transcriptor
-        transcriptor = PianoTranscription(
-            device=self.device, checkpoint_path=None
-        )  # device: 'cuda' | 'cpu'
+def _init_worker(
+    checkpoint_path: Optional[str],
+    batch_size: int,
+    cpu_threads: int,
+    interop_threads: Optional[int],
+    backend: str,
+    skip_inactive: bool,
+) -> None:
+    """Configure threads and load one warm model into this worker process."""
+    global _worker_transcriber
+    _worker_transcriber = MidiTranscriber(
+        output_dir=None,
+        checkpoint_path=checkpoint_path,
+        batch_size=batch_size,
+        cpu_threads=cpu_threads,
+        interop_threads=interop_threads,
+        backend=backend,
+        skip_inactive=skip_inactive,
+    )
 
-        midi_output_path = self.output_dir / "2_transcription.midi"
 
-        # Transcribe and write out to MIDI file
-        transcriptor.transcribe(audio, str(midi_output_path))
-        return midi_output_path
+def _infer_worker(audio: np.ndarray) -> tuple[list, list, dict]:
+    """Transcribe one window in a worker process."""
+    return _worker_transcriber._infer_window(audio)
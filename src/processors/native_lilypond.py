@@ -0,0 +1,403 @@
+"""Native MIDI to LilyPond conversion for Audio Pond."""
+
+import re
+import textwrap
+from typing import Optional
+
+import numpy as np
+
+from src.processors.midi_events import EventTable, NOTE_OFF, NOTE_ON, SET_TEMPO
+
+# Position of each major key on the circle of fifths (negative = flats)
+_MAJOR_KEY_FIFTHS = {
+    "c": 0, "g": 1, "d": 2, "a": 3, "e": 4, "b": 5, "fs": 6, "cs": 7,
+    "f": -1, "bf": -2, "ef": -3, "af": -4, "df": -5, "gf": -6, "cf": -7,
+}  # fmt: skip
+
+_SHARP_NAMES = ["c", "cs", "d", "ds", "e", "f", "fs", "g", "gs", "a", "as", "b"]
+_FLAT_NAMES = ["c", "df", "d", "ef", "e", "f", "gf", "g", "af", "a", "bf", "b"]
+
+_SPEC_ITEM = re.compile(r"^\s*(\d+)\s*=\s*(\S+)\s*$")
+
+# MIDI tracks that make up the upper and lower staff (as MidiToLily's "-staves 1,2")
+STAFF_TRACKS = (1, 2)
+
+
+def _parse_spec(spec: str, name: str) -> list[tuple[int, str]]:
+    """Parse a comma-separated "M=value" list into (measure, value) pairs sorted by measure."""
+    items = []
+    for part in spec.split(","):
+        match = _SPEC_ITEM.match(part)
+        if not match or int(match.group(1)) < 1:
+            raise ValueError(f"Invalid {name} specification: {spec}")
+        items.append((int(match.group(1)), match.group(2)))
+    return sorted(items)
+
+
+def parse_time_spec(spec: str) -> dict[int, tuple[int, int]]:
+    """Parse a time signature specification such as "1=4/4,17=3/4".
+
+    Args:
+        spec: Comma-separated list of M=n/d items (M is a one-based measure number)
+
+    Returns:
+        Mapping from measure number to (numerator, denominator)
+    """
+    signatures = {}
+    for measure, value in _parse_spec(spec, "time signature"):
+        match = re.match(r"^(\d+)/(\d+)$", value)
+        if not match:
+            raise ValueError(f"Invalid time signature: {value}")
+        numerator, denominator = int(match.group(1)), int(match.group(2))
+        if numerator < 1 or denominator & (denominator - 1) or denominator < 1:
+            raise ValueError(f"Invalid time signature: {value}")
+        signatures[measure] = (numerator, denominator)
+    return signatures
+
+
+def parse_key_spec(spec: str) -> dict[int, tuple[str, bool]]:
+    """Parse a key signature specification such as "1=g,28=c" or "1=am".
+
+    Args:
+        spec: Comma-separated list of M=k items, k a LilyPond (english) note name,
+            optionally followed by 'm' for minor
+
+    Returns:
+        Mapping from measure number to (tonic, is_minor)
+    """
+    keys = {}
+    for measure, value in _parse_spec(spec, "key signature"):
+        value = value.lower()
+        minor = len(value) > 1 and value.endswith("m")
+        tonic = value[:-1] if minor else value
+        if (
+            tonic not in _SHARP_NAMES
+            and tonic not in _FLAT_NAMES
+            and tonic
+            not in (
+                "cf",
+                "gf",
+            )
+        ):
+            raise ValueError(f"Invalid key signature: {value}")
+        keys[measure] = (tonic, minor)
+    return keys
+
+
+# Quantization values the native converter supports: plain note durations. Dotted
+# and tuplet quantization is left to MidiToLily, which can write tuplets.
+SUPPORTED_QUANTS = ("1", "2", "4", "8", "16", "32", "64", "128")
+
+
+def parse_quant(quant: str) -> int:
+    """Parse a quantization value (1=whole, 2=half, 4=quarter, etc.).
+
+    Only the plain durations in SUPPORTED_QUANTS are supported; dotted and tuplet
+    quantization values, which MidiToLily also accepts, are rejected.
+
+    Args:
+        quant: Quantization specification
+
+    Returns:
+        Number of grid units per whole note
+
+    Raises:
+        ValueError: If the value is not one of SUPPORTED_QUANTS
+    """
+    if quant.strip() not in SUPPORTED_QUANTS:
+        raise ValueError(
+            f"Unsupported quantization for the native converter: {quant!r}. It supports "
+            f"{', '.join(SUPPORTED_QUANTS)}; use --converter midi2lily for dotted or "
+            "tuplet quantization"
+        )
+    return int(quant)
+
+
+def _key_fifths(tonic: str, minor: bool) -> int:
+    """Circle of fifths position of a key (negative = flats)."""
+    if minor:
+        # Relative major is a minor third up
+        pitch_class = (_pitch_class(tonic) + 3) % 12
+        major = min(
+            (name for name, fifths in _MAJOR_KEY_FIFTHS.items()
+             if _pitch_class(name) == pitch_class),
+            key=lambda name: abs(_MAJOR_KEY_FIFTHS[name]),
+        )  # fmt: skip
+        return _MAJOR_KEY_FIFTHS[major]
+    if tonic in _MAJOR_KEY_FIFTHS:
+        return _MAJOR_KEY_FIFTHS[tonic]
+    # Enharmonic keys not on the table (e.g. "as" major) are spelled like their equivalent
+    return _key_fifths(_FLAT_NAMES[_pitch_class(tonic)], False)
+
+
+def _pitch_class(name: str) -> int:
+    """Pitch class of an english LilyPond note name."""
+    base = {"c": 0, "d": 2, "e": 4, "f": 5, "g": 7, "a": 9, "b": 11}[name[0]]
+    for accidental in re.findall(r"ss|s|ff|f", name[1:]):
+        base += {"s": 1, "ss": 2, "f": -1, "ff": -2}[accidental]
+    return base % 12
+
+
+class NativeLilypondWriter:
+    """Converts MIDI note events into two-staff LilyPond notation without MidiToLily.
+
+    The output has the same layout MidiToLily produces ("track1"/"track2" variables
+    in absolute pitch, bars ending in "|", a final "\\fine" and a score block), so it
+    can be fed to LilypondConverter.transform_to_parallel_music unchanged.
+    """
+
+    def __init__(self, time: str, key: str, quant: str):
+        """Initialize the writer.
+
+        Args:
+            time: Time signature specification
+            key: Key signature specification
+            quant: Quantization value
+
+        Raises:
+            ValueError: If a specification cannot be parsed
+        """
+        self.time_signatures = parse_time_spec(time)
+        self.key_signatures = parse_key_spec(key)
+        self.quant = parse_quant(quant)
+
+        if 1 not in self.time_signatures:
+            self.time_signatures[1] = (4, 4)
+        if 1 not in self.key_signatures:
+            self.key_signatures[1] = ("c", False)
+
+        # Note values (in grid units, longest first) that a duration is built from
+        self._durations = []
+        value = 1
+        while value <= self.quant:
+            units = self.quant // value
+            if units % 2 == 0:
+                self._durations.append((units * 3 // 2, f"{value}."))
+            self._durations.append((units, str(value)))
+            value *= 2
+        self._durations.sort(key=lambda d: -d[0])
+
+    def convert(self, table: EventTable) -> str:
+        """Convert an event table into LilyPond source.
+
+        Args:
+            table: Event table, usually the output of the treble/bass split
+
+        Returns:
+            LilyPond source text
+        """
+        grid = table.ticks_per_beat * 4 / self.quant
+        staves = [self._staff_notes(table, track, grid) for track in STAFF_TRACKS]
+
+        end = max((notes[:, 1].max() for notes in staves if len(notes)), default=0)
+        measures = self._measures(end)
+        bpm = self._bpm(table)
+
+        parts = [
+            "% created by Audio Pond",
+            '\\version "2.24.3"',
+            '\\language "english"',
+        ]
+        for i, (notes, clef) in enumerate(zip(staves, ("G", "F")), start=1):
+            parts.append(f'"track{i}" = \\absolute {{')
+            parts.extend(
+                f"  {line}" for line in self._staff_lines(notes, measures, bpm, clef)
+            )
+            parts.append("}")
+        score = textwrap.dedent("""\
+            \\score {
+              <<
+                \\new Staff \\"track1"
+                \\new Staff \\"track2"
+              >>
+              \\layout {}
+              \\midi {}
+            }""")
+        parts.append(score)
+        return "\n".join(parts) + "\n"
+
+    @staticmethod
+    def _bpm(table: EventTable) -> int:
+        """Tempo of the first set_tempo event, in quarter notes per minute."""
+        events = table.events
+        tempos = events["value"][events["type"] == SET_TEMPO]
+        if not len(tempos):
+            return 120
+        return max(1, round(60_000_000 / int(tempos[0])))
+
+    @staticmethod
+    def _staff_notes(table: EventTable, track: int, grid: float) -> np.ndarray:
+        """Quantized (start, end, pitch) rows of the notes in one track."""
+        events = table.events
+        events = events[events["track"] == track]
+        is_on = (events["type"] == NOTE_ON) & (events["velocity"] > 0)
+        is_off = (events["type"] == NOTE_OFF) | (
+            (events["type"] == NOTE_ON) & (events["velocity"] == 0)
+        )
+
+        notes = []
+        sounding = {}
+        for tick, pitch, on, off in zip(
+            events["tick"].tolist(),
+            events["note"].tolist(),
+            is_on.tolist(),
+            is_off.tolist(),
+        ):
+            if on:
+                sounding.setdefault(pitch, []).append(tick)
+            elif off and sounding.get(pitch):
+                start = sounding[pitch].pop(0)
+                notes.append((start, tick, pitch))
+
+        if not notes:
+            return np.zeros((0, 3), dtype=np.int64)
+        notes = np.array(notes, dtype=np.float64)
+        quantized = np.empty(notes.shape, dtype=np.int64)
+        quantized[:, 0] = np.round(notes[:, 0] / grid)
+        quantized[:, 1] = np.maximum(np.round(notes[:, 1] / grid), quantized[:, 0] + 1)
+        quantized[:, 2] = notes[:, 2]
+        return quantized
+
+    def _measures(self, end: int) -> list[tuple[int, int, int]]:
+        """(measure number, start, length) in grid units for measures covering [0, end)."""
+        measures = []
+        position = 0
+        number = 1
+        numerator, denominator = self.time_signatures[1]
+        while position < end or number == 1:
+            numerator, denominator = self.time_signatures.get(
+                number, (numerator, denominator)
+            )
+            if (numerator * self.quant) % denominator:
+                raise ValueError(
+                    f"Quantization {self.quant} is too coarse for {numerator}/{denominator} time"
+                )
+            length = numerator * self.quant // denominator
+            measures.append((number, position, length))
+            position += length
+            number += 1
+        return measures
+
+    def _segments(self, notes: np.ndarray, end: int) -> list[tuple[int, int, tuple]]:
+        """Split a staff into consecutive (start, end, pitches) chords and rests (pitches = ())."""
+        segments = []
+        onsets = np.unique(notes[:, 0]) if len(notes) else []
+        position = 0
+        for i, onset in enumerate(onsets):
+            chord = notes[notes[:, 0] == onset]
+            chord_end = int(chord[:, 1].max())
+            if i + 1 < len(onsets):
+                chord_end = min(chord_end, int(onsets[i + 1]))
+            if onset > position:
+                segments.append((position, int(onset), ()))
+            segments.append(
+                (int(onset), chord_end, tuple(sorted(set(chord[:, 2].tolist()))))
+            )
+            position = chord_end
+        if position < end:
+            segments.append((position, end, ()))
+        return segments
+
+    def _staff_lines(
+        self, notes: np.ndarray, measures: list, bpm: int, clef: str
+    ) -> list[str]:
+        """Lines of LilyPond source for one staff, one bar per line."""
+        first_key = self.key_signatures[1]
+        numerator, denominator = self.time_signatures[1]
+        lines = [
+            self._key_command(first_key),
+            f"\\time {numerator}/{denominator}",
+            f"\\tempo 4 = {bpm}",
+            f'\\clef "{clef}"',
+        ]
+
+        end = measures[-1][1] + measures[-1][2]
+        segments = self._segments(notes, end)
+        key = first_key
+        segment_idx = 0
+        for number, start, length in measures:
+            if number > 1 and number in self.key_signatures:
+                key = self.key_signatures[number]
+                lines.append(self._key_command(key))
+            if number > 1 and number in self.time_signatures:
+                n, d = self.time_signatures[number]
+                lines.append(f"\\time {n}/{d}")
+
+            tokens = []
+            measure_end = start + length
+            while (
+                segment_idx < len(segments) and segments[segment_idx][0] < measure_end
+            ):
+                seg_start, seg_end, pitches = segments[segment_idx]
+                piece_start = max(seg_start, start)
+                piece_end = min(seg_end, measure_end)
+                tied = bool(pitches) and piece_end < seg_end
+                tokens.extend(
+                    self._note_tokens(pitches, piece_end - piece_start, key, tied)
+                )
+                if seg_end <= measure_end:
+                    segment_idx += 1
+                else:
+                    break
+            lines.append(" ".join(tokens) + " |")
+
+        lines.append("\\fine")
+        return lines
+
+    def _note_tokens(
+        self, pitches: tuple, length: int, key: tuple[str, bool], tied: bool
+    ) -> list[str]:
+        """Tokens for a chord or rest of the given length, tying the pieces of a note."""
+        if pitches:
+            names = [self._pitch_name(p, key) for p in pitches]
+            body = names[0] if len(names) == 1 else f"<{' '.join(names)}>"
+        else:
+            body = "r"
+
+        tokens = []
+        remaining = length
+        while remaining > 0:
+            units, duration = next(d for d in self._durations if d[0] <= remaining)
+            remaining -= units
+            tie = "~" if pitches and (remaining > 0 or tied) else ""
+            tokens.append(f"{body}{duration}{tie}")
+        return tokens
+
+    @staticmethod
+    def _key_command(key: tuple[str, bool]) -> str:
+        tonic, minor = key
+        return f"\\key {tonic} \\{'minor' if minor else 'major'}"
+
+    @staticmethod
+    def _pitch_name(pitch: int, key: tuple[str, bool]) -> str:
+        """Absolute LilyPond pitch (c' = middle C), spelled with the key's accidentals."""
+        names = _FLAT_NAMES if _key_fifths(*key) < 0 else _SHARP_NAMES
+        octave = pitch // 12 - 4
+        marks = "'" * octave if octave > 0 else "," * -octave
+        return f"{names[pitch % 12]}{marks}"
+
+
+def convert_events(
+    table: EventTable,
+    time: str,
+    key: str,
+    quant: str,
+    output_path: Optional[str] = None,
+) -> str:
+    """Convert an event table into LilyPond source, optionally writing it to a file.
+
+    Args:
+        table: Event table with the upper and lower staff in tracks 1 and 2
+        time: Time signature specification
+        key: Key signature specification
+        quant: Quantization value
+        output_path: File to write the LilyPond source to, if any
+
+    Returns:
+        LilyPond source text
+    """
+    content = NativeLilypondWriter(time, key, quant).convert(table)
+    if output_path:
+        with open(output_path, "w") as f:
+            f.write(content)
+    return content
@@ -1,8 +1,13 @@
 """Source processor for Audio Pond."""
 
 from pathlib import Path
-import yt_dlp
-from pydub import AudioSegment
+from typing import Iterator, Optional
+
+import numpy as np
+
+# Length of the decoded blocks of a streamed source, and how many are read ahead
+STREAM_BLOCK_SECONDS = 5.0
+STREAM_PREFETCH_BLOCKS = 24
 
 
 class SourceProcessor:
@@ -16,15 +21,30 @@ class SourceProcessor:
         """
         self.output_dir = output_dir
 
-    def process_youtube(self, url: str) -> Path:
+    def process_youtube(self, url: str, sample_rate: Optional[int] = None) -> Path:
         """Download YouTube video and extract audio.
 
         Args:
             url: YouTube URL
+            sample_rate: If given, decode the download directly to a mono .npy file at this
+                sample rate instead of extracting a WAV file
 
         Returns:
             Path to the downloaded audio file
         """
+        import yt_dlp
+
+        if sample_rate:
+            ydl_opts = {
+                "format": "bestaudio/best",
+                "outtmpl": str(self.output_dir / "1_raw_download.%(ext)s"),
+            }
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                info = ydl.extract_info(url, download=True)
+                download_path = Path(ydl.prepare_filename(info))
+
+            return self.decode_audio(download_path, sample_rate)
+
         ydl_opts = {
             "format": "bestaudio/best",
             "postprocessors": [
@@ -42,6 +62,59 @@ class SourceProcessor:
 
         return self.output_dir / "1_raw_audio.wav"
 
+    def resolve_stream(self, url: str, direct: bool = False) -> tuple[str, dict]:
+        """Find the media URL behind a video page without downloading it.
+
+        Args:
+            url: YouTube (or other yt-dlp supported) URL
+            direct: The URL already points at a media file, so skip yt-dlp
+
+        Returns:
+            (media_url, http_headers) to fetch the audio stream with
+        """
+        if direct:
+            return url, {}
+
+        import yt_dlp
+
+        with yt_dlp.YoutubeDL({"format": "bestaudio/best", "quiet": True}) as ydl:
+            info = ydl.extract_info(url, download=False)
+
+        formats = info.get("requested_formats") or [info]
+        media_url = formats[0].get("url")
+        if not media_url:
+            raise RuntimeError(f"No media URL found for {url}")
+        headers = formats[0].get("http_headers") or info.get("http_headers") or {}
+        return media_url, headers
+
+    def stream_audio(
+        self, url: str, sample_rate: int, direct: bool = False
+    ) -> Iterator[np.ndarray]:
+        """Stream a source's audio as mono blocks while it is still downloading.
+
+        ffmpeg fetches and decodes the media stream, and a background thread reads
+        ahead so the download continues while the consumer transcribes. The decoded
+        audio is also saved as 1_raw_audio.npy once the stream is complete.
+
+        Args:
+            url: YouTube URL, or a media file URL with direct set
+            sample_rate: Sample rate of the blocks
+            direct: The URL points at a media file, so skip yt-dlp
+
+        Returns:
+            Iterator over audio blocks
+        """
+        from src.utils.audio_io import iter_ffmpeg_blocks, prefetch_blocks, tee_npy
+
+        media_url, headers = self.resolve_stream(url, direct=direct)
+        blocks = iter_ffmpeg_blocks(
+            media_url, sample_rate, block_seconds=STREAM_BLOCK_SECONDS, headers=headers
+        )
+        return prefetch_blocks(
+            tee_npy(blocks, self.output_dir / "1_raw_audio.npy"),
+            max_blocks=STREAM_PREFETCH_BLOCKS,
+        )
+
     def process_audio_file(self, audio_path: Path) -> Path:
         """Process local audio file to WAV format.
 
@@ -51,7 +124,28 @@ class SourceProcessor:
         Returns:
             Path to the processed WAV file
         """
+        from pydub import AudioSegment
+
         audio_output_path = self.output_dir / "1_raw_audio.wav"
         audio = AudioSegment.from_file(str(audio_path))
         audio.export(str(audio_output_path), format="wav")
         return audio_output_path
+
+    def decode_audio(self, audio_path: Path, sample_rate: int) -> Path:
+        """Decode any supported audio file straight to mono float32 at the model sample rate.
+
+        Decoding and resampling are streamed block by block, and the result is saved as
+        a .npy file that later stages memory-map instead of decoding again.
+
+        Args:
+            audio_path: Path to the input audio file
+            sample_rate: Sample rate of the output
+
+        Returns:
+            Path to the decoded .npy file
+        """
+        from src.utils.audio_io import iter_audio_blocks, write_npy
+
+        npy_output_path = self.output_dir / "1_raw_audio.npy"
+        write_npy(iter_audio_blocks(audio_path, sample_rate), npy_output_path)
+        return npy_output_path
@@ -0,0 +1,172 @@
+"""Dynamic batching of transcription model passes for Audio Pond."""
+
+import logging
+import queue
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+
+class _Request:
+    """Segments of one transcription waiting for their model outputs."""
+
+    def __init__(self, segments: np.ndarray):
+        self.segments = segments
+        self.next_segment = 0
+        self.outputs = []
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        if error is None:
+            keys = self.outputs[0].keys() if self.outputs else ()
+            self.result = {
+                key: np.concatenate([output[key] for output in self.outputs], axis=0)
+                for key in keys
+            }
+        self.error = error
+        self.outputs = []
+        self.done.set()
+
+
+class TranscriptionBatcher:
+    """Runs the model passes of many concurrent transcriptions together.
+
+    Transcribers hand their audio segments to forward() and block until the model
+    outputs for them are ready. A single thread packs queued segments from all
+    waiting requests into shared forward passes of up to the engine's batch size,
+    taking one segment from each request in turn so that a long recording does not
+    hold up short ones. Deframing and post-processing stay in the calling threads.
+    """
+
+    def __init__(self, engine, max_wait_seconds: float = 0.05):
+        """Initialize the batcher and start its thread.
+
+        Args:
+            engine: MidiTranscriber whose model and batch size run the shared passes
+            max_wait_seconds: How long a pass that is not full waits for more requests
+        """
+        self.engine = engine
+        self.batch_size = engine.batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self.passes = 0
+        self._requests = queue.Queue()
+        self._closing = False
+        self._thread = threading.Thread(
+            target=self._run, name="transcription-batcher", daemon=True
+        )
+        self._thread.start()
+
+    def forward(self, segments: np.ndarray) -> dict:
+        """Run the model over audio segments as part of shared batches.
+
+        Args:
+            segments: Array of shape (segments, segment_samples)
+
+        Returns:
+            Model outputs concatenated over all segments, as from MidiTranscriber._forward
+        """
+        if self._closing:
+            raise RuntimeError("Transcription batcher is closed")
+        if len(segments) == 0:
+            return self.engine._forward(segments)
+        request = _Request(segments)
+        self._requests.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def close(self) -> None:
+        """Finish the queued requests and stop the batching thread."""
+        self._closing = True
+        self._requests.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        active = []
+        stopping = False
+        while active or not stopping:
+            if not active:
+                request = self._requests.get()
+                if request is None:
+                    stopping = True
+                    continue
+                active.append(request)
+                stopping = self._gather(active, wait=True) or stopping
+            else:
+                stopping = self._gather(active, wait=False) or stopping
+
+            batch, owners = self._take_batch(active)
+            try:
+                outputs = self.engine._forward(np.stack(batch))
+            except Exception as e:
+                logging.error(f"Batched transcription pass failed: {str(e)}")
+                for request in set(owners):
+                    request.finish(error=e)
+                active = [r for r in active if not r.done.is_set()]
+                continue
+            self.passes += 1
+
+            # Hand every request its rows of the shared outputs, in segment order
+            for row, request in enumerate(owners):
+                request.outputs.append(
+                    {key: value[row : row + 1] for key, value in outputs.items()}
+                )
+            for request in active:
+                if request.next_segment == len(request.segments):
+                    request.finish()
+            active = [r for r in active if not r.done.is_set()]
+
+        # Requests that raced with close() never reach a pass
+        while True:
+            try:
+                request = self._requests.get_nowait()
+            except queue.Empty:
+                return
+            if request is not None:
+                request.finish(error=RuntimeError("Transcription batcher is closed"))
+
+    def _gather(self, active: list, wait: bool) -> bool:
+        """Move newly queued requests into the active list; True if close() was called.
+
+        With wait set, keeps collecting until the first pass is full or
+        max_wait_seconds has passed, so requests arriving together share it.
+        """
+        deadline = time.monotonic() + self.max_wait_seconds
+        while True:
+            pending = sum(len(r.segments) - r.next_segment for r in active)
+            timeout = deadline - time.monotonic()
+            if not wait or pending >= self.batch_size or timeout <= 0:
+                try:
+                    request = self._requests.get_nowait()
+                except queue.Empty:
+                    return False
+            else:
+                try:
+                    request = self._requests.get(timeout=timeout)
+                except queue.Empty:
+                    return False
+            if request is None:
+                return True
+            active.append(request)
+
+    def _take_batch(self, active: list) -> tuple[list, list]:
+        """Take up to batch_size segments, one from each active request in turn."""
+        batch, owners = [], []
+        while len(batch) < self.batch_size:
+            took = False
+            for request in active:
+                if len(batch) == self.batch_size:
+                    break
+                if request.next_segment < len(request.segments):
+                    batch.append(request.segments[request.next_segment])
+                    owners.append(request)
+                    request.next_segment += 1
+                    took = True
+            if not took:
+                break
+        return batch, owners
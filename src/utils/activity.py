@@ -0,0 +1,139 @@
+"""Fast detection of the active (musical) regions of a recording."""
+
+import numpy as np
+
+# Analysis frame and hop at the model sample rate (64 ms frames, 50 ms hop)
+FRAME_SECONDS = 0.064
+HOP_SECONDS = 0.05
+
+# Frames quieter than this far below the loud part of the recording are inactive
+RELATIVE_FLOOR_DB = 45.0
+# Frames quieter than this are inactive regardless of the recording's level
+ABSOLUTE_FLOOR_DB = -60.0
+# Frames with a flatter spectrum are noise (applause, hiss, crowd) rather than tones
+MAX_FLATNESS = 0.3
+# Onset strength (spectral flux) above the median by this many deviations marks a note attack
+ONSET_DEVIATIONS = 3.0
+
+# Inactive stretches shorter than this are transcribed anyway; skipping them saves
+# less than the model context lost at the cut
+MIN_SKIP_SECONDS = 5.0
+# Audio kept around every active region so note releases and model context survive
+MARGIN_SECONDS = 1.0
+
+# Frames analysed at once, bounding the memory of the spectra
+_BLOCK_FRAMES = 4096
+
+
+def frame_features(
+    audio: np.ndarray, sample_rate: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Per-frame level, spectral flatness and onset strength of mono audio.
+
+    Args:
+        audio: Mono audio
+        sample_rate: Sample rate of the audio
+
+    Returns:
+        (level_db, flatness, onset) arrays with one value per hop
+    """
+    frame = int(round(FRAME_SECONDS * sample_rate))
+    hop = int(round(HOP_SECONDS * sample_rate))
+    audio = np.asarray(audio, dtype=np.float32)
+    if len(audio) < frame:
+        audio = np.pad(audio, (0, frame - len(audio)))
+
+    frames = np.lib.stride_tricks.sliding_window_view(audio, frame)[::hop]
+    window = np.hanning(frame).astype(np.float32)
+    count = len(frames)
+    level_db = np.empty(count, dtype=np.float32)
+    flatness = np.empty(count, dtype=np.float32)
+    onset = np.empty(count, dtype=np.float32)
+
+    previous = None
+    for start in range(0, count, _BLOCK_FRAMES):
+        block = frames[start : start + _BLOCK_FRAMES]
+        end = start + len(block)
+
+        rms = np.sqrt(np.mean(np.square(block, dtype=np.float32), axis=1))
+        level_db[start:end] = 20 * np.log10(rms + 1e-10)
+
+        power = np.square(np.abs(np.fft.rfft(block * window, axis=1)))
+        power += 1e-12
+        flatness[start:end] = np.exp(np.mean(np.log(power), axis=1)) / np.mean(
+            power, axis=1
+        )
+
+        # Spectral flux: summed increase of log magnitude since the previous frame
+        magnitude = np.log1p(np.sqrt(power))
+        if previous is None:
+            previous = magnitude[:1]
+        flux = np.diff(np.concatenate((previous, magnitude)), axis=0)
+        onset[start:end] = np.maximum(flux, 0).sum(axis=1)
+        previous = magnitude[-1:]
+
+    return level_db, flatness, onset
+
+
+def find_active_spans(
+    audio: np.ndarray,
+    sample_rate: int,
+    min_skip_seconds: float = MIN_SKIP_SECONDS,
+    margin_seconds: float = MARGIN_SECONDS,
+) -> list[tuple[int, int]]:
+    """Find the regions of a recording that may contain piano notes.
+
+    A frame is active when it is loud enough relative to the recording and tonal
+    (low spectral flatness), so silence, hiss and applause are inactive. Active
+    regions without a single note attack (e.g. a sustained hum) are dropped. The
+    regions are widened by the margin, and inactive gaps shorter than
+    min_skip_seconds are kept.
+
+    Args:
+        audio: Mono audio
+        sample_rate: Sample rate of the audio
+        min_skip_seconds: Shortest inactive stretch that is skipped
+        margin_seconds: Audio kept before and after every active region
+
+    Returns:
+        Sorted, non-overlapping (start, end) sample ranges; empty if nothing is active
+    """
+    if len(audio) == 0:
+        return []
+
+    level_db, flatness, onset = frame_features(audio, sample_rate)
+    floor = max(np.percentile(level_db, 95) - RELATIVE_FLOOR_DB, ABSOLUTE_FLOOR_DB)
+    active = (level_db > floor) & (flatness < MAX_FLATNESS)
+
+    deviation = np.median(np.abs(onset - np.median(onset))) + 1e-6
+    attacks = active & (onset > np.median(onset) + ONSET_DEVIATIONS * deviation)
+
+    # Runs of active frames as [start, end) frame indices
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], active.astype(np.int8), [0]))))
+    runs = edges.reshape(-1, 2)
+    if len(runs) == 0:
+        return []
+    attacks_before = np.cumsum(np.concatenate(([0], attacks.astype(np.int32))))
+    attack_counts = attacks_before[runs[:, 1]] - attacks_before[runs[:, 0]]
+    runs = runs[attack_counts > 0]
+
+    hop = int(round(HOP_SECONDS * sample_rate))
+    frame = int(round(FRAME_SECONDS * sample_rate))
+    margin = int(margin_seconds * sample_rate)
+    min_gap = int(min_skip_seconds * sample_rate)
+
+    spans = []
+    for start_frame, end_frame in runs:
+        start = max(0, int(start_frame) * hop - margin)
+        end = min(len(audio), (int(end_frame) - 1) * hop + frame + margin)
+        if spans and start - spans[-1][1] < min_gap:
+            spans[-1] = (spans[-1][0], max(spans[-1][1], end))
+        else:
+            spans.append((start, end))
+
+    # Leading and trailing stretches too short to be worth skipping
+    if spans and spans[0][0] < min_gap:
+        spans[0] = (0, spans[0][1])
+    if spans and len(audio) - spans[-1][1] < min_gap:
+        spans[-1] = (spans[-1][0], len(audio))
+    return spans
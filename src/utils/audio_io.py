@@ -0,0 +1,394 @@
+"""Incremental audio reading utilities for Audio Pond."""
+
+import os
+import queue
+import struct
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, Optional
+
+import numpy as np
+import soundfile as sf
+import soxr
+
+from src.utils import metrics
+
+# Fixed .npy header length, so the header can be written once the sample count is known
+_NPY_HEADER_SIZE = 128
+
+
+@dataclass
+class AudioWindow:
+    """A window of audio whose core region is owned by this window.
+
+    Times are in seconds on the timeline of the whole recording. Notes that start
+    inside [core_start, core_end) belong to this window; the audio around the core
+    only provides context across window boundaries.
+    """
+
+    audio: np.ndarray
+    start: float
+    core_start: float
+    core_end: float
+    is_last: bool
+    sample_rate: int
+
+    @property
+    def end(self) -> float:
+        """Time of the end of the window audio."""
+        return self.start + len(self.audio) / self.sample_rate
+
+
+def audio_duration(audio_path: Path, sample_rate: int) -> Optional[float]:
+    """Duration of an audio file in seconds, read from its header.
+
+    Args:
+        audio_path: Path to the audio file (.npy files hold audio at sample_rate)
+        sample_rate: Sample rate of .npy audio
+
+    Returns:
+        Duration in seconds, or None if the format does not record it
+    """
+    if Path(audio_path).suffix == ".npy":
+        return len(np.load(audio_path, mmap_mode="r")) / sample_rate
+    try:
+        return sf.info(str(audio_path)).duration
+    except sf.LibsndfileError:
+        return None
+
+
+def load_audio(audio_path: Path, sample_rate: int) -> np.ndarray:
+    """Load a whole audio file as mono float32 at the given sample rate.
+
+    .npy files are memory-mapped instead of decoded, so loading them does not copy.
+
+    Args:
+        audio_path: Path to the audio file (.npy files hold audio at sample_rate)
+        sample_rate: Output sample rate
+
+    Returns:
+        The audio samples
+    """
+    if Path(audio_path).suffix == ".npy":
+        return np.load(audio_path, mmap_mode="r")
+
+    import librosa
+
+    audio, _ = librosa.load(path=audio_path, sr=sample_rate, mono=True)
+    return audio
+
+
+def iter_audio_blocks(
+    audio_path: Path, sample_rate: int, block_seconds: float = 10.0
+) -> Iterator[np.ndarray]:
+    """Read an audio file block by block as mono float32 at the given sample rate.
+
+    Resampling is streamed across blocks, so the output matches resampling the
+    whole file while only one block is held in memory. Formats libsndfile cannot
+    read are decoded by ffmpeg, and .npy files are sliced from a memory map.
+
+    Args:
+        audio_path: Path to the audio file (.npy files hold audio at sample_rate)
+        sample_rate: Output sample rate
+        block_seconds: Length of each block read from the file
+
+    Returns:
+        Iterator over audio blocks
+    """
+    if Path(audio_path).suffix == ".npy":
+        audio = np.load(audio_path, mmap_mode="r")
+        block_samples = max(1, int(block_seconds * sample_rate))
+        for start in range(0, len(audio), block_samples):
+            yield audio[start : start + block_samples]
+        return
+
+    try:
+        f = sf.SoundFile(str(audio_path))
+    except sf.LibsndfileError:
+        yield from iter_ffmpeg_blocks(str(audio_path), sample_rate, block_seconds)
+        return
+
+    with f:
+        resampler = None
+        if f.samplerate != sample_rate:
+            resampler = soxr.ResampleStream(f.samplerate, sample_rate, 1)
+        block_frames = max(1, int(block_seconds * f.samplerate))
+
+        while True:
+            block = f.read(block_frames, dtype="float32", always_2d=True)
+            last = len(block) < block_frames
+            mono = block.mean(axis=1, dtype=np.float32)
+            if resampler is not None:
+                mono = resampler.resample_chunk(mono, last=last)
+            if len(mono):
+                yield mono
+            if last:
+                break
+
+
+def iter_ffmpeg_blocks(
+    source: str,
+    sample_rate: int,
+    block_seconds: float = 10.0,
+    headers: Optional[dict] = None,
+) -> Iterator[np.ndarray]:
+    """Decode any ffmpeg-readable file or URL block by block as mono float32.
+
+    ffmpeg downmixes and resamples while streaming, so decoding starts producing
+    blocks before the whole input has been read (or downloaded, for URLs).
+
+    Args:
+        source: Path or URL of the input
+        sample_rate: Output sample rate
+        block_seconds: Length of each decoded block
+        headers: HTTP headers to send when source is a URL
+
+    Returns:
+        Iterator over audio blocks
+    """
+    command = ["ffmpeg", "-nostdin", "-loglevel", "error"]
+    if source.startswith(("http://", "https://")):
+        # Resume dropped connections instead of ending the audio early
+        command += ["-reconnect", "1", "-reconnect_streamed", "1"]
+        command += ["-reconnect_delay_max", "5"]
+        if headers:
+            command += [
+                "-headers",
+                "".join(f"{name}: {value}\r\n" for name, value in headers.items()),
+            ]
+    command += [
+        "-i",
+        source,
+        "-f",
+        "f32le",
+        "-ac",
+        "1",
+        "-ar",
+        str(sample_rate),
+        "pipe:1",
+    ]
+    start = time.perf_counter()
+    try:
+        process = subprocess.Popen(
+            command, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+    except FileNotFoundError:
+        raise RuntimeError(
+            "ffmpeg not found. Please make sure ffmpeg is installed and available in PATH."
+        )
+
+    block_bytes = max(1, int(block_seconds * sample_rate)) * 4
+    try:
+        while chunk := process.stdout.read(block_bytes):
+            usable = len(chunk) - len(chunk) % 4
+            yield np.frombuffer(chunk[:usable], dtype="<f4")
+    finally:
+        process.stdout.close()
+        stderr = process.stderr.read().decode(errors="replace")
+        process.stderr.close()
+        returncode = process.wait()
+        metrics.record_subprocess(command, time.perf_counter() - start, returncode)
+
+    if returncode != 0:
+        raise RuntimeError(f"Failed to decode audio with ffmpeg: {stderr}")
+
+
+def tee_npy(blocks: Iterator[np.ndarray], npy_path: Path) -> Iterator[np.ndarray]:
+    """Pass audio blocks through while also writing them to a float32 .npy file.
+
+    The file is written under a temporary name and renamed into place once all
+    blocks have been consumed; it is removed if the stream is abandoned.
+
+    Args:
+        blocks: Iterator over mono audio blocks
+        npy_path: Path of the .npy file to write
+
+    Returns:
+        Iterator over the same blocks
+    """
+    tmp_path = npy_path.with_name(f".{npy_path.name}.tmp")
+    n_samples = 0
+    complete = False
+    try:
+        with open(tmp_path, "wb") as f:
+            f.seek(_NPY_HEADER_SIZE)
+            for block in blocks:
+                f.write(np.ascontiguousarray(block, dtype="<f4").tobytes())
+                n_samples += len(block)
+                yield block
+
+            # Fill in the header now that the shape is known
+            header = repr(
+                {"descr": "<f4", "fortran_order": False, "shape": (n_samples,)}
+            )
+            header = header.ljust(_NPY_HEADER_SIZE - 11) + "\n"
+            f.seek(0)
+            f.write(b"\x93NUMPY\x01\x00")
+            f.write(struct.pack("<H", len(header)))
+            f.write(header.encode("latin1"))
+        os.replace(tmp_path, npy_path)
+        complete = True
+    finally:
+        if not complete:
+            tmp_path.unlink(missing_ok=True)
+            close = getattr(blocks, "close", None)
+            if close is not None:
+                close()
+
+
+def write_npy(blocks: Iterator[np.ndarray], npy_path: Path) -> int:
+    """Stream audio blocks into a float32 .npy file that can later be memory-mapped.
+
+    The file is written under a temporary name and renamed into place when complete.
+
+    Args:
+        blocks: Iterator over mono audio blocks
+        npy_path: Path of the .npy file to write
+
+    Returns:
+        Number of samples written
+    """
+    return sum(len(block) for block in tee_npy(blocks, npy_path))
+
+
+def prefetch_blocks(
+    blocks: Iterator[np.ndarray], max_blocks: int = 4
+) -> Iterator[np.ndarray]:
+    """Read audio blocks ahead in a background thread.
+
+    The producer (e.g. a download piped through ffmpeg) keeps running while the
+    consumer is busy transcribing, instead of stalling on a full pipe. At most
+    max_blocks blocks are buffered.
+
+    Args:
+        blocks: Iterator over audio blocks
+        max_blocks: Number of blocks read ahead
+
+    Returns:
+        Iterator over the same blocks
+    """
+    buffer = queue.Queue(maxsize=max(1, max_blocks))
+    stopped = threading.Event()
+    end = object()
+
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for block in blocks:
+                if not put(block):
+                    break
+            else:
+                put(end)
+        except Exception as e:
+            put(e)
+        finally:
+            # Closing in this thread stops e.g. the ffmpeg process behind the blocks
+            close = getattr(blocks, "close", None)
+            if close is not None:
+                close()
+
+    thread = threading.Thread(
+        target=metrics.in_current_context(produce), name="audio-prefetch", daemon=True
+    )
+    thread.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is end:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def iter_windows(
+    blocks: Iterator[np.ndarray],
+    sample_rate: int,
+    chunk_seconds: float,
+    overlap_seconds: float,
+) -> Iterator[AudioWindow]:
+    """Group a stream of audio blocks into overlapping windows.
+
+    Window k owns the core region [k * chunk_seconds, (k + 1) * chunk_seconds) and
+    extends overlap_seconds to either side of it. Only about one window of audio is
+    buffered at a time, so memory use does not depend on the recording length.
+
+    Args:
+        blocks: Iterator over mono audio blocks at sample_rate
+        sample_rate: Sample rate of the blocks
+        chunk_seconds: Length of the core region of each window
+        overlap_seconds: Context added on each side of the core region
+
+    Returns:
+        Iterator over audio windows
+    """
+    chunk = int(chunk_seconds * sample_rate)
+    overlap = int(overlap_seconds * sample_rate)
+
+    pending = []
+    buffer = np.zeros(0, dtype=np.float32)
+    # Sample index of buffer[0] in the whole recording
+    buffer_start = 0
+    exhausted = False
+    core_start = 0
+
+    while True:
+        window_start = max(0, core_start - overlap)
+        window_end = core_start + chunk + overlap
+
+        # Read until the window is covered or the input ends
+        buffered_end = buffer_start + len(buffer)
+        while buffered_end < window_end and not exhausted:
+            try:
+                block = next(blocks)
+            except StopIteration:
+                exhausted = True
+                break
+            pending.append(block)
+            buffered_end += len(block)
+        if pending:
+            buffer = np.concatenate([buffer, *pending])
+            pending.clear()
+
+        total_end = buffer_start + len(buffer)
+        # The last window absorbs a tail that fits into its right-hand overlap
+        is_last = exhausted and total_end <= window_end
+        core_end = total_end if is_last else core_start + chunk
+
+        if total_end <= core_start:
+            return
+
+        window_audio = buffer[
+            window_start - buffer_start : min(window_end, total_end) - buffer_start
+        ]
+        yield AudioWindow(
+            audio=window_audio,
+            start=window_start / sample_rate,
+            core_start=core_start / sample_rate,
+            core_end=core_end / sample_rate,
+            is_last=is_last,
+            sample_rate=sample_rate,
+        )
+
+        if is_last:
+            return
+
+        # Drop audio that no later window needs
+        core_start += chunk
+        next_start = core_start - overlap
+        buffer = buffer[next_start - buffer_start :]
+        buffer_start = next_start
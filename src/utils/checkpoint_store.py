@@ -0,0 +1,218 @@
+"""Local store of transcription model checkpoints for Audio Pond."""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import urllib.request
+import zipfile
+from pathlib import Path
+from typing import Optional
+
+from src.utils.workspace import atomic_path
+
+# The checkpoint PianoTranscription uses by default, and where it is published
+DEFAULT_CHECKPOINT = "note_F1=0.9677_pedal_F1=0.9186.pth"
+CHECKPOINT_URL = (
+    "https://zenodo.org/record/4034264/files/"
+    "CRNN_note_F1%3D0.9677_pedal_F1%3D0.9186.pth?download=1"
+)
+# piano_transcription_inference's own download directory, so existing downloads are reused
+DEFAULT_ROOT = Path.home() / "piano_transcription_inference_data"
+# Recorded sha256 digests of the checkpoints in a store
+MANIFEST_NAME = "checkpoints.json"
+
+_BLOCK_BYTES = 1024 * 1024
+
+# Checkpoints verified by this process, keyed by (path, size, mtime)
+_verified = set()
+_lock = threading.Lock()
+
+
+def file_sha256(path: Path) -> str:
+    """Hex sha256 digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(_BLOCK_BYTES):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def is_mappable(path: Path) -> bool:
+    """Whether a checkpoint is in torch's zip format, which torch.load can memory-map."""
+    return zipfile.is_zipfile(path)
+
+
+class CheckpointStore:
+    """A directory of model checkpoints with their recorded sha256 digests.
+
+    A store can be seeded when an image is built and then mounted read-only and
+    shared by any number of processes: loading a checkpoint only reads the store.
+    Each checkpoint is verified against its recorded digest once per process
+    before it is used. Checkpoints in torch's legacy format are converted when
+    seeded, so they can be memory-mapped.
+    """
+
+    def __init__(self, root: Path, offline: bool = False):
+        """Initialize the store.
+
+        Args:
+            root: Directory of the checkpoints
+            offline: Never download a missing checkpoint; fail instead
+        """
+        self.root = Path(root)
+        self.offline = offline
+
+    def path(self, name: str = DEFAULT_CHECKPOINT) -> Path:
+        """Path of a checkpoint in the store (which may not exist yet)."""
+        return self.root / name
+
+    def manifest(self) -> dict:
+        """Recorded checkpoints by name: {"sha256", "size", "source"}."""
+        try:
+            with open(self.root / MANIFEST_NAME, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _record(self, name: str, entry: dict) -> None:
+        manifest = self.manifest()
+        manifest[name] = entry
+        with (
+            atomic_path(self.root / MANIFEST_NAME) as tmp_path,
+            open(tmp_path, "w") as f,
+        ):
+            json.dump(manifest, f, indent=2, sort_keys=True)
+
+    def verify(self, name: str = DEFAULT_CHECKPOINT) -> Path:
+        """Check a checkpoint against its recorded digest.
+
+        Args:
+            name: Checkpoint name
+
+        Returns:
+            Path to the checkpoint
+
+        Raises:
+            RuntimeError: If the checkpoint is missing or does not match its digest
+        """
+        path = self.path(name)
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            raise RuntimeError(f"Checkpoint {path} not found")
+        key = (str(path), stat.st_size, stat.st_mtime_ns)
+        with _lock:
+            if key in _verified:
+                return path
+
+        entry = self.manifest().get(name)
+        if entry is None:
+            logging.warning(
+                f"Checkpoint {path} has no recorded sha256; seed it with "
+                f"'python -m src.audio_pond_checkpoints seed {path}' to verify it"
+            )
+        else:
+            digest = file_sha256(path)
+            if digest != entry["sha256"]:
+                raise RuntimeError(
+                    f"Checkpoint {path} failed its integrity check: sha256 {digest}, "
+                    f"expected {entry['sha256']}. Seed the store again."
+                )
+        with _lock:
+            _verified.add(key)
+        return path
+
+    def seed(
+        self, source: str, name: str = DEFAULT_CHECKPOINT, sha256: Optional[str] = None
+    ) -> Path:
+        """Add a checkpoint to the store from a file or URL and record its digest.
+
+        Args:
+            source: Path or http(s) URL of the checkpoint
+            name: Name to store it under
+            sha256: Expected digest of the source, checked before it is stored
+
+        Returns:
+            Path to the stored checkpoint
+
+        Raises:
+            RuntimeError: If the source does not match sha256
+        """
+        os.makedirs(self.root, exist_ok=True)
+        dest_path = self.path(name)
+        with atomic_path(dest_path) as tmp_path:
+            if source.startswith(("http://", "https://")):
+                logging.info(f"Downloading checkpoint {source} to {dest_path}")
+                with (
+                    urllib.request.urlopen(source) as response,
+                    open(tmp_path, "wb") as f,
+                ):
+                    shutil.copyfileobj(response, f, _BLOCK_BYTES)
+            else:
+                shutil.copyfile(source, tmp_path)
+
+            source_digest = file_sha256(tmp_path)
+            if sha256 and source_digest != sha256.lower():
+                raise RuntimeError(
+                    f"Checkpoint {source} has sha256 {source_digest}, expected {sha256}"
+                )
+
+            digest = source_digest
+            if not is_mappable(tmp_path):
+                logging.info(
+                    f"Converting {source} to torch's zip format for mmap loading"
+                )
+                _convert(tmp_path)
+                digest = file_sha256(tmp_path)
+
+        self._record(
+            name,
+            {
+                "sha256": digest,
+                "size": dest_path.stat().st_size,
+                "source": source,
+                "source_sha256": source_digest,
+            },
+        )
+        return dest_path
+
+    def resolve(self, name: str = DEFAULT_CHECKPOINT) -> Path:
+        """Path to a verified checkpoint, downloading the default one if it is missing.
+
+        Args:
+            name: Checkpoint name
+
+        Returns:
+            Path to the checkpoint
+
+        Raises:
+            RuntimeError: If the checkpoint is missing and cannot be downloaded (the
+                store is offline or the checkpoint is not the default one), or fails
+                its integrity check
+        """
+        if not self.path(name).exists():
+            if self.offline or name != DEFAULT_CHECKPOINT:
+                raise RuntimeError(
+                    f"Checkpoint {self.path(name)} not found. Seed the checkpoint store "
+                    f"with 'python -m src.audio_pond_checkpoints seed <file or URL>'."
+                )
+            self.seed(CHECKPOINT_URL, name)
+        return self.verify(name)
+
+
+def default_store() -> CheckpointStore:
+    """The checkpoint store configured by AUDIO_POND_CHECKPOINT_DIR and AUDIO_POND_OFFLINE."""
+    root = os.getenv("AUDIO_POND_CHECKPOINT_DIR")
+    offline = os.getenv("AUDIO_POND_OFFLINE", "").lower() in ("1", "true", "yes")
+    return CheckpointStore(Path(root) if root else DEFAULT_ROOT, offline=offline)
+
+
+def _convert(path: Path) -> None:
+    """Rewrite a legacy-format checkpoint in place in torch's zip format, keeping its weights."""
+    import torch
+
+    checkpoint = torch.load(path, map_location="cpu")
+    torch.save({"model": checkpoint["model"]}, path)
@@ -1,6 +1,7 @@
 """GPU utilities for Audio Pond."""
 
 import logging
+from typing import Optional
 import torch
 
 
@@ -17,3 +18,22 @@ def check_gpu():
     except Exception as e:
         logging.warning(f"Failed to configure GPU: {str(e)}")
         return False
+
+
+def configure_cpu_threads(
+    intra_op: Optional[int] = None, inter_op: Optional[int] = None
+) -> None:
+    """Set the number of torch threads used for CPU inference.
+
+    Args:
+        intra_op: Threads used within an operation, or None to keep the default
+        inter_op: Threads used across operations, or None to keep the default
+    """
+    if intra_op:
+        torch.set_num_threads(intra_op)
+    if inter_op:
+        try:
+            torch.set_num_interop_threads(inter_op)
+        except RuntimeError as e:
+            # Can only be set once, before any inter-op parallel work has started
+            logging.warning(f"Failed to set inter-op threads: {str(e)}")
@@ -0,0 +1,168 @@
+"""Inference backends for the transcription network."""
+
+import copy
+import importlib.util
+import logging
+import os
+import tempfile
+
+import numpy as np
+import torch
+
+# Selectable backends, from the reference fp32 model to the fastest CPU variants
+BACKENDS = ("eager", "int8", "torchscript", "onnx")
+
+
+class EagerRunner:
+    """Runs a torch module (fp32 or dynamically quantized) on batches of segments."""
+
+    def __init__(self, model: torch.nn.Module, device: torch.device):
+        self.model = model.eval()
+        self.device = device
+
+    def __call__(self, segments: np.ndarray) -> dict:
+        """Run the network on a batch of segments.
+
+        Args:
+            segments: Array of shape (batch, segment_samples)
+
+        Returns:
+            Model outputs by name, each with the batch as first axis
+        """
+        batch = torch.as_tensor(segments, dtype=torch.float32, device=self.device)
+        with torch.no_grad():
+            return {
+                key: value.cpu().numpy() for key, value in self.model(batch).items()
+            }
+
+
+class FixedBatchRunner:
+    """Runs a network compiled for one batch shape, padding smaller batches."""
+
+    def __init__(self, run, batch_size: int):
+        """Initialize the runner.
+
+        Args:
+            run: Callable taking a float32 array of shape (batch_size, segment_samples)
+                and returning the outputs by name
+            batch_size: Batch size the network was compiled for
+        """
+        self.run = run
+        self.batch_size = batch_size
+
+    def __call__(self, segments: np.ndarray) -> dict:
+        count = len(segments)
+        batch = np.zeros((self.batch_size, segments.shape[1]), dtype=np.float32)
+        batch[:count] = segments
+        return {key: value[:count] for key, value in self.run(batch).items()}
+
+
+def _output_names(model: torch.nn.Module, example: torch.Tensor) -> list[str]:
+    """Names of the model outputs, in the order the model returns them."""
+    with torch.no_grad():
+        return list(model(example).keys())
+
+
+def _torchscript_runner(model, device, segment_samples, batch_size) -> FixedBatchRunner:
+    example = torch.zeros(batch_size, segment_samples, device=device)
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example, strict=False, check_trace=False)
+    traced = torch.jit.freeze(traced.eval())
+
+    def run(batch):
+        with torch.no_grad():
+            outputs = traced(torch.as_tensor(batch, device=device))
+        return {key: value.cpu().numpy() for key, value in outputs.items()}
+
+    return FixedBatchRunner(run, batch_size)
+
+
+def _onnx_runner(model, device, segment_samples, batch_size) -> FixedBatchRunner:
+    try:
+        import onnxruntime
+
+        # torch.onnx.export writes the model with onnx
+        if importlib.util.find_spec("onnx") is None:
+            raise ImportError("No module named 'onnx'")
+    except ImportError:
+        raise RuntimeError(
+            "The onnx inference backend needs onnxruntime and onnx "
+            "(pip install onnxruntime onnx)"
+        )
+
+    example = torch.zeros(batch_size, segment_samples, device=device)
+    names = _output_names(model, example)
+    with tempfile.TemporaryDirectory(prefix="audio_pond_onnx-") as tmp_dir:
+        onnx_path = os.path.join(tmp_dir, "model.onnx")
+        with torch.no_grad():
+            torch.onnx.export(
+                model,
+                (example,),
+                onnx_path,
+                input_names=["audio"],
+                output_names=names,
+                opset_version=17,
+                # The TorchScript-based exporter, the default before torch 2.9; the
+                # dynamo one needs onnxscript
+                dynamo=False,
+            )
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = (
+            onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        )
+        options.intra_op_num_threads = torch.get_num_threads()
+        session = onnxruntime.InferenceSession(
+            onnx_path, options, providers=["CPUExecutionProvider"]
+        )
+
+    def run(batch):
+        return dict(zip(names, session.run(names, {"audio": batch})))
+
+    return FixedBatchRunner(run, batch_size)
+
+
+def build_runner(transcriptor, backend: str = "eager", batch_size: int = 1):
+    """Build a callable running the transcription network with the given backend.
+
+    'eager' runs the fp32 model as loaded. 'int8' applies dynamic int8 quantization
+    to the GRU and linear layers, which hold most of the weights. 'torchscript'
+    traces and freezes the network, and 'onnx' exports it to ONNX Runtime; both
+    are compiled for batches of batch_size segments. The compiled and quantized
+    variants are CPU only and trade a small loss of accuracy (see
+    benchmarks accuracy) for throughput.
+
+    Args:
+        transcriptor: Loaded PianoTranscription instance
+        backend: One of BACKENDS
+        batch_size: Number of segments per forward pass
+
+    Returns:
+        Callable mapping an array of shape (batch, segment_samples) to model outputs
+
+    Raises:
+        ValueError: If the backend is unknown
+        RuntimeError: If the backend cannot run here (GPU model, missing onnxruntime)
+    """
+    if backend not in BACKENDS:
+        raise ValueError(
+            f"Unknown inference backend {backend!r}; expected one of {BACKENDS}"
+        )
+
+    model = transcriptor.model.eval()
+    device = next(model.parameters()).device
+    if backend == "eager":
+        return EagerRunner(model, device)
+    if device.type != "cpu":
+        raise RuntimeError(f"The {backend} inference backend runs on CPU only")
+
+    logging.info(f"Building {backend} inference backend")
+    if backend == "int8":
+        quantized = torch.ao.quantization.quantize_dynamic(
+            copy.deepcopy(model), {torch.nn.GRU, torch.nn.Linear}, dtype=torch.qint8
+        )
+        return EagerRunner(quantized, device)
+    if backend == "torchscript":
+        return _torchscript_runner(
+            model, device, transcriptor.segment_samples, batch_size
+        )
+    return _onnx_runner(model, device, transcriptor.segment_samples, batch_size)
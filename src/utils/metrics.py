@@ -0,0 +1,332 @@
+"""Per-stage pipeline instrumentation for Audio Pond."""
+
+import cProfile
+import contextvars
+import json
+import logging
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Callable, Optional
+
+# Metrics of the pipeline run in progress in the current context, if any, and its
+# running stages, innermost last. Concurrent runs in one process (e.g. the jobs of
+# the server) each report to their own metrics.
+_active = contextvars.ContextVar("pipeline_metrics", default=None)
+_stack = contextvars.ContextVar("pipeline_stages", default=())
+
+
+def _read_proc_io() -> dict:
+    """I/O counters of this process and its reaped children (Linux only, else empty)."""
+    counters = {}
+    try:
+        with open("/proc/self/io", "r") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                counters[name.strip()] = int(value)
+    except (OSError, ValueError):
+        pass
+    return counters
+
+
+def _reset_peak_rss() -> bool:
+    """Reset the kernel's peak RSS (VmHWM) of this process; False if unsupported."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_bytes() -> int:
+    """Peak RSS of this process since the last reset, or since it started."""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class StageMetrics:
+    """Measurements of one pipeline stage."""
+
+    def __init__(self, name: str):
+        """Initialize the stage metrics.
+
+        Args:
+            name: Stage name; nested stages are named parent.child
+        """
+        self.name = name
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.child_cpu_seconds = 0.0
+        self.peak_rss_bytes = 0
+        self.io = {}
+        self.counts = {}
+        self.subprocesses = []
+
+    def count(self, name: str, value: float = 1) -> None:
+        """Add to an event count of this stage (e.g. notes transcribed)."""
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def to_dict(self, memory_budget_bytes: Optional[int] = None) -> dict:
+        data = {
+            "name": self.name,
+            "wall_seconds": round(self.wall_seconds, 6),
+            "cpu_seconds": round(self.cpu_seconds, 6),
+            "child_cpu_seconds": round(self.child_cpu_seconds, 6),
+            "peak_rss_bytes": self.peak_rss_bytes,
+            "io": self.io,
+            "counts": self.counts,
+            "subprocesses": self.subprocesses,
+        }
+        if memory_budget_bytes:
+            data["peak_rss_budget_fraction"] = round(
+                self.peak_rss_bytes / memory_budget_bytes, 4
+            )
+        return data
+
+
+class PipelineMetrics:
+    """Collects wall/CPU time, peak RSS, I/O, event counts and subprocess durations per stage.
+
+    Stages are timed with the stage() context manager. Code that runs inside a
+    stage reports counts and subprocess durations through the module-level count()
+    and record_subprocess() functions, which do nothing unless a PipelineMetrics is
+    active, so processors need no metrics argument. The active metrics and running
+    stages are context variables: threads started inside a stage report to it only
+    when their target is wrapped with in_current_context().
+
+    I/O counters come from /proc/self/io (rchar/wchar for all reads and writes,
+    read_bytes/write_bytes for storage) and include subprocesses once they exit.
+    Peak RSS is per stage where the kernel allows resetting it, otherwise the
+    process peak so far. With a memory budget, every stage peak is also reported
+    as a fraction of the budget, next to the run's estimated footprint.
+    """
+
+    def __init__(
+        self,
+        profile_dir: Optional[Path] = None,
+        memory_budget_bytes: Optional[int] = None,
+    ):
+        """Initialize the pipeline metrics.
+
+        Args:
+            profile_dir: Write a cProfile file per stage (<stage>.prof) here, or None
+            memory_budget_bytes: Memory budget to report stage peaks against, or None
+        """
+        self.profile_dir = Path(profile_dir) if profile_dir else None
+        self.memory_budget_bytes = memory_budget_bytes
+        # Estimated footprint of the run (MemoryEstimate.to_dict()), if known
+        self.memory_estimate = None
+        self.stages = []
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._profiling = False
+
+    @contextmanager
+    def activate(self):
+        """Make this the metrics that module-level stage()/count() calls in this context report to."""
+        active_token = _active.set(self)
+        stack_token = _stack.set(())
+        try:
+            yield self
+        finally:
+            _stack.reset(stack_token)
+            _active.reset(active_token)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Measure a pipeline stage.
+
+        Args:
+            name: Stage name
+
+        Returns:
+            Context manager yielding the StageMetrics being recorded
+        """
+        stack = _stack.get()
+        parent = stack[-1] if stack else None
+        metrics = StageMetrics(f"{parent.name}.{name}" if parent else name)
+
+        if parent is not None:
+            # The parent's peak so far is lost when the peak is reset for this stage
+            parent.peak_rss_bytes = max(parent.peak_rss_bytes, _peak_rss_bytes())
+        _reset_peak_rss()
+
+        profiler = None
+        if self.profile_dir is not None and not self._profiling:
+            # cProfile cannot nest, so only the outermost stage is profiled
+            profiler = cProfile.Profile()
+            self._profiling = True
+
+        stack_token = _stack.set(stack + (metrics,))
+        io_before = _read_proc_io()
+        children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu_before = time.process_time()
+        wall_before = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield metrics
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                self._profiling = False
+                os.makedirs(self.profile_dir, exist_ok=True)
+                profiler.dump_stats(str(self.profile_dir / f"{metrics.name}.prof"))
+
+            metrics.wall_seconds = time.perf_counter() - wall_before
+            metrics.cpu_seconds = time.process_time() - cpu_before
+            children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+            metrics.child_cpu_seconds = (
+                children_after.ru_utime
+                + children_after.ru_stime
+                - children_before.ru_utime
+                - children_before.ru_stime
+            )
+            io_after = _read_proc_io()
+            metrics.io = {
+                name: io_after[name] - io_before[name]
+                for name in ("rchar", "wchar", "read_bytes", "write_bytes")
+                if name in io_after and name in io_before
+            }
+            metrics.peak_rss_bytes = max(metrics.peak_rss_bytes, _peak_rss_bytes())
+
+            _stack.reset(stack_token)
+            if parent is not None:
+                parent.peak_rss_bytes = max(
+                    parent.peak_rss_bytes, metrics.peak_rss_bytes
+                )
+            with self._lock:
+                self.stages.append(metrics)
+            logging.debug(
+                f"Stage {metrics.name}: {metrics.wall_seconds:.3f}s wall, "
+                f"{metrics.cpu_seconds:.3f}s CPU, "
+                f"{metrics.peak_rss_bytes / 1024**2:.0f} MB peak RSS"
+            )
+
+    def count(self, name: str, value: float = 1) -> None:
+        """Add to an event count of the innermost running stage."""
+        stack = _stack.get()
+        if stack:
+            with self._lock:
+                stack[-1].count(name, value)
+
+    def record_subprocess(
+        self, command: list[str], seconds: float, returncode: Optional[int] = None
+    ) -> None:
+        """Record a subprocess run by the innermost running stage."""
+        stack = _stack.get()
+        if stack:
+            with self._lock:
+                stack[-1].subprocesses.append(
+                    {
+                        "command": os.path.basename(str(command[0])) if command else "",
+                        "seconds": round(seconds, 6),
+                        "returncode": returncode,
+                    }
+                )
+
+    def to_dict(self) -> dict:
+        """All measurements, with stages in the order they finished."""
+        with self._lock:
+            stages = [stage.to_dict(self.memory_budget_bytes) for stage in self.stages]
+        data = {
+            "wall_seconds": round(time.perf_counter() - self._start, 6),
+            "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            "stages": stages,
+        }
+        if self.memory_budget_bytes:
+            data["memory_budget_bytes"] = self.memory_budget_bytes
+        if self.memory_estimate is not None:
+            data["memory_estimate"] = self.memory_estimate
+        return data
+
+    def warn_over_budget(self, label: str) -> list[StageMetrics]:
+        """Log the top-level stages whose peak RSS exceeded the memory budget.
+
+        Args:
+            label: What the run processed (e.g. its source), for the log message
+
+        Returns:
+            The stages over the budget
+        """
+        if not self.memory_budget_bytes:
+            return []
+        with self._lock:
+            over = [
+                stage
+                for stage in self.stages
+                if "." not in stage.name
+                and stage.peak_rss_bytes > self.memory_budget_bytes
+            ]
+        for stage in over:
+            logging.warning(
+                f"{label}: {stage.name} peaked at {stage.peak_rss_bytes / 1024**2:.0f} MB, "
+                f"over the {self.memory_budget_bytes / 1024**2:.0f} MB memory budget"
+            )
+        return over
+
+    def write_json(self, path: Path) -> None:
+        """Write all measurements to a JSON file."""
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+def stage(name: str):
+    """Measure a stage with the active metrics, if any.
+
+    Returns:
+        Context manager yielding the StageMetrics, or None when no metrics are active
+    """
+    active = _active.get()
+    return active.stage(name) if active is not None else nullcontext()
+
+
+def count(name: str, value: float = 1) -> None:
+    """Add to an event count of the running stage, if metrics are active."""
+    active = _active.get()
+    if active is not None:
+        active.count(name, value)
+
+
+def record_subprocess(
+    command: list[str], seconds: float, returncode: Optional[int] = None
+) -> None:
+    """Record a subprocess duration in the running stage, if metrics are active."""
+    active = _active.get()
+    if active is not None:
+        active.record_subprocess(command, seconds, returncode)
+
+
+def in_current_context(fn: Callable) -> Callable:
+    """Wrap fn so that, called from another thread, it reports to the caller's metrics and stage.
+
+    Each call runs in its own copy of the context fn was wrapped in, so the wrapper
+    can be called from several threads at once (e.g. by a thread pool).
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+
+    return run
+
+
+@contextmanager
+def timed_subprocess(command: list[str]):
+    """Record the duration of the subprocess run inside this block."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_subprocess(command, time.perf_counter() - start)
@@ -0,0 +1,187 @@
+"""Process-wide transcription model registry for Audio Pond."""
+
+import logging
+import threading
+from typing import Optional
+
+import numpy as np
+import torch
+from piano_transcription_inference import PianoTranscription, config
+from piano_transcription_inference.models import Note_pedal
+
+from src.utils.checkpoint_store import default_store, is_mappable
+from src.utils.inference_backends import build_runner
+
+# Loaded models keyed by (device, checkpoint_path)
+_models = {}
+# Inference runners keyed by (device, checkpoint_path, backend, batch_size)
+_runners = {}
+_lock = threading.Lock()
+
+
+class MappedPianoTranscription(PianoTranscription):
+    """PianoTranscription with its weights memory-mapped from the checkpoint file.
+
+    Unlike PianoTranscription itself, it never downloads the checkpoint. On the CPU
+    the weights stay backed by the file, so processes loading the same checkpoint
+    share one copy in the page cache instead of each holding a private one.
+    """
+
+    def __init__(
+        self,
+        checkpoint_path: str,
+        device: str = "cpu",
+        segment_samples: int = 16000 * 10,
+    ):
+        """Load the model.
+
+        Args:
+            checkpoint_path: Path to the model checkpoint
+            device: Torch device the model runs on ('cuda' | 'cpu')
+            segment_samples: Samples per model segment
+        """
+        # The attributes PianoTranscription.__init__ sets, which enframe, deframe
+        # and transcribe use
+        self.segment_samples = segment_samples
+        self.frames_per_second = config.frames_per_second
+        self.classes_num = config.classes_num
+        self.onset_threshold = 0.3
+        self.offset_threshod = 0.3
+        self.frame_threshold = 0.1
+        self.pedal_offset_threshold = 0.2
+
+        mmap = is_mappable(checkpoint_path)
+        if not mmap:
+            logging.warning(
+                f"Checkpoint {checkpoint_path} is in torch's legacy format and is loaded "
+                "into memory; seed it into the checkpoint store to memory-map it"
+            )
+        checkpoint = torch.load(checkpoint_path, map_location="cpu", mmap=mmap)
+
+        # Take the checkpoint's tensors as they are instead of copying them into the
+        # model's own. The model cannot be built on the meta device, since
+        # torchlibrosa assigns its STFT kernels as CPU data; its initial weights are
+        # freed once replaced.
+        model = Note_pedal(
+            frames_per_second=self.frames_per_second, classes_num=self.classes_num
+        )
+        # Note_pedal.load_state_dict takes one state dict per submodule and no assign
+        missing = []
+        for name in ("note_model", "pedal_model"):
+            result = getattr(model, name).load_state_dict(
+                checkpoint["model"][name], strict=False, assign=True
+            )
+            missing += [f"{name}.{key}" for key in result.missing_keys]
+        if missing:
+            raise RuntimeError(
+                f"Checkpoint {checkpoint_path} has no weights for {', '.join(missing)}"
+            )
+
+        if "cuda" in str(device):
+            model.to(device)
+            model = torch.nn.DataParallel(model)
+        self.model = model
+
+
+def get_model(device: str, checkpoint_path: Optional[str] = None) -> PianoTranscription:
+    """Return the transcription model for a device and checkpoint, loading it on first use.
+
+    Args:
+        device: Torch device the model runs on ('cuda' | 'cpu')
+        checkpoint_path: Path to the model checkpoint, or None for the default
+            checkpoint of the checkpoint store (see checkpoint_store.default_store)
+
+    Returns:
+        The shared PianoTranscription instance
+    """
+    key = (device, checkpoint_path)
+    with _lock:
+        transcriptor = _models.get(key)
+        if transcriptor is None:
+            path = checkpoint_path or default_store().resolve()
+            logging.info(f"Loading transcription model {path} on {device}")
+            transcriptor = MappedPianoTranscription(str(path), device=device)
+            _models[key] = transcriptor
+    return transcriptor
+
+
+def get_runner(
+    device: str,
+    checkpoint_path: Optional[str] = None,
+    backend: str = "eager",
+    batch_size: int = 1,
+):
+    """Return the inference runner of a model and backend, building it on first use.
+
+    Args:
+        device: Torch device the model runs on ('cuda' | 'cpu')
+        checkpoint_path: Path to the model checkpoint, or None for the checkpoint store's default
+        backend: Inference backend (see inference_backends.BACKENDS)
+        batch_size: Number of segments per forward pass
+
+    Returns:
+        Callable mapping an array of shape (batch, segment_samples) to model outputs
+    """
+    transcriptor = get_model(device, checkpoint_path)
+    # Only compiled backends depend on the batch size
+    compiled = backend in ("torchscript", "onnx")
+    key = (device, checkpoint_path, backend, batch_size if compiled else None)
+    with _lock:
+        runner = _runners.get(key)
+        if runner is None:
+            runner = build_runner(transcriptor, backend, batch_size)
+            _runners[key] = runner
+    return runner
+
+
+def warm_up(transcriptor: PianoTranscription, runner=None) -> None:
+    """Run a dummy forward pass so lazy CUDA/kernel initialization happens up front.
+
+    Args:
+        transcriptor: The model to warm up
+        runner: Inference runner to warm up instead of the eager model, if any
+    """
+    if runner is not None:
+        runner(np.zeros((1, transcriptor.segment_samples), dtype=np.float32))
+        return
+    model = transcriptor.model
+    device = next(model.parameters()).device
+    dummy = torch.zeros(1, transcriptor.segment_samples, device=device)
+    model.eval()
+    with torch.no_grad():
+        model(dummy)
+
+
+def preload(
+    device: str,
+    checkpoint_path: Optional[str] = None,
+    backend: str = "eager",
+    batch_size: int = 1,
+) -> PianoTranscription:
+    """Load and warm up a model so the first transcription only pays for inference.
+
+    Args:
+        device: Torch device the model runs on ('cuda' | 'cpu')
+        checkpoint_path: Path to the model checkpoint, or None for the checkpoint store's default
+        backend: Inference backend to build and warm up as well
+        batch_size: Number of segments per forward pass
+
+    Returns:
+        The shared PianoTranscription instance
+    """
+    key = (device, checkpoint_path)
+    with _lock:
+        loaded = key in _models
+    transcriptor = get_model(device, checkpoint_path)
+    if backend != "eager":
+        warm_up(transcriptor, get_runner(device, checkpoint_path, backend, batch_size))
+    elif not loaded:
+        warm_up(transcriptor)
+    return transcriptor
+
+
+def clear() -> None:
+    """Drop all loaded models and runners (mainly to release GPU memory)."""
+    with _lock:
+        _models.clear()
+        _runners.clear()
@@ -0,0 +1,62 @@
+"""Note-level accuracy metrics for comparing transcriptions."""
+
+from collections import defaultdict
+
+# Onset tolerance of the usual note-level transcription metric (mir_eval)
+ONSET_TOLERANCE = 0.05
+
+
+def _onsets_by_pitch(note_events: list) -> dict:
+    onsets = defaultdict(list)
+    for event in note_events:
+        onsets[event["midi_note"]].append(event["onset_time"])
+    for times in onsets.values():
+        times.sort()
+    return onsets
+
+
+def note_f1(
+    reference: list, estimate: list, onset_tolerance: float = ONSET_TOLERANCE
+) -> dict:
+    """Onset-only note precision, recall and F1 of a transcription against a reference.
+
+    A note matches a reference note of the same pitch whose onset is within the
+    tolerance; every note matches at most once. Matching sorted onsets greedily per
+    pitch finds the largest possible number of matches.
+
+    Args:
+        reference: Reference note events (dicts with 'onset_time' and 'midi_note')
+        estimate: Note events to evaluate
+        onset_tolerance: Largest onset difference of matching notes, in seconds
+
+    Returns:
+        Dict with precision, recall, f1 and the matched/reference/estimate note counts
+    """
+    reference_onsets = _onsets_by_pitch(reference)
+    estimate_onsets = _onsets_by_pitch(estimate)
+
+    matched = 0
+    for pitch, ref_times in reference_onsets.items():
+        est_times = estimate_onsets.get(pitch, [])
+        i = j = 0
+        while i < len(ref_times) and j < len(est_times):
+            if abs(ref_times[i] - est_times[j]) <= onset_tolerance:
+                matched += 1
+                i += 1
+                j += 1
+            elif ref_times[i] < est_times[j]:
+                i += 1
+            else:
+                j += 1
+
+    precision = matched / len(estimate) if estimate else float(not reference)
+    recall = matched / len(reference) if reference else float(not estimate)
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {
+        "precision": precision,
+        "recall": recall,
+        "f1": f1,
+        "matched": matched,
+        "reference": len(reference),
+        "estimate": len(estimate),
+    }
@@ -0,0 +1,156 @@
+"""Stitching of note events transcribed from overlapping audio windows."""
+
+from typing import Optional
+
+from src.utils.audio_io import AudioWindow
+
+# Maximum difference in seconds between two detections of the same onset
+ONSET_TOLERANCE = 0.1
+
+# Key of the sustain pedal in the per-window sounding times (notes use their pitch)
+PEDAL = "pedal"
+
+
+class NoteStitcher:
+    """Merges per-window note and pedal events into one event list.
+
+    Each window keeps the events that start inside its core region, so events in the
+    overlaps are not duplicated; an onset detected by two windows on opposite sides
+    of the boundary between their cores is kept once. An event that is still
+    sounding at the end of its window is left open and carried into the next window
+    by pitch: it is extended by the next window's detection of the same onset, or,
+    when the onset lies before that window, for as long as the window reports the
+    pitch (or pedal) sounding from its start. Notes and pedals held for longer than
+    the overlap between windows are therefore not cut off at window ends.
+    """
+
+    def __init__(self, onset_tolerance: float = ONSET_TOLERANCE):
+        """Initialize the stitcher.
+
+        Args:
+            onset_tolerance: Maximum difference in seconds between two detections of the same onset
+        """
+        self.onset_tolerance = onset_tolerance
+        self.note_events = []
+        self.pedal_events = []
+        # Events of the previous window still sounding at its end, and events it
+        # kept that start just before its core end, keyed by pitch or PEDAL
+        self._open = {}
+        self._boundary = {}
+
+    def add(
+        self,
+        window: AudioWindow,
+        note_events: list,
+        pedal_events: list,
+        sounding: Optional[dict] = None,
+    ) -> None:
+        """Add the events transcribed from one window.
+
+        Args:
+            window: The window the events were transcribed from
+            note_events: Note events with times relative to the window start
+            pedal_events: Pedal events with times relative to the window start
+            sounding: Seconds for which each pitch (and PEDAL) sounds without a
+                break from the start of the window, for those sounding at its start
+        """
+        tolerance = self.onset_tolerance
+        events = [(e["midi_note"], e, self.note_events) for e in note_events]
+        events += [(PEDAL, e, self.pedal_events) for e in pedal_events]
+        events.sort(key=lambda item: item[1]["onset_time"])
+
+        open_events = {}
+        boundary = {}
+        onsets = {}
+        for key, event, output in events:
+            event = self._shift(event, window.start)
+            onset = event["onset_time"]
+            onsets.setdefault(key, []).append(onset)
+
+            if onset >= window.core_end:
+                # Owned by the next window
+                continue
+
+            if onset < window.core_start + tolerance:
+                previous = self._open.get(key)
+                if previous is not None and (
+                    self._same_onset(previous, event)
+                    or onset <= window.start + tolerance
+                ):
+                    # Continuation of an event held at the end of the previous window
+                    del self._open[key]
+                    previous["offset_time"] = max(
+                        previous["offset_time"], event["offset_time"]
+                    )
+                    if self._reaches_end(event, window):
+                        open_events[key] = previous
+                    continue
+                if self._duplicate(key, event):
+                    continue
+                if onset < window.core_start - tolerance:
+                    # In the previous window's core, which did not detect it
+                    continue
+
+            output.append(event)
+            if onset >= window.core_end - tolerance:
+                boundary.setdefault(key, []).append(event)
+            if self._reaches_end(event, window):
+                open_events[key] = event
+
+        # Events held through the start of this window without a new detection
+        for key, previous in self._open.items():
+            held = (sounding or {}).get(key)
+            if held is None:
+                continue
+            offset = max(previous["offset_time"], window.start + held)
+            later = [
+                onset
+                for onset in onsets.get(key, [])
+                if onset > previous["onset_time"] + tolerance
+            ]
+            if later:
+                # The key is struck again, which ends the held event
+                offset = min(offset, later[0])
+            previous["offset_time"] = offset
+            if not later and self._reaches_end(previous, window):
+                open_events[key] = previous
+
+        self._open = open_events
+        self._boundary = boundary
+
+    def finish(self) -> tuple[list, list]:
+        """Return all stitched events sorted by onset.
+
+        Returns:
+            (note_events, pedal_events) with times on the timeline of the whole recording
+        """
+        self.note_events.sort(key=lambda e: (e["onset_time"], e["midi_note"]))
+        self.pedal_events.sort(key=lambda e: e["onset_time"])
+        return self.note_events, self.pedal_events
+
+    @staticmethod
+    def _shift(event: dict, offset: float) -> dict:
+        """Copy of an event moved onto the recording timeline."""
+        shifted = dict(event)
+        shifted["onset_time"] = event["onset_time"] + offset
+        shifted["offset_time"] = event["offset_time"] + offset
+        return shifted
+
+    def _same_onset(self, a: dict, b: dict) -> bool:
+        """Whether two events are detections of the same onset."""
+        return abs(a["onset_time"] - b["onset_time"]) <= self.onset_tolerance
+
+    def _duplicate(self, key, event: dict) -> bool:
+        """Whether the previous window kept the same onset, extending its event if so."""
+        for kept in self._boundary.get(key, []):
+            if self._same_onset(kept, event):
+                kept["offset_time"] = max(kept["offset_time"], event["offset_time"])
+                return True
+        return False
+
+    def _reaches_end(self, event: dict, window: AudioWindow) -> bool:
+        """Whether an event was cut off by the end of a (non-final) window."""
+        return (
+            not window.is_last
+            and event["offset_time"] >= window.end - self.onset_tolerance
+        )
@@ -0,0 +1,137 @@
+"""Content-addressed pipeline stage cache for Audio Pond."""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Optional, Union
+
+from src.utils.workspace import copy_atomic
+
+DEFAULT_MAX_BYTES = 2 * 1024**3
+
+_HASH_BLOCK_SIZE = 1024 * 1024
+
+
+class StageCache:
+    """On-disk cache of stage artifacts keyed by a hash of the stage inputs.
+
+    Each entry is a directory holding the files a stage produced. Entries are
+    written atomically, so several processes can share one cache directory, and
+    the least recently used entries are evicted once the cache exceeds its size cap.
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int = DEFAULT_MAX_BYTES):
+        """Initialize the stage cache.
+
+        Args:
+            cache_dir: Directory holding cache entries
+            max_bytes: Total size above which least recently used entries are evicted
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key(
+        self,
+        stage: str,
+        inputs: list[Union[Path, str]],
+        params: Optional[dict] = None,
+    ) -> str:
+        """Compute the cache key for a stage run.
+
+        Args:
+            stage: Stage name
+            inputs: Input files (hashed by content) or strings such as URLs (hashed as-is)
+            params: Configuration values the stage output depends on
+
+        Returns:
+            Hex digest identifying the stage run
+        """
+        digest = hashlib.sha256()
+        digest.update(stage.encode())
+        for item in inputs:
+            digest.update(b"\0")
+            if isinstance(item, Path):
+                with open(item, "rb") as f:
+                    while block := f.read(_HASH_BLOCK_SIZE):
+                        digest.update(block)
+            else:
+                digest.update(item.encode())
+        digest.update(b"\0")
+        digest.update(json.dumps(params or {}, sort_keys=True, default=str).encode())
+        return f"{stage}-{digest.hexdigest()}"
+
+    def fetch(self, key: str, dest_dir: Path) -> Optional[list[Path]]:
+        """Copy a cached entry's files into a directory.
+
+        Args:
+            key: Cache key from key()
+            dest_dir: Directory to restore the files into
+
+        Returns:
+            Paths of the restored files in the order they were stored, or None on a miss
+        """
+        entry_dir = self.cache_dir / key
+        try:
+            with open(entry_dir / "manifest.json", "r") as f:
+                names = json.load(f)
+            restored = []
+            for name in names:
+                dest_path = dest_dir / name
+                copy_atomic(entry_dir / name, dest_path)
+                restored.append(dest_path)
+            # Mark as recently used
+            os.utime(entry_dir)
+        except (OSError, ValueError):
+            return None
+        return restored
+
+    def store(self, key: str, paths: list[Path]) -> None:
+        """Add files produced by a stage run to the cache.
+
+        Args:
+            key: Cache key from key()
+            paths: Files the stage produced
+        """
+        entry_dir = self.cache_dir / key
+        if entry_dir.exists():
+            return
+
+        tmp_dir = Path(tempfile.mkdtemp(dir=self.cache_dir, prefix=".tmp-"))
+        try:
+            for path in paths:
+                shutil.copyfile(path, tmp_dir / path.name)
+            with open(tmp_dir / "manifest.json", "w") as f:
+                json.dump([path.name for path in paths], f)
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # Another process stored the same entry first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+
+        self.evict()
+
+    def evict(self) -> None:
+        """Remove least recently used entries until the cache fits its size cap."""
+        entries = []
+        total = 0
+        for entry_dir in self.cache_dir.iterdir():
+            if entry_dir.name.startswith(".") or not entry_dir.is_dir():
+                continue
+            try:
+                size = sum(f.stat().st_size for f in entry_dir.iterdir())
+                entries.append((entry_dir.stat().st_mtime, size, entry_dir))
+            except OSError:
+                continue
+            total += size
+
+        for _, size, entry_dir in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            logging.info(f"Evicting cache entry {entry_dir.name}")
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
@@ -0,0 +1,188 @@
+"""Job-scoped workspaces and atomic file writes for Audio Pond."""
+
+import errno
+import logging
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+# Directory under an output directory holding the workspaces of runs publishing there
+WORKSPACES_DIR = ".workspaces"
+
+# When a run's workspace (and the intermediates in it) is kept after the run
+RETENTION_POLICIES = ("never", "on_failure", "always")
+
+# Workspaces untouched for this long are assumed to be left over from crashed runs
+DEFAULT_MAX_AGE_SECONDS = 24 * 60 * 60
+
+# Link in an output directory to the run directory published there most recently
+LATEST_LINK = "latest"
+# Directory inside a workspace where the deliverables are gathered for publishing
+_STAGING_DIR = ".publish"
+
+
+@contextmanager
+def atomic_path(path: Path):
+    """Write a file under a temporary name that replaces path once the block succeeds.
+
+    The temporary file is created next to path with the same suffix (tools pick
+    the file format from it), so readers see either the old or the complete new
+    file, never a partial one.
+
+    Args:
+        path: Final path of the file
+
+    Returns:
+        Context manager yielding the temporary path to write to
+    """
+    path = Path(path)
+    fd, tmp_name = tempfile.mkstemp(
+        dir=path.parent, prefix=f".{path.stem}.", suffix=path.suffix
+    )
+    os.close(fd)
+    tmp_path = Path(tmp_name)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def copy_atomic(src: Path, dest: Path) -> None:
+    """Copy a file so that dest only ever holds the old or the complete new content."""
+    with atomic_path(dest) as tmp_path:
+        shutil.copyfile(src, tmp_path)
+
+
+def move_atomic(src: Path, dest: Path) -> None:
+    """Move a file into place atomically, copying first if it is on another filesystem."""
+    try:
+        os.replace(src, dest)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        copy_atomic(src, dest)
+        os.unlink(src)
+
+
+def sweep_workspaces(
+    output_dir: Path, max_age_seconds: float = DEFAULT_MAX_AGE_SECONDS
+) -> int:
+    """Remove workspaces under an output directory that have not changed for a while.
+
+    Args:
+        output_dir: Output directory whose workspaces are swept
+        max_age_seconds: Age after which an untouched workspace is removed
+
+    Returns:
+        Number of workspaces removed
+    """
+    root = Path(output_dir) / WORKSPACES_DIR
+    if not root.is_dir():
+        return 0
+
+    cutoff = time.time() - max_age_seconds
+    removed = 0
+    for path in root.iterdir():
+        try:
+            if not path.is_dir() or path.stat().st_mtime > cutoff:
+                continue
+        except OSError:
+            continue
+        logging.info(f"Removing stale workspace {path}")
+        shutil.rmtree(path, ignore_errors=True)
+        removed += 1
+    return removed
+
+
+class Workspace:
+    """A private directory one pipeline run writes its files to.
+
+    Runs that share an output directory each get their own workspace under
+    <output_dir>/.workspaces, so their intermediate files never collide. When
+    the run finishes, publish() moves the deliverables into a directory of their
+    own in the output directory, named like the workspace, with one atomic
+    rename, and the workspace with the remaining intermediates is removed
+    according to the retention policy.
+    """
+
+    def __init__(self, output_dir: Path, retention: str = "on_failure"):
+        """Create the workspace.
+
+        Args:
+            output_dir: Output directory the run publishes to
+            retention: When to keep the workspace after the run: 'never',
+                'on_failure' or 'always'
+        """
+        if retention not in RETENTION_POLICIES:
+            raise ValueError(
+                f"Unknown workspace retention {retention!r}; expected one of {RETENTION_POLICIES}"
+            )
+        self.output_dir = Path(output_dir)
+        self.retention = retention
+        root = self.output_dir / WORKSPACES_DIR
+        os.makedirs(root, exist_ok=True)
+        self.path = Path(
+            tempfile.mkdtemp(dir=root, prefix=time.strftime("%Y%m%d-%H%M%S-"))
+        )
+        # Directory the deliverables are published to
+        self.run_dir = self.output_dir / self.path.name
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.finish(success=exc_type is None)
+
+    def publish(self, paths: list[Path]) -> list[Path]:
+        """Move files or directories from the workspace into the run directory.
+
+        The deliverables are gathered in a staging directory inside the workspace,
+        which is then renamed to the run directory in one step, so readers see all
+        of a run's deliverables or none, and runs sharing the output directory
+        never overwrite each other's. The output directory's 'latest' link is then
+        switched to the run directory, also atomically.
+
+        Args:
+            paths: Files or directories inside the workspace
+
+        Returns:
+            Published paths, in the order given
+        """
+        staging = self.path / _STAGING_DIR
+        os.makedirs(staging)
+        published = []
+        for path in paths:
+            relative = Path(path).relative_to(self.path)
+            os.makedirs((staging / relative).parent, exist_ok=True)
+            os.rename(path, staging / relative)
+            published.append(self.run_dir / relative)
+
+        # The workspace is inside the output directory, so these are plain renames
+        os.rename(staging, self.run_dir)
+        link_tmp = self.output_dir / f".{LATEST_LINK}.{self.path.name}"
+        os.symlink(self.run_dir.name, link_tmp)
+        os.replace(link_tmp, self.output_dir / LATEST_LINK)
+        return published
+
+    def finish(self, success: bool) -> Optional[Path]:
+        """Remove the workspace unless the retention policy keeps it.
+
+        Args:
+            success: Whether the run succeeded
+
+        Returns:
+            Path of the kept workspace, or None if it was removed
+        """
+        if self.retention == "always" or (
+            self.retention == "on_failure" and not success
+        ):
+            logging.info(f"Kept workspace {self.path}")
+            return self.path
+        shutil.rmtree(self.path, ignore_errors=True)
+        return None
@@ -0,0 +1,67 @@
+"""Tests for decoding audio streamed over HTTP into transcription windows."""
+
+import shutil
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from benchmarks.stand_ins import serve_media
+from src.utils.audio_io import iter_ffmpeg_blocks, iter_windows
+
+SAMPLE_RATE = 16000
+SOURCE_RATE = 44100
+SECONDS = 2.5
+FREQUENCY = 440.0
+
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+
+
+@pytest.fixture
+def media_url(tmp_path):
+    """URL of a short stereo 44.1 kHz WAV tone served over local HTTP."""
+    t = np.arange(int(SECONDS * SOURCE_RATE)) / SOURCE_RATE
+    tone = 0.5 * np.sin(2 * np.pi * FREQUENCY * t)
+    sf.write(tmp_path / "tone.wav", np.stack([tone, tone], axis=1), SOURCE_RATE)
+    with serve_media(tmp_path) as base_url:
+        yield f"{base_url}/tone.wav"
+
+
+def test_streamed_blocks_are_resampled_mono(media_url):
+    blocks = list(iter_ffmpeg_blocks(media_url, SAMPLE_RATE, block_seconds=1.0))
+
+    assert [len(block) for block in blocks[:-1]] == [SAMPLE_RATE, SAMPLE_RATE]
+    audio = np.concatenate(blocks)
+    assert audio.dtype == np.float32
+    assert abs(len(audio) - SECONDS * SAMPLE_RATE) <= 16
+
+    # The tone keeps its pitch, so the samples really are at SAMPLE_RATE
+    spectrum = np.abs(np.fft.rfft(audio))
+    peak = np.argmax(spectrum) * SAMPLE_RATE / len(audio)
+    assert abs(peak - FREQUENCY) < 2
+
+
+def test_streamed_blocks_form_overlapping_windows(media_url):
+    audio = np.concatenate(
+        list(iter_ffmpeg_blocks(media_url, SAMPLE_RATE, block_seconds=0.3))
+    )
+    windows = list(
+        iter_windows(
+            iter_ffmpeg_blocks(media_url, SAMPLE_RATE, block_seconds=0.3),
+            SAMPLE_RATE,
+            chunk_seconds=1.0,
+            overlap_seconds=0.25,
+        )
+    )
+
+    assert [w.core_start for w in windows] == [0.0, 1.0, 2.0]
+    assert [w.is_last for w in windows] == [False, False, True]
+    for window in windows:
+        assert window.sample_rate == SAMPLE_RATE
+        start = round(window.start * SAMPLE_RATE)
+        np.testing.assert_array_equal(
+            window.audio, audio[start : start + len(window.audio)]
+        )
+    assert windows[0].end == pytest.approx(1.25)
+    assert windows[1].start == pytest.approx(0.75)
+    assert windows[-1].end == pytest.approx(len(audio) / SAMPLE_RATE)
@@ -0,0 +1,46 @@
+"""Accuracy of the faster inference backends against fp32 eager inference."""
+
+import os
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("piano_transcription_inference")
+
+from benchmarks import generators
+from benchmarks.suite import backend_accuracy
+from src.utils.checkpoint_store import default_store
+
+# Lowest acceptable note-level F1 of each backend against the eager notes. The
+# exported backends run the same fp32 network, so they should barely differ.
+MIN_F1 = {"int8": 0.95, "torchscript": 0.99, "onnx": 0.99}
+
+CLIP_SECONDS = 30
+
+
+@pytest.fixture(scope="module")
+def checkpoint_path() -> str:
+    """The real model checkpoint; F1 on random weights would only compare noise."""
+    path = os.getenv("AUDIO_POND_TEST_CHECKPOINT") or default_store().path()
+    if not Path(path).exists():
+        pytest.skip("needs the model checkpoint (AUDIO_POND_TEST_CHECKPOINT)")
+    return str(path)
+
+
+@pytest.fixture(scope="module")
+def clip(tmp_path_factory) -> Path:
+    return generators.make_audio(
+        tmp_path_factory.mktemp("clip") / "clip.wav", CLIP_SECONDS
+    )
+
+
+@pytest.mark.parametrize("backend", sorted(MIN_F1))
+def test_backend_notes_match_eager(backend, checkpoint_path, clip):
+    if backend == "onnx":
+        pytest.importorskip("onnxruntime")
+
+    results = backend_accuracy(clip, checkpoint_path, [backend])
+
+    assert results["eager"]["notes"] > 0
+    assert results[backend]["f1"] >= MIN_F1[backend], results
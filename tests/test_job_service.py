@@ -0,0 +1,67 @@
+"""Tests for the sources the job service accepts."""
+
+import pytest
+
+from src.processors.job_service import JobService
+
+
+@pytest.fixture
+def service(tmp_path):
+    input_root = tmp_path / "in"
+    input_root.mkdir()
+    (input_root / "song.ly").write_text("{ c' }")
+    (tmp_path / "secret.mid").write_bytes(b"MThd")
+    (input_root / "link.mid").symlink_to(tmp_path / "secret.mid")
+    return JobService(tmp_path / "out", input_root=input_root, preload_model=False)
+
+
+def test_accepts_urls_and_files_under_the_input_root(service):
+    job = service.submit({"source": "song.ly"})
+    assert job.config.source == str(service.input_root / "song.ly")
+    assert job.config.ly_file
+
+    job = service.submit({"source": "https://www.youtube.com/watch?v=abc"})
+    assert job.config.source == "https://www.youtube.com/watch?v=abc"
+
+
+@pytest.mark.parametrize(
+    "entry",
+    [
+        {"source": "../secret.mid"},
+        {"source": "link.mid"},
+        {"source": "/etc/hostname", "audio_file": True},
+        {"source": "ytsearch:nocturne", "audio_file": False},
+    ],
+)
+def test_refuses_other_sources(service, entry):
+    with pytest.raises(ValueError):
+        service.submit(entry)
+
+
+def test_refuses_files_without_an_input_root(tmp_path):
+    service = JobService(tmp_path / "out", preload_model=False)
+    with pytest.raises(ValueError, match="does not accept local files"):
+        service.submit({"source": str(tmp_path / "song.mid")})
+
+
+def test_expiry_skips_jobs_still_finishing(service):
+    service.result_ttl_seconds = 0
+    job = service.submit({"source": "song.ly"})
+    # A worker that has set the status but not yet the finish time
+    job.status = "done"
+
+    service._forget_old_jobs()
+
+    assert service.get(job.id) is job
+
+
+def test_finished_jobs_have_a_finish_time(service):
+    service.result_ttl_seconds = 3600
+    job = service.submit({"source": "song.ly"})
+
+    service._run_job(job)
+    service._forget_old_jobs()
+
+    assert job.status == "failed"
+    assert job.finished_at is not None
+    assert service.get(job.id) is job
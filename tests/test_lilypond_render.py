@@ -0,0 +1,83 @@
+"""Tests for batched LilyPond renders that fail for some of their files."""
+
+import stat
+import sys
+from pathlib import Path
+
+from src.processors.lilypond_converter import LilypondConverter, lilypond_version
+from src.utils.stage_cache import StageCache
+
+# Writes a PDF for every input like LilyPond does, but reports an error in the
+# inputs containing "bad" and exits with status 1
+_LILYPOND = """\
+#!{python}
+import os
+import sys
+
+args = sys.argv[1:]
+if args == ["--version"]:
+    print("GNU LilyPond 0.0.0 (test stand-in)")
+    sys.exit(0)
+output = args[args.index("-o") + 1]
+failed = []
+for path in args:
+    if not path.endswith(".ly"):
+        continue
+    stem = os.path.splitext(os.path.basename(path))[0]
+    with open(os.path.join(output, stem + ".pdf"), "wb") as f:
+        f.write(b"%PDF-1.4")
+    if "bad" in open(path).read():
+        print(f"{{path}}:1:1: error: unknown escaped string: `\\\\bad'", file=sys.stderr)
+        failed.append(f'"{{path}}"')
+if failed:
+    print("fatal error: failed files: " + " ".join(failed), file=sys.stderr)
+    sys.exit(1)
+"""
+
+
+def _install_lilypond(bin_dir: Path, monkeypatch) -> None:
+    bin_dir.mkdir()
+    path = bin_dir / "lilypond"
+    path.write_text(_LILYPOND.format(python=sys.executable))
+    path.chmod(path.stat().st_mode | stat.S_IXUSR)
+    monkeypatch.setenv("PATH", f"{bin_dir}:{Path(sys.executable).parent}")
+    lilypond_version.cache_clear()
+
+
+def test_render_many_fails_only_the_job_with_errors(tmp_path, monkeypatch):
+    _install_lilypond(tmp_path / "bin", monkeypatch)
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    jobs = []
+    for name, music in [("good", "{ c' }"), ("bad", "{ \\bad }"), ("fine", "{ d' }")]:
+        ly_path = tmp_path / f"{name}.ly"
+        ly_path.write_text(music)
+        jobs.append((ly_path, output_dir / name))
+
+    converter = LilypondConverter(output_dir, cache=StageCache(tmp_path / "cache"))
+    results = converter.render_many(jobs)
+
+    assert results[0] == output_dir / "good.pdf"
+    assert results[2] == output_dir / "fine.pdf"
+    assert isinstance(results[1], RuntimeError)
+    assert "unknown escaped string" in str(results[1])
+    assert not (output_dir / "bad.pdf").exists()
+
+    # The failed render was not cached: rendering again still fails
+    results = converter.render_many(jobs[1:2])
+    assert isinstance(results[0], RuntimeError)
+
+
+def test_render_many_reports_missing_lilypond_per_job(tmp_path, monkeypatch):
+    monkeypatch.setenv("PATH", str(tmp_path / "empty"))
+    lilypond_version.cache_clear()
+    ly_path = tmp_path / "score.ly"
+    ly_path.write_text("{ c' }")
+
+    converter = LilypondConverter(tmp_path, cache=StageCache(tmp_path / "cache"))
+    results = converter.render_many(
+        [(ly_path, tmp_path / "a"), (ly_path, tmp_path / "b")]
+    )
+
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert "LilyPond not found" in str(results[0])
@@ -0,0 +1,52 @@
+"""Tests for pipeline metrics collected by concurrent runs in one process."""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from src.utils import metrics
+from src.utils.metrics import PipelineMetrics
+
+
+def _run(
+    pipeline_metrics: PipelineMetrics, name: str, barrier: threading.Barrier
+) -> None:
+    with pipeline_metrics.activate(), metrics.stage(name):
+        # Both runs are inside their stage before either reports
+        barrier.wait()
+        with metrics.stage("inner"):
+            metrics.count("events", 2)
+            barrier.wait()
+
+
+def test_concurrent_runs_report_to_their_own_metrics():
+    barrier = threading.Barrier(2)
+    runs = {"a": PipelineMetrics(), "b": PipelineMetrics()}
+    threads = [
+        threading.Thread(target=_run, args=(pipeline_metrics, name, barrier))
+        for name, pipeline_metrics in runs.items()
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for name, pipeline_metrics in runs.items():
+        stages = {stage.name: stage for stage in pipeline_metrics.stages}
+        assert sorted(stages) == [name, f"{name}.inner"]
+        assert stages[f"{name}.inner"].counts == {"events": 2}
+
+
+def test_worker_threads_report_to_the_calling_stage():
+    pipeline_metrics = PipelineMetrics()
+    with pipeline_metrics.activate(), metrics.stage("render"):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(
+                executor.map(
+                    metrics.in_current_context(metrics.count), ["rendered"] * 8
+                )
+            )
+        # Without the wrapper, the pool threads have no active metrics
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(metrics.count, ["unreported"] * 8))
+
+    assert [stage.counts for stage in pipeline_metrics.stages] == [{"rendered": 8}]
@@ -0,0 +1,44 @@
+"""Tests for the lifetime of the warm MidiToLily wine environment."""
+
+import stat
+import sys
+from pathlib import Path
+
+from src.processors.midi2lily_runner import WINESERVER_LINGER, MidiToLilyRunner
+
+# Records its arguments, one call per line
+_LOGGER = """\
+#!{python}
+import sys
+with open({log!r}, "a") as f:
+    f.write(" ".join(sys.argv) + "\\n")
+"""
+
+
+def _install(bin_dir: Path, log: Path, monkeypatch) -> None:
+    bin_dir.mkdir()
+    for name in ("wineserver", "wine64"):
+        path = bin_dir / name
+        path.write_text(_LOGGER.format(python=sys.executable, log=str(log)))
+        path.chmod(path.stat().st_mode | stat.S_IXUSR)
+    monkeypatch.setenv("PATH", f"{bin_dir}:{Path(sys.executable).parent}")
+
+
+def test_close_leaves_the_shared_wineserver_running(tmp_path, monkeypatch):
+    log = tmp_path / "calls.log"
+    _install(tmp_path / "bin", log, monkeypatch)
+    runner = MidiToLilyRunner(["wine64", "MidiToLily.exe"])
+
+    runner.run(["a.mid"])
+    runner.run(["b.mid"])
+    runner.close()
+
+    calls = [line.split()[1:] for line in log.read_text().splitlines()]
+    # Started once and never killed: other processes may share the prefix
+    assert calls.count([f"-p{WINESERVER_LINGER}"]) == 1
+    assert not any("-k" in call for call in calls)
+    assert [call for call in calls if call[:1] == ["MidiToLily.exe"]] == [
+        ["MidiToLily.exe"],
+        ["MidiToLily.exe", "a.mid"],
+        ["MidiToLily.exe", "b.mid"],
+    ]
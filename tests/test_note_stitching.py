@@ -0,0 +1,87 @@
+"""Tests for stitching note events across overlapping transcription windows."""
+
+import numpy as np
+
+from src.utils.audio_io import AudioWindow
+from src.utils.note_stitching import PEDAL, NoteStitcher
+
+SAMPLE_RATE = 100
+
+
+def _window(core_start: float, last: bool = False) -> AudioWindow:
+    """Window owning [core_start, core_start + 10) with 5 seconds of context."""
+    start = max(0.0, core_start - 5)
+    end = core_start + 10 + (0 if last else 5)
+    return AudioWindow(
+        audio=np.zeros(int((end - start) * SAMPLE_RATE), dtype=np.float32),
+        start=start,
+        core_start=core_start,
+        core_end=core_start + 10,
+        is_last=last,
+        sample_rate=SAMPLE_RATE,
+    )
+
+
+def _note(pitch: int, onset: float, offset: float, window: AudioWindow) -> dict:
+    """Note event with recording times, made relative to the window start."""
+    return {
+        "midi_note": pitch,
+        "onset_time": onset - window.start,
+        "offset_time": offset - window.start,
+        "velocity": 64,
+    }
+
+
+def _notes(stitcher: NoteStitcher) -> list[tuple]:
+    note_events, _ = stitcher.finish()
+    return [
+        (e["midi_note"], round(e["onset_time"], 2), round(e["offset_time"], 2))
+        for e in note_events
+    ]
+
+
+def test_note_held_across_windows_is_extended():
+    windows = [_window(0), _window(10), _window(20, last=True)]
+    stitcher = NoteStitcher()
+    stitcher.add(windows[0], [_note(60, 2, 15, windows[0])], [])
+    # The onset lies before the later windows, which only report the note sounding
+    stitcher.add(windows[1], [], [], {60: 20.0})
+    stitcher.add(windows[2], [], [], {60: 17.0})
+
+    assert _notes(stitcher) == [(60, 2, 32)]
+
+
+def test_held_note_ends_at_the_next_attack():
+    windows = [_window(0), _window(10, last=True)]
+    stitcher = NoteStitcher()
+    stitcher.add(windows[0], [_note(67, 3, 15, windows[0])], [])
+    stitcher.add(windows[1], [_note(67, 12, 13, windows[1])], [], {67: 10.0})
+
+    assert _notes(stitcher) == [(67, 3, 12), (67, 12, 13)]
+
+
+def test_onset_detected_on_both_sides_of_the_boundary_is_kept_once():
+    windows = [_window(0), _window(10, last=True)]
+    stitcher = NoteStitcher()
+    stitcher.add(
+        windows[0],
+        [_note(62, 9.97, 11, windows[0]), _note(64, 10.03, 11, windows[0])],
+        [],
+    )
+    stitcher.add(
+        windows[1],
+        [_note(62, 10.03, 11.5, windows[1]), _note(64, 9.97, 11, windows[1])],
+        [],
+    )
+
+    assert _notes(stitcher) == [(62, 9.97, 11.5), (64, 9.97, 11)]
+
+
+def test_pedal_held_across_windows_is_extended():
+    windows = [_window(0), _window(10, last=True)]
+    stitcher = NoteStitcher()
+    stitcher.add(windows[0], [], [{"onset_time": 1, "offset_time": 15}])
+    stitcher.add(windows[1], [], [], {PEDAL: 12.0})
+
+    _, pedal_events = stitcher.finish()
+    assert [(e["onset_time"], e["offset_time"]) for e in pedal_events] == [(1, 17)]
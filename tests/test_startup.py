@@ -0,0 +1,60 @@
+"""Entry modes that skip transcription must not import its heavy dependencies."""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks import generators, stand_ins
+
+# Modules only the download, audio preparation and transcription stages need
+HEAVY_MODULES = (
+    "torch",
+    "piano_transcription_inference",
+    "soxr",
+    "librosa",
+    "yt_dlp",
+    "pydub",
+)
+
+# Runs the entry point end to end, through AudioProcessor.run, then reports
+# which of the heavy modules got imported along the way
+_CODE = """\
+import sys
+from src.audio_pond import main
+main.main({args!r}, standalone_mode=False)
+print("imported=" + ",".join(m for m in {modules!r} if m in sys.modules))
+"""
+
+MODES = {
+    "ly_file": ("input.ly", "--ly-file", generators.make_lilypond, 8),
+    "midi_file": ("input.mid", "--midi-file", generators.make_midi, 10),
+}
+
+
+@pytest.mark.parametrize("mode", sorted(MODES))
+def test_entry_mode_skips_transcription_imports(mode, tmp_path):
+    name, flag, make_input, size = MODES[mode]
+    source = make_input(tmp_path / name, size)
+    output_dir = tmp_path / "out"
+    args = [str(source), flag, "--output-dir", str(output_dir)]
+    code = _CODE.format(args=args, modules=HEAVY_MODULES)
+    env = {**os.environ, **stand_ins.install(tmp_path / "bin")}
+
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=stand_ins.REPO_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert list(output_dir.rglob("*.pdf")), f"{mode} rendered no sheet music"
+    imported = next(
+        line.split("=", 1)[1]
+        for line in result.stdout.splitlines()
+        if line.startswith("imported=")
+    )
+    assert imported == "", f"{mode} imported {imported}"
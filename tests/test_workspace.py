@@ -0,0 +1,36 @@
+"""Tests for publishing the deliverables of runs that share an output directory."""
+
+from src.utils.workspace import LATEST_LINK, WORKSPACES_DIR, Workspace
+
+
+def _run(output_dir, content: str) -> Workspace:
+    workspace = Workspace(output_dir, retention="never")
+    (workspace.path / "4_sheet_music.pdf").write_text(content)
+    (workspace.path / "3_lilypond.ly").write_text(content)
+    (workspace.path / "1_audio.wav").write_text("intermediate")
+    return workspace
+
+
+def test_runs_publish_to_their_own_directories(tmp_path):
+    first = _run(tmp_path, "first")
+    second = _run(tmp_path, "second")
+    deliverables = ["3_lilypond.ly", "4_sheet_music.pdf"]
+
+    with second:
+        published = second.publish([second.path / name for name in deliverables])
+    with first:
+        first.publish([first.path / name for name in deliverables])
+
+    assert published == [second.run_dir / name for name in deliverables]
+    for workspace, content in [(first, "first"), (second, "second")]:
+        assert sorted(p.name for p in workspace.run_dir.iterdir()) == deliverables
+        assert all(
+            (workspace.run_dir / name).read_text() == content for name in deliverables
+        )
+
+    # The last run to publish is the latest; workspaces are removed
+    assert (tmp_path / LATEST_LINK).resolve() == first.run_dir
+    assert list((tmp_path / WORKSPACES_DIR).iterdir()) == []
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(
+        [WORKSPACES_DIR, LATEST_LINK, first.run_dir.name, second.run_dir.name]
+    )